@@ -1,3 +1,5 @@
+import asyncio
+import json
 import sys
 from pathlib import Path
 
@@ -5,34 +7,41 @@ from pathlib import Path
 BASE_DIR = Path(__file__).resolve().parent.parent
 sys.path.insert(0, str(BASE_DIR))
 
-from fastapi import FastAPI, Request, UploadFile, File, Form, Depends, HTTPException
+from fastapi import FastAPI, Request, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import RedirectResponse, FileResponse, StreamingResponse
 from backend.middleware.auth import require_auth, require_admin
 from backend.middleware.rate_limit import limiter, rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
-from backend.services.document import extract_text_from_file, check_text_size, create_word_document
-from backend.services.llm import analyze_contract
-from backend.services.queue import request_queue
+from backend.services.document import create_word_document, shutdown_pdf_pool
+from backend.services.ocr import shutdown_ocr_pool
+from backend.services.sandbox import extraction_sandbox
+from backend.services.executors import run_cpu, run_io, get_executor_stats, shutdown_executors
+from backend.services.llm import stream_meeting_protocol, LLMStreamError
+from backend.services.analysis import receive_contract_upload, extract_contract_text, join_analysis, analysis_job_events
+from backend.services.jobs import job_manager
+from backend.services.disconnect import ClientDisconnected, iterate_until_disconnected, run_until_disconnected, record_disconnect
+from backend.services.queue import request_queue, transcription_queue, get_priority
 from backend.models.schemas import AnalyzeResponse, ExportRequest
 from backend.services.logger import log_user_action, log_error
-from backend.services.settings import get_max_file_size_bytes
 from backend.services.users import get_all_users, create_user, update_user, delete_user
 from backend.models.schemas import UserCreate, UserUpdate
 from backend.services.prompts import get_all_prompts, save_prompt, reset_prompt
+from backend.services.prompts import FULL_ANALYSIS_TYPE, get_analysis_parts, combine_analysis_results
 from backend.models.schemas import PromptSaveRequest, PromptResetRequest
 from backend.services.llm_config import get_llm_config, update_llm_config
 from backend.models.schemas import LLMConfigUpdate
 from backend.services.settings import get_settings, update_settings
 from backend.services.tokens import get_tokens_stats, format_stats_for_display
 from backend.services.logger import get_logs
+from backend.services.cache import extraction_cache
+from backend.services.result_cache import result_cache
+from backend.services.single_flight import analysis_flights
 from backend.models.schemas import SettingsUpdate
-import tempfile
 from pathlib import Path
-from backend.services.transcription import validate_audio_file, transcribe_audio
-from backend.services.llm import generate_meeting_protocol
-from backend.services.settings import get_max_audio_file_size_bytes
+from backend.services.transcription import receive_audio_upload, transcribe_in_queue, transcription_job_events
+from backend.services.llm import generate_meeting_protocol, reset_llm_clients, close_llm_clients
 from backend.models.schemas import TranscribeResponse
 
 # Создание приложения
@@ -62,6 +71,29 @@ FRONTEND_DIR = BASE_DIR / "frontend"
 # Статические файлы (frontend)
 app.mount("/static", StaticFiles(directory=str(FRONTEND_DIR)), name="static")
 
+@app.on_event("startup")
+async def start_workers():
+    """
+    Заранее запустить процессы разбора документов.
+    """
+    settings = await run_io(get_settings)
+    if settings.get("extraction_sandbox_enabled", True):
+        await run_io(extraction_sandbox.start)
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    """
+    Остановить фоновые пулы и закрыть соединения с LLM при завершении сервера.
+    """
+    extraction_sandbox.shutdown()
+    shutdown_pdf_pool()
+    shutdown_ocr_pool()
+    shutdown_executors()
+    request_queue.shutdown()
+    transcription_queue.shutdown()
+    job_manager.shutdown()
+    await close_llm_clients()
+
 # ===== РОУТИНГ СТРАНИЦ =====
 
 @app.get("/")
@@ -110,6 +142,20 @@ async def api_status():
         "version": "1.0.0"
     }
 
+@app.get("/api/queue-status")
+async def queue_status(user: dict = Depends(require_auth)):
+    """
+    Текущая загрузка очередей: занято слотов, ожидает, лимиты.
+
+    queue - очередь анализа договоров, transcription_queue - очередь
+    транскрибации (у нее отдельные лимиты).
+    """
+    return {
+        "success": True,
+        "queue": await request_queue.get_status(user["username"]),
+        "transcription_queue": await transcription_queue.get_status(user["username"])
+    }
+
 # ===== АВТОРИЗАЦИЯ =====
 
 from backend.middleware.auth import get_client_ip
@@ -122,7 +168,7 @@ async def check_auth(request: Request):
     Проверить авторизацию по IP-адресу.
     """
     ip = get_client_ip(request)
-    user = get_user_by_ip(ip)
+    user = await run_io(get_user_by_ip, ip)
 
     if user:
         return AuthCheckResponse(
@@ -150,11 +196,11 @@ async def login(request: Request, credentials: LoginRequest):
     ip = get_client_ip(request)
 
     # Проверить учетные данные
-    user = verify_credentials(credentials.username, credentials.password)
+    user = await run_io(verify_credentials, credentials.username, credentials.password)
 
     if user:
         # Авторизовать IP
-        authorize_ip(ip, user["username"])
+        await run_io(authorize_ip, ip, user["username"])
 
         # Логировать успешный вход
         log_user_action(user["username"], "login", f"IP: {ip}")
@@ -180,11 +226,11 @@ async def logout(request: Request):
     ip = get_client_ip(request)
 
     # Получить пользователя перед удалением авторизации для логирования
-    user = get_user_by_ip(ip)
+    user = await run_io(get_user_by_ip, ip)
 
     if user:
         # Удалить авторизацию IP
-        success = remove_ip_authorization(ip)
+        success = await run_io(remove_ip_authorization, ip)
 
         if success:
             # Логировать выход
@@ -203,7 +249,7 @@ async def admin_get_users(user: dict = Depends(require_admin)):
     """
     Получить список всех пользователей (только для admin).
     """
-    users = get_all_users()
+    users = await run_io(get_all_users)
     return {"success": True, "users": users}
 
 @app.post("/api/admin/users")
@@ -214,7 +260,8 @@ async def admin_create_user(
     """
     Создать нового пользователя (только для admin).
     """
-    success = create_user(
+    success = await run_io(
+        create_user,
         username=user_data.username,
         password=user_data.password,
         role=user_data.role
@@ -242,7 +289,8 @@ async def admin_update_user(
     """
     Обновить данные пользователя (только для admin).
     """
-    success = update_user(
+    success = await run_io(
+        update_user,
         username=username,
         password=user_data.password,
         role=user_data.role
@@ -275,7 +323,7 @@ async def admin_delete_user(
             "error": "Невозможно удалить собственный аккаунт"
         }
 
-    success, message = delete_user(username)
+    success, message = await run_io(delete_user, username)
 
     if success:
         log_user_action(user["username"], "delete_user", f"Удален пользователь: {username}")
@@ -296,7 +344,7 @@ async def admin_get_prompts(user: dict = Depends(require_admin)):
     """
     Получить текущие промпты (только для admin).
     """
-    prompts = get_all_prompts()
+    prompts = await run_io(get_all_prompts)
     return {"success": True, "prompts": prompts}
 
 @app.post("/api/admin/prompts")
@@ -307,7 +355,7 @@ async def admin_save_prompt(
     """
     Сохранить отредактированный промпт (только для admin).
     """
-    success = save_prompt(data.prompt_type, data.content)
+    success = await run_io(save_prompt, data.prompt_type, data.content)
 
     if success:
         log_user_action(user["username"], "save_prompt", f"Тип: {data.prompt_type}")
@@ -323,7 +371,7 @@ async def admin_reset_prompt(
     """
     Сбросить промпт к исходному значению (только для admin).
     """
-    content = reset_prompt(data.prompt_type)
+    content = await run_io(reset_prompt, data.prompt_type)
 
     if content:
         log_user_action(user["username"], "reset_prompt", f"Тип: {data.prompt_type}")
@@ -337,110 +385,164 @@ async def admin_reset_prompt(
 
 # ===== АНАЛИЗ ДОКУМЕНТОВ =====
 
+def sse_event(event: str, data: dict) -> str:
+    """
+    Сформировать событие Server-Sent Events.
+
+    Args:
+        event: Тип события
+        data: Данные события (сериализуются в JSON)
+
+    Returns:
+        Текст события
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @app.post("/api/analyze", response_model=AnalyzeResponse)
 @limiter.limit("10/minute")  # Rate limiting: 10 запросов в минуту
 async def analyze_document(
     request: Request,
-    file: UploadFile = File(...),
-    analysis_type: str = Form(...),
     user: dict = Depends(require_auth)
 ):
     """
     Анализировать загруженный договор.
 
+    Форма multipart: file - договор, analysis_type - тип анализа.
+    Файл принимается потоково (см. receive_contract_upload).
+
     Включает:
     - Rate Limiting: 10 запросов в минуту
     - Очередь: до 5 одновременных обработок + 5 в очереди
+      (слот занимается после извлечения текста, только под анализ)
+    - Одинаковые одновременные запросы (тот же текст, тип анализа,
+      промпт и модель) выполняются одним обращением к LLM
+    - analysis_type="full": выжимка и проверка параллельно по одному
+      извлечению текста, результаты по частям - в results
+    - Отключение клиента отменяет анализ и освобождает слот очереди
+      (если этот же анализ не ждут другие клиенты)
     """
     username = user["username"]
 
-    # ===== ПРОВЕРКА ОЧЕРЕДИ =====
-    queue_result = await request_queue.acquire()
+    upload, error = await receive_contract_upload(request, username)
+    if error:
+        return AnalyzeResponse(success=False, error=error)
+    analysis_type = upload.fields["analysis_type"]
+    filename = upload.filename
 
-    if not queue_result["allowed"]:
-        # Очередь переполнена
-        return AnalyzeResponse(
-            success=False,
-            error=queue_result.get("error", "Система перегружена. Попробуйте позже.")
-        )
-
-    if queue_result.get("queued"):
-        # Запрос в очереди - ждем слот
-        await request_queue.wait_for_slot()
+    text, error = await extract_contract_text(upload.path, upload.sha256, filename, analysis_type, username)
+    if error:
+        return AnalyzeResponse(success=False, error=error)
 
     try:
-        # ===== ВАЛИДАЦИЯ ФАЙЛА =====
+        flight, error = await join_analysis(text, analysis_type, username, stream=False, priority=get_priority(user))
+        if error:
+            return AnalyzeResponse(success=False, error=error)
 
-        # Проверка расширения файла
-        file_extension = Path(file.filename).suffix.lower()
-        if file_extension not in [".doc", ".docx", ".pdf"]:
-            return AnalyzeResponse(
-                success=False,
-                error="Неподдерживаемый формат файла. Допустимы: .doc, .docx, .pdf"
-            )
+        results = {part: "" for part in get_analysis_parts(analysis_type)}
+        async for kind, payload, part in iterate_until_disconnected(request, flight.events()):
+            if kind == "delta":
+                results[part] += payload
+
+        # Логировать успешный анализ
+        log_user_action(username, "analyze", f"{filename} ({analysis_type})")
 
-        # Проверка размера файла
-        max_size = get_max_file_size_bytes()
-        file_content = await file.read()
-        if len(file_content) > max_size:
-            max_size_mb = max_size // (1024 * 1024)
+        if analysis_type == FULL_ANALYSIS_TYPE:
             return AnalyzeResponse(
-                success=False,
-                error=f"Размер файла превышает допустимый лимит ({max_size_mb} МБ)."
+                success=True,
+                analysis_type=analysis_type,
+                result=combine_analysis_results(results),
+                results=results,
+                filename=filename
             )
 
-        # ===== ОБРАБОТКА ФАЙЛА =====
-
-        # Сохранить во временный файл
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as tmp_file:
-            tmp_file.write(file_content)
-            tmp_path = Path(tmp_file.name)
-
-        try:
-            # Извлечь текст
-            text, error = extract_text_from_file(tmp_path, file_extension)
+        return AnalyzeResponse(
+            success=True,
+            analysis_type=analysis_type,
+            result=results[analysis_type],
+            filename=filename
+        )
 
-            if error:
-                log_error(username, "document_extract", error)
-                return AnalyzeResponse(success=False, error=error)
+    except ClientDisconnected:
+        record_disconnect(username, "analyze", f"{filename} ({analysis_type})")
+        return AnalyzeResponse(success=False, error="Клиент отключился")
 
-            # Проверить размер текста
-            size_ok, size_error = check_text_size(text)
-            if not size_ok:
-                log_error(username, "document_size_check", size_error)
-                return AnalyzeResponse(success=False, error=size_error)
+    except LLMStreamError as e:
+        log_error(username, "llm_analyze", str(e))
+        return AnalyzeResponse(success=False, error=str(e))
 
-            # ===== АНАЛИЗ ЧЕРЕЗ LLM =====
+    except Exception as e:
+        error_msg = f"Произошла ошибка при обработке файла: {str(e)}"
+        log_error(username, "analyze_unexpected", error_msg)
+        return AnalyzeResponse(success=False, error=error_msg)
 
-            result, llm_error = await analyze_contract(text, analysis_type, username)
+@app.post("/api/analyze/stream")
+@limiter.limit("10/minute")
+async def analyze_document_stream(
+    request: Request,
+    user: dict = Depends(require_auth)
+):
+    """
+    Анализировать договор с потоковой выдачей результата (SSE).
 
-            if llm_error:
-                log_error(username, "llm_analyze", llm_error)
-                return AnalyzeResponse(success=False, error=llm_error)
+    Ошибки до начала анализа (формат, размер) возвращаются обычным JSON,
+    как у /api/analyze. Дальше идет поток событий:
+    - status: {"message"} - этап обработки
+    - delta: {"text", "part"} - очередной фрагмент результата части
+      (part - тип анализа; у "full" фрагменты частей идут вперемешку)
+    - done: {"analysis_type", "filename"} - анализ завершен
+    - error: {"error"} - ошибка во время анализа (в т.ч. переполнение очереди)
 
-            # Логировать успешный анализ
-            log_user_action(username, "analyze", f"{file.filename} ({analysis_type})")
+    Закрытие соединения отменяет анализ (если его не ждут другие клиенты).
+    """
+    username = user["username"]
 
-            return AnalyzeResponse(
-                success=True,
-                analysis_type=analysis_type,
-                result=result,
-                filename=file.filename
-            )
+    upload, error = await receive_contract_upload(request, username)
+    if error:
+        return AnalyzeResponse(success=False, error=error)
+    analysis_type = upload.fields["analysis_type"]
+    filename = upload.filename
 
-        finally:
-            # Удалить временный файл
-            if tmp_path.exists():
-                tmp_path.unlink()
+    text, error = await extract_contract_text(upload.path, upload.sha256, filename, analysis_type, username)
+    if error:
+        return AnalyzeResponse(success=False, error=error)
 
-    except Exception as e:
-        error_msg = f"Произошла ошибка при обработке файла: {str(e)}"
-        log_error(username, "analyze_unexpected", error_msg)
-        return AnalyzeResponse(success=False, error=error_msg)
+    flight, error = await join_analysis(text, analysis_type, username, stream=True, priority=get_priority(user))
+    if error:
+        return AnalyzeResponse(success=False, error=error)
 
-    finally:
-        # ===== ОСВОБОЖДЕНИЕ СЛОТА В ОЧЕРЕДИ =====
-        await request_queue.release()
+    async def event_stream():
+        try:
+            async for kind, payload, part in iterate_until_disconnected(request, flight.events()):
+                if kind == "delta":
+                    yield sse_event("delta", {"text": payload, "part": part})
+                elif kind == "status":
+                    yield sse_event("status", {"message": payload})
+
+            log_user_action(username, "analyze", f"{filename} ({analysis_type}, поток)")
+            yield sse_event("done", {"analysis_type": analysis_type, "filename": filename})
+
+        except (ClientDisconnected, asyncio.CancelledError) as e:
+            # Обрыв соединения замечает и сам StreamingResponse - тогда
+            # поток отменяется, а не завершается с ClientDisconnected
+            record_disconnect(username, "analyze", f"{filename} ({analysis_type}, поток)")
+            if isinstance(e, asyncio.CancelledError):
+                raise
+
+        except LLMStreamError as e:
+            log_error(username, "llm_analyze", str(e))
+            yield sse_event("error", {"error": str(e)})
+
+        except Exception as e:
+            error_msg = f"Произошла ошибка при обработке файла: {str(e)}"
+            log_error(username, "analyze_unexpected", error_msg)
+            yield sse_event("error", {"error": error_msg})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Не буферизовать поток в прокси (nginx)
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # ===== ТРАНСКРИБАЦИЯ АУДИО =====
 
@@ -448,46 +550,42 @@ async def analyze_document(
 @limiter.limit("2/minute")
 async def transcribe_audio_endpoint(
     request: Request,
-    audio_file: UploadFile = File(...),
     user: dict = Depends(require_auth)
 ):
     """
     Транскрибировать аудиофайл и сгенерировать протокол.
+
+    Транскрибация ждет слот в очереди транскрибации (отдельной от очереди
+    анализа). Отключение клиента останавливает ожидание, процесс
+    транскрибации или генерацию протокола.
     """
     username = user["username"]
     
-    # Получить максимальный размер
-    from backend.services.settings import get_settings
-    settings = get_settings()
-    max_size_mb = settings.get("max_audio_file_size_mb", 100)
-    
-    # Читаем содержимое файла
-    file_content = await audio_file.read()
-    file_size = len(file_content)
-    
-    # Валидация файла
-    is_valid, error = validate_audio_file(audio_file.filename, file_size, max_size_mb)
-    if not is_valid:
-        log_error(username, "audio_validation", error)
-        return TranscribeResponse(success=False, error=error)
-    
-    # Сохраняем во временный файл
-    file_extension = Path(audio_file.filename).suffix.lower()
-    
-    with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as tmp_file:
-        tmp_file.write(file_content)
-        tmp_path = Path(tmp_file.name)
+    # Принимаем файл во временный файл по частям с проверкой формата и размера
+    upload, upload_error = await receive_audio_upload(request)
+    if upload_error:
+        log_error(username, "audio_validation", upload_error)
+        return TranscribeResponse(success=False, error=upload_error)
+    tmp_path = upload.path
+    filename = upload.filename
     
     try:
-        # Выполняем транскрибацию
-        transcription, trans_error = await transcribe_audio(tmp_path)
+        # Выполняем транскрибацию (в очереди транскрибации)
+        transcription, trans_error = None, None
+        async for kind, payload in iterate_until_disconnected(
+            request, transcribe_in_queue(tmp_path, username, get_priority(user))
+        ):
+            if kind == "result":
+                transcription, trans_error = payload
         
         if trans_error:
             log_error(username, "transcription", trans_error)
             return TranscribeResponse(success=False, error=trans_error)
         
         # Генерируем протокол
-        protocol, proto_error = await generate_meeting_protocol(transcription, username)
+        protocol, proto_error = await run_until_disconnected(
+            request, generate_meeting_protocol(transcription, username)
+        )
         
         if proto_error:
             log_error(username, "protocol_generation", proto_error)
@@ -499,13 +597,17 @@ async def transcribe_audio_endpoint(
                 error=f"Протокол не сгенерирован: {proto_error}"
             )
         
-        log_user_action(username, "transcribe", f"Файл: {audio_file.filename}")
+        log_user_action(username, "transcribe", f"Файл: {filename}")
         
         return TranscribeResponse(
             success=True,
             transcription=transcription,
             protocol=protocol
         )
+
+    except ClientDisconnected:
+        record_disconnect(username, "transcribe", f"Файл: {filename}")
+        return TranscribeResponse(success=False, error="Клиент отключился")
         
     finally:
         # Удаляем временный файл
@@ -516,6 +618,212 @@ async def transcribe_audio_endpoint(
                 pass
 
 
+@app.post("/api/transcribe/stream")
+@limiter.limit("2/minute")
+async def transcribe_audio_stream(
+    request: Request,
+    user: dict = Depends(require_auth)
+):
+    """
+    Транскрибировать аудиофайл и сгенерировать протокол с потоковой выдачей (SSE).
+
+    Ошибки загрузки возвращаются обычным JSON, как у /api/transcribe.
+    Дальше идет поток событий:
+    - status: {"message"} - этап обработки (в т.ч. позиция в очереди транскрибации)
+    - transcription: {"text"} - готовая транскрипция
+    - delta: {"text"} - очередной фрагмент протокола
+    - done: {} - протокол готов
+    - error: {"error"} - ошибка (транскрипция, если уже отправлена, остается в силе)
+
+    Закрытие соединения останавливает транскрибацию или генерацию протокола.
+    """
+    username = user["username"]
+
+    upload, upload_error = await receive_audio_upload(request)
+    if upload_error:
+        log_error(username, "audio_validation", upload_error)
+        return TranscribeResponse(success=False, error=upload_error)
+    tmp_path = upload.path
+    filename = upload.filename
+
+    async def transcription_events():
+        try:
+            transcription, trans_error = None, None
+            async for kind, payload in transcribe_in_queue(tmp_path, username, get_priority(user)):
+                if kind == "status":
+                    yield sse_event("status", {"message": payload})
+                elif kind == "result":
+                    transcription, trans_error = payload
+            if trans_error:
+                log_error(username, "transcription", trans_error)
+                yield sse_event("error", {"error": trans_error})
+                return
+
+            yield sse_event("transcription", {"text": transcription})
+            yield sse_event("status", {"message": "Формируем протокол..."})
+
+            async for delta in stream_meeting_protocol(transcription, username):
+                yield sse_event("delta", {"text": delta})
+
+            log_user_action(username, "transcribe", f"Файл: {filename} (поток)")
+            yield sse_event("done", {})
+
+        except LLMStreamError as e:
+            log_error(username, "protocol_generation", str(e))
+            yield sse_event("error", {"error": f"Протокол не сгенерирован: {e}"})
+
+        except Exception as e:
+            error_msg = f"Произошла ошибка при обработке аудио: {str(e)}"
+            log_error(username, "transcribe_unexpected", error_msg)
+            yield sse_event("error", {"error": error_msg})
+
+        finally:
+            # Удаляем временный файл
+            if tmp_path.exists():
+                try:
+                    tmp_path.unlink()
+                except OSError:
+                    pass
+
+    async def event_stream():
+        try:
+            async for event in iterate_until_disconnected(request, transcription_events()):
+                yield event
+        except (ClientDisconnected, asyncio.CancelledError) as e:
+            record_disconnect(username, "transcribe", f"Файл: {filename} (поток)")
+            if isinstance(e, asyncio.CancelledError):
+                raise
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# ===== ФОНОВЫЕ ЗАДАЧИ =====
+
+@app.post("/api/jobs/analyze")
+@limiter.limit("10/minute")
+async def create_analysis_job(
+    request: Request,
+    user: dict = Depends(require_auth)
+):
+    """
+    Запустить анализ договора фоновой задачей.
+
+    Форма multipart: file - договор, analysis_type - тип анализа,
+    bulk=true - пакетная загрузка: задача уступает очередь интерактивным
+    запросам.
+
+    Возвращает id задачи сразу после загрузки файла; извлечение текста и
+    анализ идут в фоне (в общей очереди) и продолжаются при обрыве
+    соединения. Ошибки формата и размера файла возвращаются сразу.
+    """
+    username = user["username"]
+
+    upload, error = await receive_contract_upload(request, username)
+    if error:
+        log_error(username, "file_validation", error)
+        return {"success": False, "error": error}
+    analysis_type = upload.fields["analysis_type"]
+    bulk = upload.fields.get("bulk", "").lower() in ("1", "true", "on", "yes")
+
+    job = await job_manager.create(
+        "analyze", username, upload.filename,
+        lambda job: analysis_job_events(job, upload.path, upload.sha256, analysis_type, get_priority(user, bulk))
+    )
+    return {"success": True, "job_id": job.id}
+
+@app.post("/api/jobs/transcribe")
+@limiter.limit("2/minute")
+async def create_transcription_job(
+    request: Request,
+    user: dict = Depends(require_auth)
+):
+    """
+    Запустить транскрибацию и генерацию протокола фоновой задачей.
+    """
+    username = user["username"]
+
+    upload, upload_error = await receive_audio_upload(request)
+    if upload_error:
+        log_error(username, "audio_validation", upload_error)
+        return {"success": False, "error": upload_error}
+
+    job = await job_manager.create(
+        "transcribe", username, upload.filename,
+        lambda job: transcription_job_events(job, upload.path, get_priority(user))
+    )
+    return {"success": True, "job_id": job.id}
+
+async def get_user_job(job_id: str, user: dict):
+    """
+    Получить состояние задачи, доступной пользователю (своей или любой для
+    администратора), в любом процессе сервера.
+
+    Args:
+        job_id: Идентификатор задачи
+        user: Текущий пользователь
+
+    Returns:
+        Состояние задачи (Job.to_dict) или None
+    """
+    state = await job_manager.get_state(job_id)
+    if state is None or (state["username"] != user["username"] and user.get("role") != "admin"):
+        return None
+    return state
+
+@app.get("/api/jobs")
+async def list_jobs(user: dict = Depends(require_auth)):
+    """
+    Получить задачи текущего пользователя (новые первыми).
+    """
+    return {"success": True, "jobs": await job_manager.list_for_user(user["username"])}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, user: dict = Depends(require_auth)):
+    """
+    Получить состояние задачи: статус, этап, позиция в очереди, результат.
+    """
+    state = await get_user_job(job_id, user)
+    if state is None:
+        return {"success": False, "error": "Задача не найдена"}
+    return {"success": True, "job": state}
+
+@app.get("/api/jobs/{job_id}/events")
+async def get_job_events(job_id: str, user: dict = Depends(require_auth)):
+    """
+    Поток событий задачи (SSE), с начала задачи.
+
+    Подключиться можно в любой момент, в т.ч. повторно после перезагрузки
+    страницы: сначала отдаются уже произошедшие события, затем новые.
+    - status: {"stage", "status", "queue_position"} - этап обработки
+    - delta / transcription - фрагменты результата (как в потоковых эндпоинтах)
+    - done: {"result"} - задача завершена
+    - error: {"error"} - ошибка
+
+    Задача другого процесса сервера отдает только смены этапа и итоговое
+    событие с полным результатом.
+    """
+    if await get_user_job(job_id, user) is None:
+        return {"success": False, "error": "Задача не найдена"}
+    job = job_manager.get(job_id)
+    events = job.events() if job is not None else job_manager.remote_events(job_id)
+
+    async def event_stream():
+        async for event, data in events:
+            if event == "status" and job is not None:
+                data = {**data, "queue_position": job.to_dict()["queue_position"]}
+            yield sse_event(event, data)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.post("/api/export-transcript")
 async def export_transcript_to_word(
     data: ExportRequest,
@@ -532,7 +840,7 @@ async def export_transcript_to_word(
         timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M")
         filename = f"Транскрипция_{timestamp}"
         
-        doc_io = create_word_document(data.content, filename, 'markdown')
+        doc_io = await run_cpu(create_word_document, data.content, filename, 'markdown')
         
         log_user_action(user["username"], "export_transcript", f"Файл: {filename}.docx")
         
@@ -566,7 +874,7 @@ async def export_protocol_to_word(
         timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M")
         filename = f"Протокол_{timestamp}"
         
-        doc_io = create_word_document(data.content, filename, 'markdown')
+        doc_io = await run_cpu(create_word_document, data.content, filename, 'markdown')
         
         log_user_action(user["username"], "export_protocol", f"Файл: {filename}.docx")
         
@@ -597,7 +905,7 @@ async def export_to_word(
     """
     try:
         # Создать Word документ
-        doc_io = create_word_document(data.content, data.filename, getattr(data, 'content_type', 'markdown'))
+        doc_io = await run_cpu(create_word_document, data.content, data.filename, getattr(data, 'content_type', 'markdown'))
 
         # Логировать экспорт
         log_user_action(user["username"], "export", f"Файл: {data.filename}.docx")
@@ -626,7 +934,7 @@ async def admin_get_llm_config(user: dict = Depends(require_admin)):
     """
     Получить настройки LLM (только для admin).
     """
-    config = get_llm_config()
+    config = await run_io(get_llm_config)
     return {"success": True, "config": config}
 
 @app.post("/api/admin/llm-config")
@@ -638,9 +946,11 @@ async def admin_update_llm_config(
     Обновить настройки LLM (только для admin).
     """
     updates = data.dict(exclude_unset=True)
-    success = update_llm_config(updates)
+    success = await run_io(update_llm_config, updates)
 
     if success:
+        # Новые адрес/ключ - новые клиенты при следующем запросе
+        reset_llm_clients()
         log_user_action(user["username"], "update_llm_config", f"Обновлено полей: {len(updates)}")
         return {"success": True, "message": "Настройки LLM обновлены"}
     else:
@@ -653,7 +963,7 @@ async def admin_get_settings(user: dict = Depends(require_admin)):
     """
     Получить настройки системы (только для admin).
     """
-    settings = get_settings()
+    settings = await run_io(get_settings)
     return {"success": True, "settings": settings}
 
 @app.post("/api/admin/settings")
@@ -665,7 +975,7 @@ async def admin_update_settings(
     Обновить настройки системы (только для admin).
     """
     updates = data.dict(exclude_unset=True)
-    success = update_settings(updates)
+    success = await run_io(update_settings, updates)
 
     if success:
         log_user_action(user["username"], "update_settings", f"Обновлено полей: {len(updates)}")
@@ -678,10 +988,45 @@ async def admin_get_tokens_stats(user: dict = Depends(require_admin)):
     """
     Получить статистику использования токенов (только для admin).
     """
-    stats = get_tokens_stats()
+    stats = await run_io(get_tokens_stats)
     formatted_stats = format_stats_for_display(stats)
     return {"success": True, "stats": formatted_stats}
 
+@app.get("/api/admin/cache-stats")
+async def admin_get_cache_stats(user: dict = Depends(require_admin)):
+    """
+    Получить статистику кэшей извлечения текста и результатов LLM (только для admin).
+    """
+    extraction = await run_io(extraction_cache.get_stats)
+    results = await run_io(result_cache.get_stats)
+    tokens_stats = await run_io(get_tokens_stats)
+    return {
+        "success": True,
+        "stats": {
+            "extraction": extraction,
+            "results": results,
+            # Счетчики процесса и общее число присоединенных запросов
+            "shared": {
+                **analysis_flights.get_stats(),
+                "coalesced_total": tokens_stats.get("total_coalesced", 0)
+            }
+        }
+    }
+
+@app.get("/api/admin/executor-stats")
+async def admin_get_executor_stats(user: dict = Depends(require_admin)):
+    """
+    Получить загрузку пулов обработки (только для admin).
+
+    Показывает потоки CPU- и IO-пулов и процессы разбора документов:
+    сколько занято, сколько задач ждет и как долго.
+    """
+    # Не через IO-пул: статистика нужна как раз тогда, когда он перегружен
+    # (обе функции читают только счетчики в памяти)
+    executors = get_executor_stats()
+    sandbox = extraction_sandbox.get_stats()
+    return {"success": True, "stats": {**executors, "extraction_sandbox": sandbox}}
+
 @app.get("/api/admin/logs")
 async def admin_get_logs(
     type: str = "app",
@@ -691,7 +1036,7 @@ async def admin_get_logs(
     """
     Получить логи системы (только для admin).
     """
-    logs = get_logs(type, limit)
+    logs = await run_io(get_logs, type, limit)
     return {"success": True, "logs": logs}
 
 if __name__ == "__main__":
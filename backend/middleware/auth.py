@@ -1,6 +1,7 @@
 from fastapi import Request, HTTPException, status
 from fastapi.responses import JSONResponse
 from backend.services.auth import get_user_by_ip
+from backend.services.executors import run_io
 
 def get_client_ip(request: Request) -> str:
     """
@@ -39,7 +40,7 @@ async def require_auth(request: Request) -> dict:
         HTTPException: Если пользователь не авторизован
     """
     ip = get_client_ip(request)
-    user = get_user_by_ip(ip)
+    user = await run_io(get_user_by_ip, ip)
   
     if not user:
         raise HTTPException(
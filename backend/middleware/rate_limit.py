@@ -4,9 +4,12 @@ from slowapi.errors import RateLimitExceeded
 from fastapi import Request
 from fastapi.responses import JSONResponse
 from backend.services.settings import get_settings
+# Регистрирует схему "sqlite://" хранилища лимитов
+from backend.services.shared_state import SQLiteStorage  # noqa: F401
 
-# Создать limiter с функцией получения IP
-limiter = Limiter(key_func=get_remote_address)
+# Создать limiter с функцией получения IP; счетчики общие для всех
+# процессов сервера (иначе с --workers N лимит умножался бы на N)
+limiter = Limiter(key_func=get_remote_address, storage_uri="sqlite://")
 
 def get_rate_limit_string() -> str:
     """
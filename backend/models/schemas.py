@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Literal
+from typing import Dict, Optional, Literal
 
 # ===== АВТОРИЗАЦИЯ =====
 
@@ -37,12 +37,13 @@ class UserResponse(UserBase):
 # ===== АНАЛИЗ ДОГОВОРОВ =====
 
 class AnalyzeRequest(BaseModel):
-    analysis_type: Literal["summary", "legal_check"]
+    analysis_type: Literal["summary", "legal_check", "full"]
 
 class AnalyzeResponse(BaseModel):
     success: bool
     analysis_type: Optional[str] = None
     result: Optional[str] = None
+    results: Optional[Dict[str, str]] = None  # по частям для analysis_type="full"
     filename: Optional[str] = None
     error: Optional[str] = None
     queued: Optional[bool] = False
@@ -88,6 +89,7 @@ class LLMConfigUpdate(BaseModel):
     deepseek_base_url: Optional[str] = None
     lmstudio_base_url: Optional[str] = None
     lmstudio_model: Optional[str] = None
+    lmstudio_context_window: Optional[int] = None
 
 # ===== НАСТРОЙКИ СИСТЕМЫ =====
 
@@ -100,7 +102,46 @@ class SettingsUpdate(BaseModel):
     max_audio_file_size_mb: Optional[int] = None
     max_queue_size: Optional[int] = None
     max_concurrent_requests: Optional[int] = None
+    max_concurrent_per_user: Optional[int] = None
+    max_queued_per_user: Optional[int] = None
+    queue_priority_enabled: Optional[bool] = None
+    queue_token_budget: Optional[int] = None
+    queue_shortest_job_first: Optional[bool] = None
+    queue_sjf_max_wait_seconds: Optional[int] = None
+    transcription_max_concurrent: Optional[int] = None
+    transcription_max_queue_size: Optional[int] = None
+    transcription_max_concurrent_per_user: Optional[int] = None
+    transcription_max_queued_per_user: Optional[int] = None
     rate_limit_per_minute: Optional[int] = None
+    jobs_retention_minutes: Optional[int] = None
+    extraction_cache_memory_items: Optional[int] = None
+    extraction_cache_disk_mb: Optional[int] = None
+    result_cache_enabled: Optional[bool] = None
+    result_cache_memory_items: Optional[int] = None
+    result_cache_disk_mb: Optional[int] = None
+    result_cache_ttl_hours: Optional[int] = None
+    pdf_engine: Optional[Literal["pypdf2", "pdfplumber", "pypdfium2"]] = None
+    pdf_extraction_workers: Optional[int] = None
+    pdf_parallel_min_pages: Optional[int] = None
+    max_pdf_pages: Optional[int] = None
+    ocr_enabled: Optional[bool] = None
+    ocr_workers: Optional[int] = None
+    ocr_languages: Optional[str] = None
+    ocr_dpi: Optional[int] = None
+    ocr_max_pages: Optional[int] = None
+    extraction_sandbox_enabled: Optional[bool] = None
+    extraction_sandbox_workers: Optional[int] = None
+    extraction_sandbox_timeout_seconds: Optional[int] = None
+    extraction_sandbox_cpu_seconds: Optional[int] = None
+    extraction_sandbox_memory_mb: Optional[int] = None
+    extraction_sandbox_max_jobs: Optional[int] = None
+    cpu_executor_workers: Optional[int] = None
+    io_executor_workers: Optional[int] = None
+    docx_engine: Optional[Literal["stream", "python-docx"]] = None
+    text_normalization_enabled: Optional[bool] = None
+    map_reduce_enabled: Optional[bool] = None
+    map_reduce_concurrency: Optional[int] = None
+    max_document_tokens: Optional[int] = None
 
 # ===== СТАТИСТИКА ТОКЕНОВ =====
 
@@ -0,0 +1,299 @@
+"""
+Конвейер анализа договора: загрузка, извлечение текста, очередь и LLM.
+
+Используется эндпоинтами анализа (обычным и потоковым) и фоновыми
+задачами (analysis_job_events): все они проходят одни и те же этапы и
+разделяют одинаковые одновременные анализы (single-flight).
+"""
+
+from pathlib import Path
+from typing import AsyncIterator, Optional, Tuple
+
+from fastapi import Request
+
+from backend.services.document import extract_text_from_file, check_text_size
+from backend.services.executors import run_cpu, run_io
+from backend.services.llm import analyze_contract_parts, stream_analyze_parts, get_result_key, LLMStreamError
+from backend.services.jobs import Job, JobEvent
+from backend.services.logger import log_user_action, log_error
+from backend.services.prompts import get_prompt, get_analysis_parts, combine_analysis_results, FULL_ANALYSIS_TYPE
+from backend.services.queue import request_queue, DEFAULT_PRIORITY
+from backend.services.settings import get_settings, get_max_file_size_bytes
+from backend.services.single_flight import Flight, analysis_flights
+from backend.services.text_normalizer import normalize_text
+from backend.services.token_counter import get_document_token_limit, count_tokens, MAX_OUTPUT_TOKENS
+from backend.services.tokens import track_saved_tokens, track_coalesced
+from backend.services.uploads import ReceivedUpload, receive_upload
+
+# Допустимые форматы договоров
+CONTRACT_EXTENSIONS = [".doc", ".docx", ".pdf"]
+
+# ===== ЗАГРУЗКА И ИЗВЛЕЧЕНИЕ ТЕКСТА =====
+
+def check_contract_format(filename: str) -> Optional[str]:
+    """
+    Проверить формат договора по расширению.
+
+    Args:
+        filename: Имя загруженного файла
+
+    Returns:
+        Текст ошибки или None, если формат допустим
+    """
+    if Path(filename).suffix.lower() not in CONTRACT_EXTENSIONS:
+        return "Неподдерживаемый формат файла. Допустимы: .doc, .docx, .pdf"
+    return None
+
+async def receive_contract_upload(request: Request, username: str) -> Tuple[Optional[ReceivedUpload], Optional[str]]:
+    """
+    Принять загружаемый договор (поле file) во временный файл по частям.
+
+    Формат проверяется до приема содержимого, размер - до и во время
+    приема. Поле формы analysis_type обязательно.
+
+    Args:
+        request: FastAPI Request объект (тело еще не прочитано)
+        username: Имя пользователя
+
+    Returns:
+        Кортеж (загрузка, ошибка). Временный файл загрузки удаляет
+        extract_contract_text.
+    """
+    try:
+        max_size = await run_io(get_max_file_size_bytes)
+        upload, error = await receive_upload(request, "file", check_contract_format, max_size)
+    except Exception as e:
+        error_msg = f"Произошла ошибка при обработке файла: {str(e)}"
+        log_error(username, "analyze_unexpected", error_msg)
+        return None, error_msg
+    if error:
+        return None, error
+
+    if not upload.fields.get("analysis_type"):
+        upload.remove()
+        return None, "Не указан тип анализа."
+    return upload, None
+
+async def extract_contract_text(tmp_path: Path, file_hash: str, filename: str, analysis_type: str, username: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Извлечь текст договора из временного файла и подготовить к анализу.
+
+    Временный файл удаляется после извлечения.
+
+    Args:
+        tmp_path: Путь к временному файлу
+        file_hash: SHA-256 содержимого (ключ кэша извлечения)
+        filename: Исходное имя файла (для журнала)
+        analysis_type: Тип анализа
+        username: Имя пользователя
+
+    Returns:
+        Кортеж (текст, ошибка)
+    """
+    try:
+        try:
+            # Извлечь текст (повторная загрузка того же файла берется из кэша)
+            # Разбор выполняется в CPU-пуле, чтобы не блокировать event loop,
+            # и прерывается, как только документ превысил лимит токенов
+            token_limit = await run_io(get_document_token_limit)
+            text, error = await run_cpu(
+                extract_text_from_file, tmp_path, tmp_path.suffix.lower(), file_hash, token_limit
+            )
+        finally:
+            # Удалить временный файл
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+        if error:
+            log_error(username, "document_extract", error)
+            return None, error
+
+        # Убрать колонтитулы, номера страниц и лишние пробелы
+        settings = await run_io(get_settings)
+        if settings.get("text_normalization_enabled", True):
+            text, saved_tokens = await run_cpu(normalize_text, text)
+            if saved_tokens:
+                log_user_action(username, "normalize", f"{filename}: сэкономлено {saved_tokens} токенов")
+                await run_io(track_saved_tokens, username, saved_tokens)
+
+        # Проверить размер текста вместе с промптом по токенизатору модели
+        # (для комбинированного анализа - с промптом каждой части)
+        for part in get_analysis_parts(analysis_type):
+            prompt = await run_io(get_prompt, part)
+            size_ok, size_error = await run_cpu(check_text_size, text, prompt=prompt)
+            if not size_ok:
+                log_error(username, "document_size_check", size_error)
+                return None, size_error
+
+        return text, None
+
+    except Exception as e:
+        error_msg = f"Произошла ошибка при обработке файла: {str(e)}"
+        log_error(username, "analyze_unexpected", error_msg)
+        return None, error_msg
+
+# ===== АНАЛИЗ В ОЧЕРЕДИ =====
+
+async def estimate_analysis_cost(text: str, analysis_type: str) -> int:
+    """
+    Оценить стоимость анализа в токенах (для планирования очереди).
+
+    Каждая часть анализа отправляет в LLM промпт и текст договора и
+    получает до MAX_OUTPUT_TOKENS токенов ответа.
+
+    Args:
+        text: Текст договора
+        analysis_type: Тип анализа
+
+    Returns:
+        Оценка: токены запросов и ответов всех частей
+    """
+    text_tokens = await run_cpu(count_tokens, text)
+    cost = 0
+    for part in get_analysis_parts(analysis_type):
+        prompt = await run_io(get_prompt, part)
+        cost += text_tokens + await run_cpu(count_tokens, prompt or "") + MAX_OUTPUT_TOKENS
+    return cost
+
+async def analysis_events(text: str, analysis_type: str, username: str, stream: bool, priority: str = DEFAULT_PRIORITY) -> AsyncIterator[Tuple[str, str, Optional[str]]]:
+    """
+    Выполнить анализ в слоте очереди и выдать его события.
+
+    Источник событий для объединения одинаковых запросов: слот очереди
+    занимается один раз на всех, кто ждет этот результат. Части
+    комбинированного анализа выполняются параллельно в том же слоте.
+
+    Args:
+        text: Текст договора
+        analysis_type: Тип анализа
+        username: Имя пользователя, запустившего анализ (для учета токенов)
+        stream: Потоковый вызов LLM (иначе результат приходит одним фрагментом)
+        priority: Класс приоритета в очереди
+
+    Yields:
+        События ("queued", ожидание слота в request_queue, None),
+        ("status", сообщение, None) и
+        ("delta", фрагмент результата, тип анализа части)
+
+    Raises:
+        LLMStreamError: Очередь переполнена или ошибка анализа
+    """
+    # ===== ПРОВЕРКА ОЧЕРЕДИ =====
+    # Слот занимается только под анализ: слишком большие и битые файлы
+    # отклоняются раньше и не держат очередь
+    cost = await estimate_analysis_cost(text, analysis_type)
+    queue_result = await request_queue.acquire(username, priority, cost)
+    if not queue_result["allowed"]:
+        raise LLMStreamError(queue_result.get("error", "Система перегружена. Попробуйте позже."))
+
+    waiter = queue_result["waiter"]
+    has_slot = not queue_result.get("queued")
+    try:
+        if not has_slot:
+            # Запрос в очереди - ждем слот
+            yield "queued", waiter, None
+            yield "status", f"{queue_result['message']} Позиция: {queue_result['position']}.", None
+            await request_queue.wait_for_slot(waiter)
+            has_slot = True
+
+        # ===== АНАЛИЗ ЧЕРЕЗ LLM =====
+        yield "status", "Анализируем договор...", None
+        parts = get_analysis_parts(analysis_type)
+        if stream:
+            async for event in stream_analyze_parts(text, parts, username):
+                yield event
+        else:
+            results, llm_error = await analyze_contract_parts(text, parts, username)
+            if llm_error:
+                raise LLMStreamError(llm_error)
+            for part, result in results.items():
+                yield "delta", result, part
+
+    finally:
+        # ===== ОСВОБОЖДЕНИЕ СЛОТА В ОЧЕРЕДИ =====
+        if has_slot:
+            await request_queue.release(waiter)
+
+async def join_analysis(text: str, analysis_type: str, username: str, stream: bool, priority: str = DEFAULT_PRIORITY) -> Tuple[Optional[Flight], Optional[str]]:
+    """
+    Присоединиться к такому же выполняющемуся анализу или запустить новый.
+
+    Args:
+        text: Текст договора
+        analysis_type: Тип анализа
+        username: Имя пользователя
+        stream: Потоковый вызов LLM для нового анализа
+        priority: Класс приоритета в очереди (у общего анализа - того,
+            кто его запустил)
+
+    Returns:
+        Кортеж (обработка, ошибка)
+    """
+    prompts = []
+    for part in get_analysis_parts(analysis_type):
+        prompt = await run_io(get_prompt, part)
+        if not prompt:
+            return None, "Промпт не найден"
+        prompts.append(prompt)
+
+    key = await get_result_key(analysis_type, text, "\n".join(prompts))
+    flight, started = analysis_flights.join(
+        key, lambda: analysis_events(text, analysis_type, username, stream, priority)
+    )
+    if not started:
+        # Результат будет получен без отдельного обращения к LLM
+        log_user_action(username, "analyze_shared", f"Присоединен к выполняющемуся анализу ({analysis_type})")
+        await run_io(track_coalesced, username)
+    return flight, None
+
+# ===== ФОНОВАЯ ЗАДАЧА =====
+
+async def analysis_job_events(job: Job, tmp_path: Path, file_hash: str, analysis_type: str, priority: str = DEFAULT_PRIORITY) -> AsyncIterator[JobEvent]:
+    """
+    Выполнить анализ как фоновую задачу (см. backend.services.jobs).
+
+    Args:
+        job: Задача
+        tmp_path: Временный файл загруженного договора (удаляется)
+        file_hash: SHA-256 содержимого файла
+        analysis_type: Тип анализа
+        priority: Класс приоритета в очереди
+
+    Yields:
+        События задачи: status, delta {"text", "part"}, done, error
+    """
+    yield "status", {"status": "running", "stage": "Извлечение текста"}
+    text, error = await extract_contract_text(tmp_path, file_hash, job.filename, analysis_type, job.username)
+    if error:
+        yield "error", {"error": error}
+        return
+
+    flight, error = await join_analysis(text, analysis_type, job.username, stream=True, priority=priority)
+    if error:
+        yield "error", {"error": error}
+        return
+
+    results = {part: "" for part in get_analysis_parts(analysis_type)}
+    try:
+        async for kind, payload, part in flight.events():
+            if kind == "queued":
+                waiter = payload
+                job.queue_position = lambda: request_queue.get_position(waiter)
+            elif kind == "status":
+                waiting = job.queue_position is not None and job.queue_position() is not None
+                yield "status", {"status": "queued" if waiting else "running", "stage": payload}
+            elif kind == "delta":
+                results[part] += payload
+                yield "delta", {"text": payload, "part": part}
+    except LLMStreamError as e:
+        log_error(job.username, "llm_analyze", str(e))
+        yield "error", {"error": str(e)}
+        return
+
+    log_user_action(job.username, "analyze", f"{job.filename} ({analysis_type}, задача {job.id})")
+
+    if analysis_type == FULL_ANALYSIS_TYPE:
+        result = {"result": combine_analysis_results(results), "results": results}
+    else:
+        result = {"result": results[analysis_type]}
+    yield "done", {"result": {"analysis_type": analysis_type, "filename": job.filename, **result}}
@@ -0,0 +1,261 @@
+"""
+Двухуровневый кэш строковых значений: LRU в памяти + сжатые файлы на диске.
+
+Используется для кэширования результатов, которые дорого вычислять
+(например, извлеченного текста документов). Ключ - произвольная строка
+(обычно SHA-256 хэш содержимого), значение - строка.
+"""
+
+import gzip
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from backend.config import DATA_DIR
+from backend.services.settings import get_settings
+
+CACHE_DIR = DATA_DIR / "cache"
+
+
+class TieredCache:
+    """
+    Кэш с LRU-уровнем в памяти и сжатым уровнем на диске.
+
+    Лимиты берутся из настроек системы:
+    - {settings_prefix}_memory_items - количество записей в памяти
+    - {settings_prefix}_disk_mb - максимальный объем на диске (МБ)
+    - {settings_prefix}_ttl_hours - срок жизни записи (0 - без срока)
+
+    При превышении объема на диске удаляются записи, к которым
+    дольше всего не обращались. Время создания записи хранится в
+    заголовке gzip-файла.
+    """
+
+    def __init__(self, name: str, settings_prefix: str, default_memory_items: int = 64, default_disk_mb: int = 500, default_ttl_hours: int = 0):
+        self.name = name
+        self._settings_prefix = settings_prefix
+        self._default_memory_items = default_memory_items
+        self._default_disk_mb = default_disk_mb
+        self._default_ttl_hours = default_ttl_hours
+        self._dir = CACHE_DIR / name
+        # Ключ -> (значение, время создания)
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._disk_index: Optional[Dict[Path, int]] = None
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expired": 0
+        }
+
+    # ===== ПУБЛИЧНЫЙ ИНТЕРФЕЙС =====
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Получить значение из кэша.
+
+        Args:
+            key: Ключ записи
+
+        Returns:
+            Значение или None, если записи нет
+        """
+        ttl_seconds = self._ttl_seconds()
+
+        with self._lock:
+            if key in self._memory:
+                value, created = self._memory[key]
+                if not self._is_expired(created, ttl_seconds):
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return value
+
+        path = self._path_for(key)
+        try:
+            with gzip.open(path, "rb") as f:
+                value = f.read().decode("utf-8")
+                created = f.mtime or 0
+        except (OSError, EOFError, UnicodeDecodeError):
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+
+        if self._is_expired(created, ttl_seconds):
+            self.delete(key)
+            with self._lock:
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+            return None
+
+        # Обновить время доступа для вытеснения по давности использования
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        with self._lock:
+            self._stats["disk_hits"] += 1
+            self._remember(key, value, created)
+        return value
+
+    def set(self, key: str, value: str):
+        """
+        Сохранить значение в кэш (в память и на диск).
+
+        Args:
+            key: Ключ записи
+            value: Значение
+        """
+        with self._lock:
+            self._remember(key, value, time.time())
+            self._stats["stores"] += 1
+
+        path = self._path_for(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            with gzip.open(temp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+                f.write(value)
+            temp_path.replace(path)
+            size = path.stat().st_size
+        except OSError as e:
+            print(f"Ошибка записи кэша {self.name}: {e}")
+            return
+
+        with self._lock:
+            index = self._load_disk_index()
+            self._disk_size += size - index.get(path, 0)
+            index[path] = size
+            self._evict_disk()
+
+    def delete(self, key: str):
+        """
+        Удалить запись из кэша.
+
+        Args:
+            key: Ключ записи
+        """
+        path = self._path_for(key)
+        with self._lock:
+            self._memory.pop(key, None)
+            index = self._load_disk_index()
+            self._disk_size -= index.pop(path, 0)
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+    def clear(self):
+        """Очистить кэш полностью."""
+        with self._lock:
+            self._memory.clear()
+            index = self._load_disk_index()
+            for path in list(index):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+            index.clear()
+            self._disk_size = 0
+
+    def get_stats(self) -> Dict:
+        """
+        Получить статистику кэша.
+
+        Returns:
+            Словарь со счетчиками попаданий/промахов и объемом
+        """
+        with self._lock:
+            index = self._load_disk_index()
+            hits = self._stats["memory_hits"] + self._stats["disk_hits"]
+            total = hits + self._stats["misses"]
+            return {
+                **self._stats,
+                "hits": hits,
+                "hit_rate": round(hits / total, 4) if total else 0.0,
+                "memory_items": len(self._memory),
+                "disk_items": len(index),
+                "disk_size_mb": round(self._disk_size / (1024 * 1024), 2)
+            }
+
+    # ===== ВНУТРЕННИЕ МЕТОДЫ =====
+
+    def _limits(self) -> tuple:
+        """Получить лимиты кэша из настроек: (записей в памяти, байт на диске)."""
+        settings = get_settings()
+        memory_items = settings.get(f"{self._settings_prefix}_memory_items", self._default_memory_items)
+        disk_mb = settings.get(f"{self._settings_prefix}_disk_mb", self._default_disk_mb)
+        return memory_items, disk_mb * 1024 * 1024
+
+    def _ttl_seconds(self) -> int:
+        """Срок жизни записи из настроек (0 - без срока)."""
+        ttl_hours = get_settings().get(f"{self._settings_prefix}_ttl_hours", self._default_ttl_hours)
+        return int(ttl_hours * 3600) if ttl_hours else 0
+
+    @staticmethod
+    def _is_expired(created: float, ttl_seconds: int) -> bool:
+        """Истек ли срок жизни записи."""
+        return bool(ttl_seconds) and time.time() - created > ttl_seconds
+
+    def _path_for(self, key: str) -> Path:
+        """Путь к файлу записи на диске."""
+        file_name = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return self._dir / file_name[:2] / f"{file_name}.gz"
+
+    def _remember(self, key: str, value: str, created: float):
+        """Положить значение в LRU в памяти (вызывается под блокировкой)."""
+        memory_items, _ = self._limits()
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > max(memory_items, 0):
+            self._memory.popitem(last=False)
+
+    def _load_disk_index(self) -> Dict[Path, int]:
+        """Построить индекс файлов на диске при первом обращении (под блокировкой)."""
+        if self._disk_index is None:
+            self._disk_index = {}
+            self._disk_size = 0
+            if self._dir.exists():
+                for path in self._dir.glob("*/*.gz"):
+                    try:
+                        size = path.stat().st_size
+                    except OSError:
+                        continue
+                    self._disk_index[path] = size
+                    self._disk_size += size
+        return self._disk_index
+
+    def _evict_disk(self):
+        """Удалить давно не использованные файлы при превышении лимита (под блокировкой)."""
+        _, max_bytes = self._limits()
+        if self._disk_size <= max_bytes:
+            return
+
+        def access_time(path: Path) -> float:
+            try:
+                return path.stat().st_mtime
+            except OSError:
+                return 0.0
+
+        index = self._disk_index
+        for path in sorted(index, key=access_time):
+            if self._disk_size <= max_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            self._disk_size -= index.pop(path)
+            self._stats["evictions"] += 1
+
+
+# Кэш извлеченного текста документов
+extraction_cache = TieredCache("extraction", "extraction_cache")
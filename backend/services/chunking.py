@@ -0,0 +1,90 @@
+"""
+Разбиение текста договора на части для поэтапного анализа (map-reduce).
+
+Текст режется по естественным границам: маркерам страниц
+(=== Страница N ===), заголовкам разделов, статей и приложений.
+Слишком крупные блоки дополнительно делятся по абзацам и строкам.
+Блоки затем жадно упаковываются в части, не превышающие бюджет токенов.
+"""
+
+import re
+from typing import List
+
+from backend.services.token_counter import count_tokens
+
+# Строки, с которых начинается новый смысловой блок
+SECTION_START_RE = re.compile(
+    r"^(?:"
+    r"=== Страница \d+ ===|"
+    r"=== ТАБЛИЦЫ ===|"
+    r"\s*(?:Статья|Раздел|Глава|Приложение)\s*(?:№\s*)?[\dIVXLC]+|"
+    r"\s*\d{1,2}\.\s+[А-ЯЁA-Z]"
+    r")",
+    re.MULTILINE
+)
+
+
+def _split_blocks(text: str) -> List[str]:
+    """Разбить текст на блоки по заголовкам разделов и маркерам страниц."""
+    starts = [match.start() for match in SECTION_START_RE.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    starts.append(len(text))
+    return [text[start:end] for start, end in zip(starts, starts[1:]) if text[start:end].strip()]
+
+
+def _split_oversized(block: str, max_tokens: int) -> List[str]:
+    """Разделить блок, не помещающийся в бюджет, по абзацам, строкам или символам."""
+    for separator in ("\n\n", "\n"):
+        parts = [part for part in block.split(separator) if part.strip()]
+        if len(parts) > 1:
+            return _pack([part + separator for part in parts], max_tokens)
+
+    # Одна очень длинная строка - режем по длине с запасом
+    tokens = count_tokens(block)
+    pieces = max(2, -(-tokens // max_tokens) + 1)
+    size = -(-len(block) // pieces)
+    return [block[i:i + size] for i in range(0, len(block), size)]
+
+
+def _pack(blocks: List[str], max_tokens: int) -> List[str]:
+    """Жадно объединить блоки в части не больше max_tokens."""
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+
+    for block in blocks:
+        block_tokens = count_tokens(block)
+
+        if block_tokens > max_tokens:
+            if current:
+                chunks.append("".join(current))
+                current, current_tokens = [], 0
+            chunks.extend(_split_oversized(block, max_tokens))
+            continue
+
+        if current and current_tokens + block_tokens > max_tokens:
+            chunks.append("".join(current))
+            current, current_tokens = [], 0
+
+        current.append(block)
+        current_tokens += block_tokens
+
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+def split_text_into_chunks(text: str, max_tokens: int) -> List[str]:
+    """
+    Разбить текст на части не больше max_tokens по границам разделов и страниц.
+
+    Args:
+        text: Текст договора
+        max_tokens: Максимальный размер части в токенах
+
+    Returns:
+        Список частей в исходном порядке
+    """
+    chunks = _pack(_split_blocks(text), max(max_tokens, 1))
+    return [chunk.strip() for chunk in chunks if chunk.strip()]
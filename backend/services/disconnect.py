@@ -0,0 +1,120 @@
+"""
+Отмена обработки, когда клиент закрыл соединение.
+
+Обработчик запроса не узнает об отключении клиента сам: анализ в очереди
+или ожидание ответа LLM продолжились бы до конца, занимая слот очереди и
+расходуя токены, которые никто не прочитает. Здесь обработка выполняется
+в отдельной задаче, а соединение проверяется раз в
+DISCONNECT_POLL_SECONDS; при отключении задача отменяется, и отмена
+доходит до обращения к LLM (запрос закрывается) или процесса
+транскрибации (процесс завершается), а слот очереди освобождается в
+блоках finally.
+"""
+
+import asyncio
+from typing import AsyncIterator, Awaitable, TypeVar
+
+from fastapi import Request
+
+from backend.services.executors import run_io
+from backend.services.logger import log_user_action
+from backend.services.tokens import track_cancelled
+
+# Период проверки соединения с клиентом
+DISCONNECT_POLL_SECONDS = 1.0
+
+T = TypeVar("T")
+
+
+class ClientDisconnected(Exception):
+    """Клиент закрыл соединение, обработка отменена."""
+    pass
+
+
+async def _wait_or_disconnect(request: Request, task: asyncio.Future) -> None:
+    """Дождаться задачи; если клиент отключился - отменить ее."""
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+        if done:
+            return
+        if await request.is_disconnected():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            raise ClientDisconnected()
+
+
+async def run_until_disconnected(request: Request, awaitable: Awaitable[T]) -> T:
+    """
+    Выполнить обработку, отменив ее при отключении клиента.
+
+    Args:
+        request: Запрос
+        awaitable: Обработка (корутина)
+
+    Returns:
+        Результат обработки
+
+    Raises:
+        ClientDisconnected: Клиент отключился, обработка отменена
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        await _wait_or_disconnect(request, task)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    return task.result()
+
+
+async def iterate_until_disconnected(request: Request, events: AsyncIterator[T]) -> AsyncIterator[T]:
+    """
+    Читать события, отменив источник при отключении клиента.
+
+    Источник отменяется и во время ожидания следующего события (в очереди,
+    до первого фрагмента ответа), когда потоковый ответ еще ничего не
+    отправляет и обрыв соединения иначе не обнаруживается.
+
+    Args:
+        request: Запрос
+        events: Источник событий
+
+    Yields:
+        События источника
+
+    Raises:
+        ClientDisconnected: Клиент отключился, источник отменен
+    """
+    iterator = events.__aiter__()
+    task = None
+    try:
+        while True:
+            task = asyncio.ensure_future(iterator.__anext__())
+            try:
+                await _wait_or_disconnect(request, task)
+            except asyncio.CancelledError:
+                task.cancel()
+                raise
+            try:
+                event = task.result()
+            except StopAsyncIteration:
+                return
+            yield event
+    finally:
+        # Отмененный источник закрывается сам, когда задача завершится
+        if (task is None or task.done()) and hasattr(iterator, "aclose"):
+            await iterator.aclose()
+
+
+def record_disconnect(username: str, operation: str, details: str):
+    """
+    Записать отмену обработки из-за отключения клиента в журнал и статистику.
+
+    Не ждет записи статистики: вызывается, когда обработчик уже отменяется.
+
+    Args:
+        username: Имя пользователя
+        operation: Операция ("analyze", "transcribe")
+        details: Описание запроса (имя файла и т.п.)
+    """
+    log_user_action(username, f"{operation}_cancelled", f"{details}: клиент отключился, обработка отменена")
+    asyncio.ensure_future(run_io(track_cancelled, username))
@@ -0,0 +1,566 @@
+"""
+Извлечение текста из .doc (Word 97-2003) без Microsoft Word.
+
+Файл .doc - это составной файл OLE2 (Compound File Binary). Текст лежит
+в потоке WordDocument, а таблица фрагментов (CLX), по которой его можно
+собрать, - в потоке 0Table или 1Table. Границы ячеек и строк таблиц
+восстанавливаются по свойствам абзацев (PAPX FKP): признакам
+"абзац в таблице" (sprmPFInTable) и "конец строки таблицы" (sprmPFTtp).
+
+Модуль не использует внешних зависимостей и не держит состояния, поэтому
+его можно вызывать параллельно из потоков и процессов.
+"""
+
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+class DocFormatError(Exception):
+    """Файл не является корректным документом Word 97-2003."""
+
+
+class DocEncryptedError(DocFormatError):
+    """Документ зашифрован (защищен паролем)."""
+
+
+# ===== СОСТАВНОЙ ФАЙЛ OLE2 =====
+
+CFB_SIGNATURE = b"\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1"
+MAX_REGULAR_SECTOR = 0xFFFFFFFA
+DIR_ENTRY_SIZE = 128
+STREAM_OBJECT = 2
+ROOT_OBJECT = 5
+ROOT_ENTRY_NAME = "\x00root"
+
+
+def _uint32_array(data: bytes) -> array:
+    """Прочитать массив uint32 little-endian."""
+    values = array("I")
+    values.frombytes(data[:len(data) - len(data) % 4])
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+class CompoundFile:
+    """
+    Минимальный читатель составного файла OLE2: только чтение потоков по имени.
+    """
+
+    def __init__(self, data: bytes):
+        if len(data) < 512 or data[:8] != CFB_SIGNATURE:
+            raise DocFormatError("Файл не является документом OLE2")
+
+        self._data = data
+        self.sector_size = 1 << struct.unpack_from("<H", data, 0x1E)[0]
+        self.mini_sector_size = 1 << struct.unpack_from("<H", data, 0x20)[0]
+        (num_fat_sectors, first_dir_sector) = struct.unpack_from("<II", data, 0x2C)
+        (self.mini_stream_cutoff, first_mini_fat_sector, _num_mini_fat_sectors,
+         first_difat_sector, num_difat_sectors) = struct.unpack_from("<IIIII", data, 0x38)
+
+        # DIFAT: первые 109 записей в заголовке, остальные - цепочкой секторов
+        difat = list(struct.unpack_from("<109I", data, 0x4C))
+        entries_per_sector = self.sector_size // 4 - 1
+        sector = first_difat_sector
+        for _ in range(num_difat_sectors):
+            if sector >= MAX_REGULAR_SECTOR:
+                break
+            entries = _uint32_array(self._sector(sector))
+            difat.extend(entries[:entries_per_sector])
+            sector = entries[entries_per_sector]
+
+        fat_sectors = [s for s in difat[:num_fat_sectors] if s < MAX_REGULAR_SECTOR]
+        self._fat = _uint32_array(b"".join(self._sector(s) for s in fat_sectors))
+
+        self._entries = self._read_directory(self._read_chain(first_dir_sector, self._fat, self.sector_size))
+        root_start, root_size = self._entries.pop(ROOT_ENTRY_NAME)
+
+        self._mini_fat = _uint32_array(self._read_chain(first_mini_fat_sector, self._fat, self.sector_size))
+        self._mini_stream = self._read_chain(root_start, self._fat, self.sector_size)[:root_size]
+
+    def open_stream(self, name: str) -> bytes:
+        """
+        Прочитать поток по имени.
+
+        Args:
+            name: Имя потока (например, "WordDocument")
+
+        Returns:
+            Содержимое потока
+
+        Raises:
+            DocFormatError: Если поток не найден
+        """
+        entry = self._entries.get(name)
+        if entry is None:
+            raise DocFormatError(f"Поток {name} не найден")
+
+        start, size = entry
+        if size < self.mini_stream_cutoff:
+            data = self._read_chain(start, self._mini_fat, self.mini_sector_size, mini=True)
+        else:
+            data = self._read_chain(start, self._fat, self.sector_size)
+        return data[:size]
+
+    def _sector(self, sector: int) -> bytes:
+        """Прочитать обычный сектор по номеру."""
+        offset = (sector + 1) * self.sector_size
+        return self._data[offset:offset + self.sector_size]
+
+    def _read_chain(self, start: int, fat: array, sector_size: int, mini: bool = False) -> bytes:
+        """Прочитать цепочку секторов, начиная с start."""
+        parts = []
+        sector = start
+        # Ограничение длины цепочки защищает от зацикленных таблиц FAT
+        for _ in range(len(fat) + 1):
+            if sector >= MAX_REGULAR_SECTOR or sector >= len(fat):
+                break
+            if mini:
+                offset = sector * sector_size
+                parts.append(self._mini_stream[offset:offset + sector_size])
+            else:
+                parts.append(self._sector(sector))
+            sector = fat[sector]
+        return b"".join(parts)
+
+    def _read_directory(self, data: bytes) -> Dict[str, Tuple[int, int]]:
+        """
+        Разобрать каталог: имя -> (первый сектор, размер).
+
+        Возвращаются только потоки верхнего уровня (дочерние элементы корня),
+        чтобы не спутать их с потоками вложенных объектов (ObjectPool).
+        """
+        count = len(data) // DIR_ENTRY_SIZE
+        if count == 0:
+            raise DocFormatError("Каталог OLE2 пуст")
+
+        def entry(index: int) -> Tuple[str, int, int, int, int, int, int]:
+            offset = index * DIR_ENTRY_SIZE
+            name_length = struct.unpack_from("<H", data, offset + 0x40)[0]
+            name_length = min(max(name_length - 2, 0), 62)
+            name = data[offset:offset + name_length].decode("utf-16-le", errors="replace")
+            object_type = data[offset + 0x42]
+            left, right, child = struct.unpack_from("<III", data, offset + 0x44)
+            start, size = struct.unpack_from("<IQ", data, offset + 0x74)
+            if self.sector_size == 512:
+                # В версии 3 старшие 32 бита размера не используются
+                size &= 0xFFFFFFFF
+            return name, object_type, left, right, child, start, size
+
+        _, root_type, _, _, root_child, root_start, root_size = entry(0)
+        if root_type != ROOT_OBJECT:
+            raise DocFormatError("Корневой элемент OLE2 не найден")
+
+        entries = {ROOT_ENTRY_NAME: (root_start, root_size)}
+        pending = [root_child]
+        visited = set()
+        while pending:
+            index = pending.pop()
+            if index >= count or index in visited:
+                continue
+            visited.add(index)
+            name, object_type, left, right, _, start, size = entry(index)
+            if object_type == STREAM_OBJECT:
+                entries.setdefault(name, (start, size))
+            pending.extend((left, right))
+        return entries
+
+
+# ===== ДОКУМЕНТ WORD =====
+
+WORD_IDENT = 0xA5EC
+NFIB_WORD97 = 0xC1
+FIB_FLAG_ENCRYPTED = 0x0100
+FIB_FLAG_WHICH_TABLE = 0x0200
+
+# Индексы пар (fc, lcb) в FibRgFcLcb97
+FC_LCB_PLCF_BTE_PAPX = 13
+FC_LCB_CLX = 33
+
+# Свойства абзаца, определяющие разметку таблиц
+SPRM_P_F_IN_TABLE = 0x2416
+SPRM_P_F_TTP = 0x2417
+SPRM_P_F_INNER_TABLE_CELL = 0x244B
+SPRM_P_F_INNER_TTP = 0x244C
+SPRM_P_ITAP = 0x6649
+SPRM_T_DEF_TABLE = 0xD608
+SPRM_P_CHG_TABS = 0xC615
+
+# Размер операнда по полю spra (биты 13-15 кода sprm); 6 - переменный размер
+SPRA_OPERAND_SIZE = {0: 1, 1: 1, 2: 2, 3: 4, 4: 2, 5: 2, 7: 3}
+
+CELL_MARK = "\x07"
+PARAGRAPH_MARK = "\r"
+FIELD_BEGIN = "\x13"
+FIELD_SEPARATOR = "\x14"
+FIELD_END = "\x15"
+
+# Служебные символы Word, которые заменяются или удаляются из текста
+CONTROL_CHARS = str.maketrans({
+    "\x0b": "\n",   # Перенос строки
+    "\x0c": "\n",   # Разрыв страницы / раздела
+    "\x0e": "\n",   # Разрыв колонки
+    "\x1e": "-",    # Неразрывный дефис
+    "\x1f": None,   # Мягкий перенос
+    "\x00": None,
+    "\x01": None,   # Рисунок
+    "\x02": None,   # Сноска (ссылка)
+    "\x03": None,
+    "\x04": None,
+    "\x05": None,   # Примечание (ссылка)
+    "\x08": None,   # Графический объект
+})
+
+
+class _Piece:
+    """Фрагмент текста из таблицы фрагментов."""
+
+    __slots__ = ("cp_start", "cp_end", "fc", "compressed")
+
+    def __init__(self, cp_start: int, cp_end: int, fc: int, compressed: bool):
+        self.cp_start = cp_start
+        self.cp_end = cp_end
+        self.fc = fc
+        self.compressed = compressed
+
+
+def extract_doc(file_path: Path) -> Tuple[str, List[List[List[str]]]]:
+    """
+    Извлечь текст и таблицы из .doc файла.
+
+    Args:
+        file_path: Путь к файлу
+
+    Returns:
+        Кортеж (текст вне таблиц, таблицы). Таблица - список строк,
+        строка - список текстов ячеек.
+
+    Raises:
+        DocEncryptedError: Если документ защищен паролем
+        DocFormatError: Если файл поврежден или формат не поддерживается
+    """
+    with open(file_path, "rb") as f:
+        data = f.read()
+    return parse_doc_bytes(data)
+
+
+def parse_doc_bytes(data: bytes) -> Tuple[str, List[List[List[str]]]]:
+    """
+    Извлечь текст и таблицы из содержимого .doc файла.
+
+    Args:
+        data: Содержимое файла
+
+    Returns:
+        Кортеж (текст вне таблиц, таблицы)
+    """
+    try:
+        compound = CompoundFile(data)
+        word_stream = compound.open_stream("WordDocument")
+
+        ident, nfib = struct.unpack_from("<HH", word_stream, 0)
+        if ident != WORD_IDENT:
+            raise DocFormatError("Поток WordDocument поврежден")
+        if nfib < NFIB_WORD97:
+            raise DocFormatError("Формат Word 6.0/95 не поддерживается")
+
+        flags = struct.unpack_from("<H", word_stream, 0x0A)[0]
+        if flags & FIB_FLAG_ENCRYPTED:
+            raise DocEncryptedError("Документ зашифрован")
+
+        table_stream = compound.open_stream("1Table" if flags & FIB_FLAG_WHICH_TABLE else "0Table")
+
+        ccp_text, fc_lcb = _read_fib(word_stream)
+        fc_clx, lcb_clx = fc_lcb(FC_LCB_CLX)
+        pieces = _parse_clx(table_stream[fc_clx:fc_clx + lcb_clx]) if lcb_clx else []
+        if not pieces:
+            raise DocFormatError("Таблица фрагментов текста не найдена")
+
+        text = _read_text(word_stream, pieces, ccp_text)
+
+        fc_papx, lcb_papx = fc_lcb(FC_LCB_PLCF_BTE_PAPX)
+        papx_runs = _parse_papx(word_stream, table_stream[fc_papx:fc_papx + lcb_papx]) if lcb_papx else []
+
+    except (struct.error, IndexError, ValueError) as e:
+        raise DocFormatError(f"Файл поврежден: {e}")
+
+    return _build_structure(text, pieces, papx_runs)
+
+
+def _read_fib(word_stream: bytes):
+    """
+    Разобрать FIB: вернуть длину основного текста и функцию чтения пар (fc, lcb).
+    """
+    pos = 0x20
+    csw = struct.unpack_from("<H", word_stream, pos)[0]
+    pos += 2 + csw * 2
+
+    cslw = struct.unpack_from("<H", word_stream, pos)[0]
+    rglw_pos = pos + 2
+    ccp_text = struct.unpack_from("<i", word_stream, rglw_pos + 3 * 4)[0]
+    pos = rglw_pos + cslw * 4
+
+    cb_rg_fc_lcb = struct.unpack_from("<H", word_stream, pos)[0]
+    fc_lcb_pos = pos + 2
+
+    def fc_lcb(index: int) -> Tuple[int, int]:
+        if index >= cb_rg_fc_lcb:
+            return 0, 0
+        return struct.unpack_from("<II", word_stream, fc_lcb_pos + index * 8)
+
+    return max(ccp_text, 0), fc_lcb
+
+
+def _parse_clx(clx: bytes) -> List[_Piece]:
+    """Разобрать CLX и вернуть список фрагментов текста."""
+    pos = 0
+    # Пропустить блоки Prc (измененные свойства фрагментов)
+    while pos < len(clx) and clx[pos] == 0x01:
+        cb_grpprl = struct.unpack_from("<h", clx, pos + 1)[0]
+        pos += 3 + cb_grpprl
+
+    if pos >= len(clx) or clx[pos] != 0x02:
+        return []
+
+    lcb = struct.unpack_from("<I", clx, pos + 1)[0]
+    plc = clx[pos + 5:pos + 5 + lcb]
+    count = (len(plc) - 4) // 12
+    cps = struct.unpack_from(f"<{count + 1}I", plc, 0)
+
+    pieces = []
+    pcd_pos = (count + 1) * 4
+    for i in range(count):
+        fc_value = struct.unpack_from("<I", plc, pcd_pos + i * 8 + 2)[0]
+        compressed = bool(fc_value & 0x40000000)
+        fc = fc_value & 0x3FFFFFFF
+        if compressed:
+            fc //= 2
+        pieces.append(_Piece(cps[i], cps[i + 1], fc, compressed))
+    return pieces
+
+
+def _read_text(word_stream: bytes, pieces: List[_Piece], ccp_text: int) -> str:
+    """Собрать основной текст документа (без колонтитулов и сносок) из фрагментов."""
+    parts = []
+    for piece in pieces:
+        if piece.cp_start >= ccp_text:
+            break
+        char_count = min(piece.cp_end, ccp_text) - piece.cp_start
+        if piece.compressed:
+            raw = word_stream[piece.fc:piece.fc + char_count]
+            parts.append(raw.decode("cp1252", errors="replace"))
+        else:
+            raw = word_stream[piece.fc:piece.fc + char_count * 2]
+            parts.append(raw.decode("utf-16-le", errors="replace"))
+    return "".join(parts)
+
+
+def _parse_papx(word_stream: bytes, plc: bytes) -> List[Tuple[int, int, bytes]]:
+    """
+    Разобрать PlcBtePapx и страницы FKP.
+
+    Returns:
+        Отсортированный список (fc_начала, fc_конца, grpprl) для абзацев
+    """
+    count = (len(plc) - 4) // 8
+    if count <= 0:
+        return []
+
+    page_numbers = struct.unpack_from(f"<{count}I", plc, (count + 1) * 4)
+    runs = []
+    for page_number in page_numbers:
+        offset = (page_number & 0x3FFFFF) * 512
+        page = word_stream[offset:offset + 512]
+        if len(page) < 512:
+            continue
+
+        crun = page[511]
+        rgfc = struct.unpack_from(f"<{crun + 1}I", page, 0)
+        bx_pos = (crun + 1) * 4
+        for i in range(crun):
+            b_offset = page[bx_pos + i * 13]
+            grpprl = b""
+            if b_offset:
+                pos = b_offset * 2
+                cb = page[pos]
+                if cb == 0:
+                    size = page[pos + 1] * 2
+                    start = pos + 2
+                else:
+                    size = cb * 2 - 1
+                    start = pos + 1
+                # Первые 2 байта - istd (стиль абзаца)
+                grpprl = page[start + 2:start + size]
+            runs.append((rgfc[i], rgfc[i + 1], grpprl))
+
+    runs.sort(key=lambda run: run[0])
+    return runs
+
+
+def _table_flags(grpprl: bytes) -> Tuple[bool, bool]:
+    """
+    Определить признаки таблицы по свойствам абзаца.
+
+    Returns:
+        Кортеж (абзац в таблице, абзац - конец строки таблицы)
+    """
+    in_table = False
+    row_end = False
+    pos = 0
+    length = len(grpprl)
+
+    while pos + 2 <= length:
+        sprm = struct.unpack_from("<H", grpprl, pos)[0]
+        pos += 2
+        spra = sprm >> 13
+
+        if spra == 6:
+            if sprm == SPRM_T_DEF_TABLE:
+                if pos + 2 > length:
+                    break
+                size = struct.unpack_from("<H", grpprl, pos)[0] + 1
+            elif sprm == SPRM_P_CHG_TABS and pos < length and grpprl[pos] == 255:
+                # Редкий сложный формат табуляций - дальше свойства не разбираем
+                break
+            else:
+                if pos >= length:
+                    break
+                size = grpprl[pos] + 1
+        else:
+            size = SPRA_OPERAND_SIZE[spra]
+
+        operand = grpprl[pos:pos + size]
+        pos += size
+        if not operand:
+            break
+
+        if sprm in (SPRM_P_F_IN_TABLE, SPRM_P_F_INNER_TABLE_CELL):
+            in_table = operand[0] != 0
+        elif sprm in (SPRM_P_F_TTP, SPRM_P_F_INNER_TTP):
+            row_end = operand[0] != 0
+        elif sprm == SPRM_P_ITAP and len(operand) == 4:
+            in_table = struct.unpack("<i", operand)[0] > 0
+
+    return in_table, row_end
+
+
+class _FieldFilter:
+    """
+    Удаляет коды полей Word, оставляя их результат.
+
+    Поле имеет вид: \\x13 код \\x14 результат \\x15 (поля могут быть вложенными).
+    Состояние сохраняется между абзацами.
+    """
+
+    def __init__(self):
+        # Для каждого открытого поля: True, если уже идет результат
+        self._stack: List[bool] = []
+
+    def apply(self, text: str) -> str:
+        if not self._stack and FIELD_BEGIN not in text:
+            return text
+
+        result = []
+        for char in text:
+            if char == FIELD_BEGIN:
+                self._stack.append(False)
+            elif char == FIELD_SEPARATOR:
+                if self._stack:
+                    self._stack[-1] = True
+            elif char == FIELD_END:
+                if self._stack:
+                    self._stack.pop()
+            elif all(self._stack):
+                result.append(char)
+        return "".join(result)
+
+
+def _build_structure(text: str, pieces: List[_Piece], papx_runs: List[Tuple[int, int, bytes]]) -> Tuple[str, List[List[List[str]]]]:
+    """Разбить текст на абзацы и таблицы по признакам абзацев."""
+    piece_starts = [piece.cp_start for piece in pieces]
+    run_starts = [run[0] for run in papx_runs]
+    flags_cache: Dict[bytes, Tuple[bool, bool]] = {}
+
+    def paragraph_flags(cp: int, end_char: str, text_before: str) -> Tuple[bool, bool]:
+        if papx_runs:
+            piece = pieces[max(bisect_right(piece_starts, cp) - 1, 0)]
+            fc = piece.fc + (cp - piece.cp_start) * (1 if piece.compressed else 2)
+            index = bisect_right(run_starts, fc) - 1
+            if index >= 0 and fc < papx_runs[index][1]:
+                grpprl = papx_runs[index][2]
+                if grpprl not in flags_cache:
+                    flags_cache[grpprl] = _table_flags(grpprl)
+                return flags_cache[grpprl]
+        # Без свойств абзацев: ячейка заканчивается \x07,
+        # пустой абзац с \x07 после ячейки - конец строки
+        if end_char == CELL_MARK:
+            return True, text_before == "" and previous_was_cell[0]
+        return False, False
+
+    previous_was_cell = [False]
+    field_filter = _FieldFilter()
+
+    body_paragraphs: List[str] = []
+    tables: List[List[List[str]]] = []
+    current_table: Optional[List[List[str]]] = None
+    current_row: List[str] = []
+    cell_parts: List[str] = []
+
+    def close_table():
+        nonlocal current_table, current_row, cell_parts
+        if cell_parts:
+            current_row.append("\n".join(cell_parts))
+        if current_row and current_table is not None:
+            current_table.append(current_row)
+        if current_table:
+            tables.append(current_table)
+        current_table, current_row, cell_parts = None, [], []
+
+    start = 0
+    length = len(text)
+    while start < length:
+        cell_end = text.find(CELL_MARK, start)
+        paragraph_end = text.find(PARAGRAPH_MARK, start)
+        candidates = [pos for pos in (cell_end, paragraph_end) if pos != -1]
+        end = min(candidates) if candidates else length
+
+        raw = text[start:end]
+        end_char = text[end] if end < length else ""
+        in_table, row_end = paragraph_flags(end, end_char, raw) if end < length else (False, False)
+        paragraph = field_filter.apply(raw).translate(CONTROL_CHARS).strip()
+
+        if in_table:
+            if current_table is None:
+                current_table = []
+            if row_end:
+                if cell_parts:
+                    current_row.append("\n".join(cell_parts))
+                    cell_parts = []
+                current_table.append(current_row)
+                current_row = []
+                previous_was_cell[0] = False
+            elif end_char == CELL_MARK:
+                if paragraph:
+                    cell_parts.append(paragraph)
+                current_row.append("\n".join(cell_parts))
+                cell_parts = []
+                previous_was_cell[0] = True
+            elif paragraph:
+                cell_parts.append(paragraph)
+        else:
+            if current_table is not None:
+                close_table()
+            previous_was_cell[0] = False
+            if paragraph:
+                body_paragraphs.append(paragraph)
+
+        start = end + 1
+
+    if current_table is not None:
+        close_table()
+
+    return "\n".join(body_paragraphs), tables
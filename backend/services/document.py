@@ -1,37 +1,259 @@
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
 import tempfile
+import threading
 import os
+import sys
+from backend.services.cache import extraction_cache
+from backend.services.sandbox import (
+    extraction_sandbox, reset_process_limits,
+    SandboxError, SandboxTimeoutError, SandboxCrashError, SandboxJobError
+)
+from backend.services.settings import get_settings
+from backend.services.token_counter import count_tokens, count_message_tokens, get_document_token_limit
 
-def extract_text_from_file(file_path: Path, file_extension: str) -> Tuple[Optional[str], Optional[str]]:
+# Примерно 1500 токенов = 1 страница договора
+TOKENS_PER_PAGE = 1500
+
+# Версия формата извлеченного текста (увеличить при изменении алгоритмов извлечения)
+EXTRACTION_CACHE_VERSION = 2
+
+# Сколько символов накапливать перед подсчетом токенов при извлечении
+BUDGET_COUNT_CHARS = 32 * 1024
+
+class TextBudgetExceeded(Exception):
+    """Извлекаемый текст превысил лимит токенов документа."""
+    pass
+
+class TextBudget:
+    """
+    Счетчик символов и токенов текста по мере извлечения.
+
+    Извлечение передает текст по частям (страница, абзац, строка таблицы).
+    Токены считаются пачками по BUDGET_COUNT_CHARS символов, и как только
+    лимит превышен, выбрасывается TextBudgetExceeded - документ не
+    дочитывается до конца.
+    """
+
+    def __init__(self, max_tokens: int):
+        self.max_tokens = max_tokens
+        self.chars = 0
+        self.tokens = 0
+        self._pending: List[str] = []
+        self._pending_chars = 0
+
+    def add(self, text: str):
+        """
+        Учесть очередную часть текста.
+
+        Args:
+            text: Часть извлеченного текста
+
+        Raises:
+            TextBudgetExceeded: Если лимит токенов превышен
+        """
+        self.chars += len(text)
+        self._pending.append(text)
+        self._pending_chars += len(text)
+        if self._pending_chars >= BUDGET_COUNT_CHARS:
+            self.flush()
+
+    def flush(self):
+        """
+        Досчитать токены накопленного текста и проверить лимит.
+
+        Raises:
+            TextBudgetExceeded: Если лимит токенов превышен
+        """
+        if self._pending:
+            self.tokens += count_tokens("\n".join(self._pending))
+            self._pending = []
+            self._pending_chars = 0
+        if self.tokens > self.max_tokens:
+            raise TextBudgetExceeded(self.error_message())
+
+    def error_message(self) -> str:
+        """Сообщение об ошибке для пользователя."""
+        pages_estimate = self.tokens // TOKENS_PER_PAGE
+        pages_limit = self.max_tokens // TOKENS_PER_PAGE
+        return f"Документ слишком большой для обработки (более {pages_estimate} страниц, лимит: {pages_limit} страниц)."
+
+def extract_text_from_file(
+    file_path: Path,
+    file_extension: str,
+    content_hash: Optional[str] = None,
+    max_tokens: Optional[int] = None
+) -> Tuple[Optional[str], Optional[str]]:
     """
     Извлечь текст из файла в зависимости от расширения.
 
+    Если передан хэш содержимого, результат берется из кэша извлечения
+    (повторная загрузка того же файла не разбирается заново).
+
+    Если передан max_tokens, извлечение прерывается, как только текст
+    превысил лимит (большие PDF отклоняются еще до разбора по числу страниц).
+
     Args:
         file_path: Путь к файлу
         file_extension: Расширение файла (.doc, .docx, .pdf)
+        content_hash: SHA-256 содержимого файла (необязательно)
+        max_tokens: Лимит токенов документа (необязательно)
 
     Returns:
         Кортеж (текст, ошибка). Если успешно - (текст, None), если ошибка - (None, текст_ошибки)
     """
+    budget = TextBudget(max_tokens) if max_tokens is not None else None
+
+    if content_hash is None:
+        return _extract_text_isolated(file_path, file_extension, budget)
+
+    cache_key = get_extraction_cache_key(content_hash, file_extension)
+    cached_text = extraction_cache.get(cache_key)
+    if cached_text is not None:
+        return cached_text, None
+
+    text, error = _extract_text_isolated(file_path, file_extension, budget)
+    if text is not None:
+        extraction_cache.set(cache_key, text)
+    return text, error
+
+def get_extraction_cache_key(content_hash: str, file_extension: str) -> str:
+    """
+    Сформировать ключ кэша извлечения текста.
+
+    Args:
+        content_hash: SHA-256 содержимого файла
+        file_extension: Расширение файла
+
+    Returns:
+        Ключ кэша
+    """
+    return f"v{EXTRACTION_CACHE_VERSION}:{file_extension}:{get_extraction_engine(file_extension)}:{content_hash}"
+
+def get_extraction_engine(file_extension: str) -> str:
+    """
+    Получить имя движка извлечения для формата (движки дают разный текст).
+
+    Args:
+        file_extension: Расширение файла
+
+    Returns:
+        Имя движка
+    """
+    settings = get_settings()
+    if file_extension == ".docx":
+        return settings.get("docx_engine", "stream")
+    if file_extension == ".pdf":
+        return settings.get("pdf_engine", "pypdf2")
+    return "default"
+
+def _extract_text_isolated(file_path: Path, file_extension: str, budget: Optional[TextBudget] = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Извлечь текст в изолированном процессе с лимитами времени и памяти.
+
+    Если extraction_sandbox_enabled выключен, разбор идет в текущем процессе.
+    """
+    if not get_settings().get("extraction_sandbox_enabled", True):
+        return _extract_text_uncached(file_path, file_extension, budget)
+
+    try:
+        return extraction_sandbox.run(_extract_text_uncached, file_path, file_extension, budget)
+    except SandboxTimeoutError as e:
+        return None, f"Обработка файла заняла больше {e.timeout_seconds} с и была прервана. Возможно, файл поврежден."
+    except SandboxCrashError as e:
+        if e.cpu_limit_exceeded:
+            return None, "Обработка файла превысила лимит процессорного времени и была прервана. Возможно, файл поврежден."
+        return None, "Обработка файла аварийно завершилась (возможно, превышен лимит памяти). Попробуйте другой файл."
+    except SandboxJobError as e:
+        return None, f"Произошла ошибка при обработке файла: {str(e)}"
+    except SandboxError as e:
+        return None, f"Сервис обработки файлов недоступен: {str(e)}"
+
+def _extract_text_uncached(file_path: Path, file_extension: str, budget: Optional[TextBudget] = None) -> Tuple[Optional[str], Optional[str]]:
+    """Извлечь текст из файла без обращения к кэшу."""
     try:
         if file_extension == ".docx":
-            return extract_from_docx(file_path)
+            return extract_from_docx(file_path, budget)
         elif file_extension == ".doc":
-            return extract_from_doc(file_path)
+            return extract_from_doc(file_path, budget)
         elif file_extension == ".pdf":
-            return extract_from_pdf(file_path)
+            return extract_from_pdf(file_path, budget)
         else:
             return None, "Неподдерживаемый формат файла. Допустимы: .doc, .docx, .pdf"
+    except TextBudgetExceeded as e:
+        return None, str(e)
+    except MemoryError:
+        return None, "Обработка файла превысила лимит памяти. Попробуйте другой файл."
     except Exception as e:
         return None, f"Произошла ошибка при обработке файла: {str(e)}"
 
-def extract_from_docx(file_path: Path) -> Tuple[Optional[str], Optional[str]]:
+def extract_from_docx(file_path: Path, budget: Optional[TextBudget] = None) -> Tuple[Optional[str], Optional[str]]:
     """
     Извлечь текст из .docx файла.
 
+    Движок выбирается настройкой docx_engine:
+    - "stream" - потоковый разбор word/document.xml (быстро, без дублей объединенных ячеек)
+    - "python-docx" - через объектную модель python-docx
+
+    Args:
+        file_path: Путь к файлу
+        budget: Лимит токенов (необязательно)
+
+    Returns:
+        Кортеж (текст, ошибка)
+    """
+    if get_settings().get("docx_engine", "stream") == "python-docx":
+        return extract_from_docx_python_docx(file_path, budget)
+    return extract_from_docx_stream(file_path, budget)
+
+def extract_from_docx_stream(file_path: Path, budget: Optional[TextBudget] = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Извлечь текст из .docx файла потоковым разбором XML.
+
+    Args:
+        file_path: Путь к файлу
+        budget: Лимит токенов (разбор прерывается при превышении)
+
+    Returns:
+        Кортеж (текст, ошибка)
+    """
+    import zipfile
+    from xml.etree.ElementTree import ParseError
+    from backend.services.docx_stream import extract_docx_stream
+
+    try:
+        paragraphs_text, tables_text = extract_docx_stream(file_path, on_text=budget.add if budget else None)
+    except TextBudgetExceeded as e:
+        return None, str(e)
+    except zipfile.BadZipFile:
+        # Зашифрованный .docx хранится в контейнере OLE2, а не в zip
+        with open(file_path, "rb") as f:
+            if f.read(8) == b"\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1":
+                return None, "Файл защищен паролем. Снимите защиту и попробуйте снова."
+        return None, "Файл поврежден и не может быть обработан. Попробуйте другой файл."
+    except (KeyError, ParseError):
+        return None, "Файл поврежден и не может быть обработан. Попробуйте другой файл."
+    except Exception as e:
+        return None, f"Ошибка при чтении файла: {str(e)}"
+
+    # Объединить весь текст
+    full_text = "\n".join(paragraphs_text)
+    if tables_text:
+        full_text += "\n\n=== ТАБЛИЦЫ ===\n\n" + "\n".join(tables_text)
+
+    if not full_text.strip():
+        return None, "Файл не содержит текста или пуст."
+
+    return full_text, None
+
+def extract_from_docx_python_docx(file_path: Path, budget: Optional[TextBudget] = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Извлечь текст из .docx файла через python-docx.
+
     Args:
         file_path: Путь к файлу
+        budget: Лимит токенов (разбор прерывается при превышении)
 
     Returns:
         Кортеж (текст, ошибка)
@@ -46,6 +268,8 @@ def extract_from_docx(file_path: Path) -> Tuple[Optional[str], Optional[str]]:
         for para in doc.paragraphs:
             if para.text.strip():
                 paragraphs_text.append(para.text)
+                if budget:
+                    budget.add(para.text)
 
         # Извлечь текст из таблиц
         tables_text = []
@@ -57,6 +281,8 @@ def extract_from_docx(file_path: Path) -> Tuple[Optional[str], Optional[str]]:
                         row_text.append(cell.text)
                 if row_text:
                     tables_text.append(" | ".join(row_text))
+                    if budget:
+                        budget.add(tables_text[-1])
 
         # Объединить весь текст
         full_text = "\n".join(paragraphs_text)
@@ -68,6 +294,8 @@ def extract_from_docx(file_path: Path) -> Tuple[Optional[str], Optional[str]]:
 
         return full_text, None
 
+    except TextBudgetExceeded as e:
+        return None, str(e)
     except Exception as e:
         error_msg = str(e).lower()
         if "password" in error_msg or "encrypted" in error_msg:
@@ -77,7 +305,63 @@ def extract_from_docx(file_path: Path) -> Tuple[Optional[str], Optional[str]]:
         else:
             return None, f"Ошибка при чтении файла: {str(e)}"
 
-def extract_from_doc(file_path: Path) -> Tuple[Optional[str], Optional[str]]:
+def extract_from_doc(file_path: Path, budget: Optional[TextBudget] = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Извлечь текст из .doc файла (Word 97-2003).
+
+    Файл разбирается напрямую (формат OLE2 / WordDocument), без запуска
+    Microsoft Word. На Windows для файлов, которые не удалось разобрать
+    (например, Word 6.0/95), используется запасной путь через COM.
+
+    Args:
+        file_path: Путь к файлу
+        budget: Лимит токенов (таблицы не форматируются, если текст уже превышает лимит)
+
+    Returns:
+        Кортеж (текст, ошибка)
+    """
+    from backend.services.doc_binary import extract_doc, DocFormatError, DocEncryptedError
+
+    try:
+        body_text, tables = extract_doc(file_path)
+    except DocEncryptedError:
+        return None, "Файл защищен паролем. Снимите защиту и попробуйте снова."
+    except DocFormatError as e:
+        if sys.platform == "win32":
+            return extract_from_doc_com(file_path)
+        return None, f"Файл поврежден и не может быть обработан ({str(e)}). Попробуйте другой файл."
+    except Exception as e:
+        return None, f"Ошибка при чтении .doc файла: {str(e)}"
+
+    try:
+        if budget:
+            budget.add(body_text)
+
+        # Таблицы в том же формате, что и при извлечении через Word
+        tables_text = []
+        for table in tables:
+            table_content = []
+            for row in table:
+                row_text = [cell for cell in row if cell.strip()]
+                if row_text:
+                    table_content.append(" | ".join(row_text))
+                    if budget:
+                        budget.add(table_content[-1])
+            if table_content:
+                tables_text.append("\n".join(table_content))
+    except TextBudgetExceeded as e:
+        return None, str(e)
+
+    result_text = body_text.strip()
+    if tables_text:
+        result_text += "\n\n=== ТАБЛИЦЫ ===\n\n" + "\n\n".join(tables_text)
+
+    if not result_text.strip():
+        return None, "Файл не содержит текста или пуст."
+
+    return result_text, None
+
+def extract_from_doc_com(file_path: Path) -> Tuple[Optional[str], Optional[str]]:
     """
     Извлечь текст из .doc файла через COM (pywin32).
 
@@ -165,79 +449,233 @@ def extract_from_doc(file_path: Path) -> Tuple[Optional[str], Optional[str]]:
         else:
             return None, f"Ошибка при чтении .doc файла: {str(e)}"
 
-def extract_from_pdf(file_path: Path) -> Tuple[Optional[str], Optional[str]]:
+def extract_from_pdf(
+    file_path: Path,
+    budget: Optional[TextBudget] = None,
+    engine: Optional[str] = None
+) -> Tuple[Optional[str], Optional[str]]:
     """
     Извлечь текст из .pdf файла.
 
+    Движок извлечения выбирается настройкой pdf_engine (см. pdf_engines).
+    Если в настройках задано pdf_extraction_workers > 1, страницы больших
+    документов разбираются параллельно в пуле процессов.
+
+    Документ больше max_pdf_pages страниц отклоняется сразу, без разбора.
+
+    Страницы без текстового слоя (сканы) распознаются через OCR,
+    если он включен настройкой ocr_enabled (см. ocr).
+
     Args:
         file_path: Путь к файлу
+        budget: Лимит токенов (разбор прерывается при превышении)
+        engine: Имя движка (по умолчанию - из настроек)
 
     Returns:
         Кортеж (текст, ошибка)
     """
+    from backend.services.pdf_engines import get_pdf_engine, PdfEncryptedError
+
     try:
-        import PyPDF2
+        settings = get_settings()
+        pdf_engine = get_pdf_engine(engine or settings.get("pdf_engine", "pypdf2"))
 
-        with open(file_path, "rb") as f:
-            pdf_reader = PyPDF2.PdfReader(f)
+        with pdf_engine.open(file_path) as document:
+            num_pages = document.page_count
+            max_pages = settings.get("max_pdf_pages", 1000)
+            if max_pages and num_pages > max_pages:
+                return None, f"Документ слишком большой для обработки ({num_pages} страниц, лимит: {max_pages} страниц)."
 
-            # Проверка на защиту паролем
-            if pdf_reader.is_encrypted:
-                return None, "Файл защищен паролем. Снимите защиту и попробуйте снова."
+            workers = settings.get("pdf_extraction_workers", 0)
+            min_pages = settings.get("pdf_parallel_min_pages", 20)
 
             # Извлечь текст со всех страниц
-            text_parts = []
-            for page_num, page in enumerate(pdf_reader.pages, start=1):
-                page_text = page.extract_text()
-                if page_text.strip():
-                    text_parts.append(f"=== Страница {page_num} ===\n{page_text}")
-
-            full_text = "\n\n".join(text_parts)
+            if workers > 1 and num_pages >= min_pages:
+                pages = _extract_pdf_pages_parallel(file_path, num_pages, workers, pdf_engine.name, budget)
+            else:
+                pages = []
+                for page_index in range(num_pages):
+                    page_text = document.extract_page(page_index)
+                    if budget:
+                        budget.add(page_text)
+                    pages.append((page_index + 1, page_text))
+
+        # Распознать страницы без текстового слоя
+        empty_pages = [page_num - 1 for page_num, page_text in pages if not page_text.strip()]
+        ocr_error = None
+        if empty_pages and settings.get("ocr_enabled", True):
+            from backend.services.ocr import recognize_pdf_pages
+
+            recognized, ocr_error = recognize_pdf_pages(file_path, empty_pages, budget.add if budget else None)
+            if recognized:
+                pages = [
+                    (page_num, recognized.get(page_num - 1, page_text))
+                    for page_num, page_text in pages
+                ]
+
+        text_parts = []
+        for page_num, page_text in pages:
+            if page_text.strip():
+                text_parts.append(f"=== Страница {page_num} ===\n{page_text}")
+
+        full_text = "\n\n".join(text_parts)
 
-            if not full_text.strip():
-                return None, "PDF не содержит текстового слоя (возможно, это скан). Используйте .docx"
+        if not full_text.strip():
+            if ocr_error:
+                return None, f"PDF не содержит текстового слоя (возможно, это скан), а распознать его не удалось: {ocr_error}"
+            return None, "PDF не содержит текстового слоя (возможно, это скан). Используйте .docx"
 
-            return full_text, None
+        return full_text, None
 
+    except PdfEncryptedError:
+        return None, "Файл защищен паролем. Снимите защиту и попробуйте снова."
+    except TextBudgetExceeded as e:
+        return None, str(e)
     except Exception as e:
         error_msg = str(e).lower()
         if "password" in error_msg or "encrypted" in error_msg:
             return None, "Файл защищен паролем. Снимите защиту и попробуйте снова."
-        elif "corrupt" in error_msg or "invalid" in error_msg or "damaged" in error_msg:
+        elif any(marker in error_msg for marker in ("corrupt", "invalid", "damaged", "format error")):
             return None, "Файл поврежден и не может быть обработан. Попробуйте другой файл."
         else:
             return None, f"Ошибка при чтении PDF: {str(e)}"
 
-def estimate_token_count(text: str) -> int:
+# ===== ПАРАЛЛЕЛЬНОЕ ИЗВЛЕЧЕНИЕ PDF =====
+
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+_pdf_pool_workers = 0
+_pdf_pool_lock = threading.Lock()
+
+def _get_pdf_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Получить пул процессов для извлечения PDF (пересоздается при смене размера).
+
+    Args:
+        workers: Количество процессов
+
+    Returns:
+        Пул процессов
+    """
+    global _pdf_pool, _pdf_pool_workers
+
+    with _pdf_pool_lock:
+        if _pdf_pool is None or _pdf_pool_workers != workers:
+            if _pdf_pool is not None:
+                _pdf_pool.shutdown(wait=False)
+            _pdf_pool = ProcessPoolExecutor(max_workers=workers, initializer=reset_process_limits)
+            _pdf_pool_workers = workers
+        return _pdf_pool
+
+def shutdown_pdf_pool():
+    """Остановить пул процессов извлечения PDF (при завершении сервера)."""
+    global _pdf_pool
+
+    with _pdf_pool_lock:
+        if _pdf_pool is not None:
+            _pdf_pool.shutdown(wait=False, cancel_futures=True)
+            _pdf_pool = None
+
+def _extract_pdf_page_range(file_path: str, start: int, end: int, engine: str) -> List[Tuple[int, str]]:
+    """
+    Извлечь текст страниц [start, end) в отдельном процессе.
+
+    Args:
+        file_path: Путь к файлу
+        start: Индекс первой страницы (с 0)
+        end: Индекс страницы после последней
+        engine: Имя движка извлечения
+
+    Returns:
+        Список (номер_страницы, текст) с нумерацией страниц с 1
+    """
+    from backend.services.pdf_engines import get_pdf_engine
+
+    with get_pdf_engine(engine).open(Path(file_path)) as document:
+        return [
+            (page_index + 1, document.extract_page(page_index))
+            for page_index in range(start, end)
+        ]
+
+def _extract_pdf_pages_parallel(
+    file_path: Path,
+    num_pages: int,
+    workers: int,
+    engine: str,
+    budget: Optional[TextBudget] = None
+) -> List[Tuple[int, str]]:
+    """
+    Разбить страницы на диапазоны и извлечь их в пуле процессов.
+
+    Диапазонов вдвое больше, чем процессов, чтобы выровнять нагрузку
+    между страницами разной сложности. При превышении лимита токенов
+    еще не начатые диапазоны отменяются.
+
+    Args:
+        file_path: Путь к файлу
+        num_pages: Количество страниц
+        workers: Количество процессов
+        engine: Имя движка извлечения
+        budget: Лимит токенов (необязательно)
+
+    Returns:
+        Список (номер_страницы, текст) в порядке страниц
     """
-    Оценить количество токенов в тексте.
+    pool = _get_pdf_pool(workers)
+    range_size = max(1, -(-num_pages // (workers * 2)))
+
+    futures = [
+        pool.submit(_extract_pdf_page_range, str(file_path), start, min(start + range_size, num_pages), engine)
+        for start in range(0, num_pages, range_size)
+    ]
+
+    pages = []
+    try:
+        for future in futures:
+            page_range = future.result()
+            if budget:
+                for _, page_text in page_range:
+                    budget.add(page_text)
+            pages.extend(page_range)
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+    return pages
 
-    Используем простую эвристику: ~1 токен = 4 символа для русского текста.
+def estimate_token_count(text: str) -> int:
+    """
+    Посчитать количество токенов в тексте токенизатором текущей модели.
 
     Args:
         text: Текст для оценки
 
     Returns:
-        Примерное количество токенов
+        Количество токенов
     """
-    return len(text) // 4
+    return count_tokens(text)
 
-def check_text_size(text: str, max_tokens: int = 128000) -> Tuple[bool, Optional[str]]:
+def check_text_size(text: str, max_tokens: Optional[int] = None, prompt: Optional[str] = None) -> Tuple[bool, Optional[str]]:
     """
     Проверить размер текста на превышение лимита токенов.
 
+    Учитывается системный промпт (если передан). Документы больше контекста
+    модели допустимы, если включен анализ по частям (см. get_document_token_limit).
+
     Args:
         text: Текст для проверки
-        max_tokens: Максимальное количество токенов (по умолчанию 128K)
+        max_tokens: Максимальное количество токенов (по умолчанию - лимит документа)
+        prompt: Системный промпт, который будет отправлен вместе с текстом
 
     Returns:
         Кортеж (результат, ошибка). True если размер допустим, False если превышен
     """
-    token_count = estimate_token_count(text)
+    token_count = count_message_tokens(prompt or "", text)
+    budget = max_tokens if max_tokens is not None else get_document_token_limit()
 
-    if token_count > max_tokens:
-        pages_estimate = token_count // 1500  # Примерно 1500 токенов = 1 страница
-        return False, f"Документ слишком большой для обработки (примерно {pages_estimate} страниц, лимит: 100 страниц)."
+    if token_count > budget:
+        pages_estimate = token_count // TOKENS_PER_PAGE
+        pages_limit = budget // TOKENS_PER_PAGE
+        return False, f"Документ слишком большой для обработки (примерно {pages_estimate} страниц, лимит: {pages_limit} страниц)."
 
     return True, None
 
@@ -0,0 +1,163 @@
+"""
+Потоковое извлечение текста из .docx без построения объектной модели python-docx.
+
+word/document.xml читается прямо из zip-архива через iterparse: каждый
+абзац и каждая таблица верхнего уровня обрабатываются по мере разбора
+и сразу удаляются из дерева, поэтому память не растет с размером документа.
+
+Объединенные ячейки выводятся один раз: ячейка с gridSpan - одна ячейка,
+продолжение вертикального объединения (vMerge без "restart") пропускается.
+"""
+
+import zipfile
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+from xml.etree.ElementTree import iterparse
+
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+W_BODY = f"{W_NS}body"
+W_P = f"{W_NS}p"
+W_R = f"{W_NS}r"
+W_T = f"{W_NS}t"
+W_TAB = f"{W_NS}tab"
+W_PTAB = f"{W_NS}ptab"
+W_BR = f"{W_NS}br"
+W_CR = f"{W_NS}cr"
+W_NO_BREAK_HYPHEN = f"{W_NS}noBreakHyphen"
+W_HYPERLINK = f"{W_NS}hyperlink"
+W_TBL = f"{W_NS}tbl"
+W_TR = f"{W_NS}tr"
+W_TC = f"{W_NS}tc"
+W_TC_PR = f"{W_NS}tcPr"
+W_V_MERGE = f"{W_NS}vMerge"
+W_VAL = f"{W_NS}val"
+W_TYPE = f"{W_NS}type"
+
+DOCUMENT_PART = "word/document.xml"
+
+
+def _run_text(run) -> str:
+    """Текст run (w:r) по тем же правилам, что и python-docx."""
+    parts = []
+    for child in run:
+        tag = child.tag
+        if tag == W_T:
+            parts.append(child.text or "")
+        elif tag == W_TAB or tag == W_PTAB:
+            parts.append("\t")
+        elif tag == W_BR:
+            if child.get(W_TYPE, "textWrapping") == "textWrapping":
+                parts.append("\n")
+        elif tag == W_CR:
+            parts.append("\n")
+        elif tag == W_NO_BREAK_HYPHEN:
+            parts.append("-")
+    return "".join(parts)
+
+
+def paragraph_text(paragraph) -> str:
+    """
+    Текст абзаца (w:p), включая видимый текст гиперссылок.
+
+    Args:
+        paragraph: Элемент w:p
+
+    Returns:
+        Текст абзаца
+    """
+    parts = []
+    for child in paragraph:
+        if child.tag == W_R:
+            parts.append(_run_text(child))
+        elif child.tag == W_HYPERLINK:
+            for run in child.iter(W_R):
+                parts.append(_run_text(run))
+    return "".join(parts)
+
+
+def _is_merge_continuation(cell) -> bool:
+    """Проверить, является ли ячейка продолжением вертикального объединения."""
+    properties = cell.find(W_TC_PR)
+    if properties is None:
+        return False
+    v_merge = properties.find(W_V_MERGE)
+    if v_merge is None:
+        return False
+    return v_merge.get(W_VAL, "continue") != "restart"
+
+
+def extract_docx_stream(
+    file_path: Path,
+    on_text: Optional[Callable[[str], None]] = None
+) -> Tuple[List[str], List[str]]:
+    """
+    Извлечь абзацы и строки таблиц из .docx потоковым разбором.
+
+    Args:
+        file_path: Путь к файлу
+        on_text: Вызывается для каждого абзаца и строки таблицы по мере
+            разбора (исключение из него прерывает разбор)
+
+    Returns:
+        Кортеж (непустые абзацы вне таблиц, строки таблиц вида "A | B")
+
+    Raises:
+        zipfile.BadZipFile: Если файл не является zip-архивом
+        KeyError: Если в архиве нет word/document.xml
+    """
+    paragraphs: List[str] = []
+    table_rows: List[str] = []
+
+    with zipfile.ZipFile(file_path) as archive:
+        with archive.open(DOCUMENT_PART) as document_xml:
+            # Стек тегов открытых элементов
+            stack: List[str] = []
+            body = None
+            table_depth = 0
+            row_cells: List[str] = []
+
+            for event, element in iterparse(document_xml, events=("start", "end")):
+                tag = element.tag
+
+                if event == "start":
+                    stack.append(tag)
+                    if tag == W_BODY:
+                        body = element
+                    elif tag == W_TBL:
+                        table_depth += 1
+                    elif tag == W_TR and table_depth == 1:
+                        row_cells = []
+                    continue
+
+                stack.pop()
+                parent = stack[-1] if stack else None
+
+                if tag == W_P and parent == W_BODY:
+                    text = paragraph_text(element)
+                    if text.strip():
+                        paragraphs.append(text)
+                        if on_text:
+                            on_text(text)
+
+                elif tag == W_TC and table_depth == 1:
+                    if not _is_merge_continuation(element):
+                        cell_text = "\n".join(paragraph_text(p) for p in element.findall(W_P))
+                        if cell_text.strip():
+                            row_cells.append(cell_text)
+                    element.clear()
+
+                elif tag == W_TR and table_depth == 1:
+                    if row_cells:
+                        table_rows.append(" | ".join(row_cells))
+                        if on_text:
+                            on_text(table_rows[-1])
+                    element.clear()
+
+                elif tag == W_TBL:
+                    table_depth -= 1
+
+                # Освободить память от обработанных элементов верхнего уровня
+                if parent == W_BODY and body is not None:
+                    body.remove(element)
+
+    return paragraphs, table_rows
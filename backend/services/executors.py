@@ -0,0 +1,181 @@
+"""
+Вынос блокирующей работы из асинхронных обработчиков в пулы потоков.
+
+Два пула с отдельными размерами:
+- run_cpu - разбор и рендеринг документов, подсчет токенов, нормализация
+  текста (cpu_executor_workers, 0 - по числу ядер);
+- run_io - чтение и запись JSON-файлов (пользователи, авторизация,
+  настройки, статистика токенов), промптов и логов
+  (io_executor_workers, по умолчанию 16).
+
+Медленный экспорт в Word занимает поток CPU-пула и не задерживает
+проверку авторизации, которая идет через IO-пул. Загрузка пулов
+(занято, в очереди, время ожидания) доступна через get_executor_stats().
+
+Размеры пулов читаются из настроек при первом использовании; для
+изменения нужен перезапуск сервера.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from backend.services.settings import get_settings
+
+
+class InstrumentedExecutor:
+    """Пул потоков со счетчиками загрузки."""
+
+    def __init__(self, name: str, settings_key: str, default_workers: int):
+        self.name = name
+        self._settings_key = settings_key
+        self._default_workers = default_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._max_workers = 0
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queued = 0
+        self._peak_queued = 0
+        self._completed = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._total_run = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Создать пул при первом обращении."""
+        with self._lock:
+            if self._executor is None:
+                self._max_workers = self._configured_workers()
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._max_workers,
+                    thread_name_prefix=f"{self.name}-executor"
+                )
+            return self._executor
+
+    def _configured_workers(self) -> int:
+        """Размер пула из настроек (0 - значение по умолчанию)."""
+        workers = get_settings().get(self._settings_key) or self._default_workers
+        return max(int(workers), 1)
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """
+        Выполнить функцию в пуле и дождаться результата.
+
+        Args:
+            func: Блокирующая функция
+            *args: Позиционные аргументы
+            **kwargs: Именованные аргументы
+
+        Returns:
+            Результат функции
+        """
+        executor = self._get_executor()
+        submitted = time.perf_counter()
+
+        with self._lock:
+            self._queued += 1
+            self._peak_queued = max(self._peak_queued, self._queued)
+
+        def job():
+            started = time.perf_counter()
+            wait = started - submitted
+            with self._lock:
+                self._queued -= 1
+                self._active += 1
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._completed += 1
+                    self._total_run += time.perf_counter() - started
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, job)
+
+    def get_stats(self) -> Dict:
+        """
+        Получить статистику загрузки пула.
+
+        Returns:
+            Словарь: потоков, занято, в очереди (текущая и пиковая),
+            выполнено задач, среднее/максимальное ожидание и выполнение (мс)
+        """
+        with self._lock:
+            completed = self._completed
+            return {
+                "max_workers": self._max_workers or self._configured_workers(),
+                "active": self._active,
+                "queued": self._queued,
+                "peak_queued": self._peak_queued,
+                "completed": completed,
+                "saturated": self._max_workers > 0 and self._active >= self._max_workers,
+                "avg_wait_ms": round(self._total_wait / completed * 1000, 1) if completed else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 1),
+                "avg_run_ms": round(self._total_run / completed * 1000, 1) if completed else 0.0
+            }
+
+    def shutdown(self):
+        """Остановить пул (при завершении сервера)."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+cpu_executor = InstrumentedExecutor("cpu", "cpu_executor_workers", os.cpu_count() or 4)
+io_executor = InstrumentedExecutor("io", "io_executor_workers", 16)
+
+
+async def run_cpu(func: Callable, *args, **kwargs):
+    """
+    Выполнить CPU-емкую функцию (разбор, рендеринг, токенизация) в CPU-пуле.
+
+    Args:
+        func: Блокирующая функция
+        *args: Позиционные аргументы
+        **kwargs: Именованные аргументы
+
+    Returns:
+        Результат функции
+    """
+    return await cpu_executor.run(func, *args, **kwargs)
+
+
+async def run_io(func: Callable, *args, **kwargs):
+    """
+    Выполнить функцию с файловым вводом-выводом в IO-пуле.
+
+    Args:
+        func: Блокирующая функция
+        *args: Позиционные аргументы
+        **kwargs: Именованные аргументы
+
+    Returns:
+        Результат функции
+    """
+    return await io_executor.run(func, *args, **kwargs)
+
+
+def get_executor_stats() -> Dict:
+    """
+    Получить статистику загрузки пулов.
+
+    Returns:
+        Словарь {"cpu": {...}, "io": {...}}
+    """
+    return {
+        "cpu": cpu_executor.get_stats(),
+        "io": io_executor.get_stats()
+    }
+
+
+def shutdown_executors():
+    """Остановить пулы потоков (при завершении сервера)."""
+    cpu_executor.shutdown()
+    io_executor.shutdown()
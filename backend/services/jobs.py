@@ -0,0 +1,310 @@
+"""
+Фоновые задачи анализа и транскрибации.
+
+POST-запрос создает задачу и сразу возвращает ее id; работа идет в
+фоне (в тех же очередях и лимитах, что и обычные запросы) и не зависит
+от HTTP-соединения: обрыв связи или перезагрузка страницы не прерывают
+ее и не запускают повторно. Клиент получает состояние через
+GET /api/jobs/{id} и события через SSE-поток задачи, к которому можно
+подключиться заново - события отдаются с начала.
+
+Задача выполняется в процессе, который ее создал, а ее состояние
+сохраняется в общей базе процессов (shared_state): при запуске с
+несколькими процессами (--workers) запрос, попавший в другой процесс,
+получает состояние из базы, а вместо потока событий - смену этапов
+(проверка раз в JOB_POLL_SECONDS) и итоговый результат. Процесс
+продлевает свои выполняющиеся задачи; задачи остановленного или
+упавшего процесса завершаются с ошибкой (см. shared_state). Завершенные
+задачи удаляются через jobs_retention_minutes.
+"""
+
+import asyncio
+import time
+import uuid
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from backend.services.executors import run_io
+from backend.services.logger import log_error
+from backend.services.settings import get_settings
+from backend.services.shared_state import shared_state, LEASE_TTL_SECONDS
+from backend.services.single_flight import Flight
+
+# Событие задачи: (тип события SSE, данные)
+JobEvent = Tuple[str, Dict]
+
+# Период проверки состояния задачи другого процесса
+JOB_POLL_SECONDS = 1.0
+
+# Максимальная длительность потока событий задачи другого процесса;
+# затем поток закрывается, и клиент подключается заново
+JOB_REMOTE_EVENTS_MAX_SECONDS = 30 * 60
+
+# Период продления выполняющихся задач процесса
+JOB_HEARTBEAT_SECONDS = LEASE_TTL_SECONDS / 4
+
+
+class Job:
+    """Фоновая задача и ее состояние."""
+
+    def __init__(self, kind: str, username: str, filename: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.username = username
+        self.filename = filename
+        self.status = "queued"  # queued | running | done | error
+        self.stage = "Ожидание обработки"
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        # Функция, возвращающая позицию задачи в очереди (пока она ждет слот)
+        self.queue_position: Optional[Callable[[], Optional[int]]] = None
+        self._flight: Optional[Flight] = None
+
+    @property
+    def finished(self) -> bool:
+        """Задача завершена (успешно или с ошибкой)."""
+        return self.status in ("done", "error")
+
+    def events(self) -> AsyncIterator[JobEvent]:
+        """
+        Получить события задачи с начала (для SSE).
+
+        Yields:
+            События (тип, данные)
+        """
+        return self._flight.events()
+
+    def to_dict(self) -> Dict:
+        """
+        Состояние задачи для API.
+
+        Returns:
+            Словарь: id, тип, владелец, статус, этап, позиция в очереди,
+            результат, ошибка
+        """
+        position = self.queue_position() if self.queue_position and self.status == "queued" else None
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "username": self.username,
+            "status": self.status,
+            "stage": self.stage,
+            "queue_position": position,
+            "filename": self.filename,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at
+        }
+
+
+class JobManager:
+    """Реестр фоновых задач."""
+
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    async def create(self, kind: str, username: str, filename: str, runner: Callable[[Job], AsyncIterator[JobEvent]]) -> Job:
+        """
+        Создать и запустить задачу.
+
+        Runner выдает события задачи:
+        - ("status", {"stage", ["status"]}) - новый этап;
+        - ("done", {"result"}) - задача завершена с результатом;
+        - ("error", {"error"}) - задача завершена с ошибкой;
+        - остальные события (фрагменты результата) передаются клиенту как есть.
+
+        Args:
+            kind: Тип задачи ("analyze" или "transcribe")
+            username: Владелец задачи
+            filename: Имя загруженного файла
+            runner: Создает генератор событий задачи
+
+        Returns:
+            Задача
+        """
+        settings = await run_io(get_settings)
+        await self._cleanup(settings.get("jobs_retention_minutes", 60))
+        job = Job(kind, username, filename)
+        await self._save(job)
+        job._flight = Flight(job.id, self._run(job, runner(job)))
+        self._jobs[job.id] = job
+        if self._heartbeat is None or self._heartbeat.done():
+            self._heartbeat = asyncio.ensure_future(self._keep_alive())
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """
+        Получить задачу этого процесса по id.
+
+        Args:
+            job_id: Идентификатор задачи
+
+        Returns:
+            Задача или None (нет или выполняется в другом процессе)
+        """
+        return self._jobs.get(job_id)
+
+    async def get_state(self, job_id: str) -> Optional[Dict]:
+        """
+        Получить состояние задачи любого процесса сервера.
+
+        Args:
+            job_id: Идентификатор задачи
+
+        Returns:
+            Состояние задачи (Job.to_dict) или None
+        """
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        return await run_io(shared_state.job_get, job_id)
+
+    async def list_for_user(self, username: str) -> List[Dict]:
+        """
+        Получить задачи пользователя во всех процессах (новые первыми).
+
+        Args:
+            username: Имя пользователя
+
+        Returns:
+            Список состояний задач
+        """
+        states = {state["id"]: state for state in await run_io(shared_state.job_list, username)}
+        for job in self._jobs.values():
+            if job.username == username:
+                states[job.id] = job.to_dict()
+        return sorted(states.values(), key=lambda state: state["created_at"], reverse=True)
+
+    async def remote_events(self, job_id: str) -> AsyncIterator[JobEvent]:
+        """
+        Получить события задачи другого процесса по ее сохраненному состоянию.
+
+        Фрагменты результата другого процесса недоступны: отдаются смены
+        этапа и итоговое событие с полным результатом или ошибкой. Поток
+        закрывается без итогового события через
+        JOB_REMOTE_EVENTS_MAX_SECONDS - клиент подключается заново.
+
+        Args:
+            job_id: Идентификатор задачи
+
+        Yields:
+            События (тип, данные)
+        """
+        stage = None
+        deadline = time.monotonic() + JOB_REMOTE_EVENTS_MAX_SECONDS
+        while time.monotonic() < deadline:
+            state = await run_io(shared_state.job_get, job_id)
+            if state is None:
+                yield "error", {"error": "Задача не найдена"}
+                return
+            if state["status"] == "done":
+                yield "done", {"result": state["result"]}
+                return
+            if state["status"] == "error":
+                yield "error", {"error": state["error"]}
+                return
+            if state["stage"] != stage:
+                stage = state["stage"]
+                yield "status", {"stage": stage, "status": state["status"]}
+            await asyncio.sleep(JOB_POLL_SECONDS)
+
+    def get_stats(self) -> Dict:
+        """
+        Получить количество задач по статусам.
+
+        Returns:
+            Словарь {статус: количество}
+        """
+        stats = {"queued": 0, "running": 0, "done": 0, "error": 0}
+        for job in self._jobs.values():
+            stats[job.status] += 1
+        return stats
+
+    async def _run(self, job: Job, events: AsyncIterator[JobEvent]) -> AsyncIterator[JobEvent]:
+        """Выполнить задачу, обновляя ее состояние по событиям."""
+        try:
+            async for event, data in events:
+                if event == "status":
+                    job.status = data.get("status", "running")
+                    job.stage = data["stage"]
+                elif event == "done":
+                    job.result = data.get("result")
+                    job.status = "done"
+                    job.stage = "Готово"
+                elif event == "error":
+                    job.error = data["error"]
+                    job.status = "error"
+                    job.stage = "Ошибка"
+                if event in ("status", "done", "error"):
+                    if job.finished:
+                        job.finished_at = time.time()
+                    await self._save(job)
+                yield event, data
+        except Exception as e:
+            error_msg = f"Ошибка выполнения задачи: {str(e)}"
+            log_error(job.username, f"job_{job.kind}", error_msg)
+            job.error = error_msg
+            job.status = "error"
+            job.stage = "Ошибка"
+            job.finished_at = time.time()
+            await self._save(job)
+            yield "error", {"error": error_msg}
+        finally:
+            job.queue_position = None
+            if not job.finished:
+                # Источник закончился без результата
+                job.status = "error"
+                job.error = job.error or "Задача прервана"
+                job.finished_at = time.time()
+                await self._save(job)
+
+    def shutdown(self):
+        """Завершить с ошибкой незавершенные задачи процесса (при завершении сервера)."""
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+        try:
+            shared_state.job_release_owner()
+        except Exception as e:
+            # Задачи завершатся с ошибкой, когда истечет их продление
+            print(f"Ошибка завершения фоновых задач: {e}")
+
+    async def _keep_alive(self):
+        """Продлевать выполняющиеся задачи процесса, пока они есть."""
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            running = [job.id for job in self._jobs.values() if not job.finished]
+            if not running:
+                return
+            try:
+                await run_io(shared_state.job_heartbeat, running)
+            except Exception as e:
+                print(f"Ошибка продления фоновых задач: {e}")
+
+    async def _save(self, job: Job):
+        """Сохранить состояние задачи в общей базе процессов."""
+        try:
+            await run_io(
+                shared_state.job_save, job.id, job.username, job.to_dict(),
+                job.created_at, job.finished_at
+            )
+        except Exception as e:
+            log_error(job.username, f"job_{job.kind}", f"Ошибка сохранения состояния задачи: {str(e)}")
+
+    async def _cleanup(self, retention_minutes: int):
+        """Удалить завершенные задачи старше срока хранения."""
+        retention = retention_minutes * 60
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and now - job.finished_at > retention
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        await run_io(shared_state.job_cleanup, now - retention)
+
+
+# Глобальный реестр задач
+job_manager = JobManager()
@@ -1,8 +1,15 @@
 import json
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Iterator
 import threading
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 # Блокировки для безопасного доступа к файлам
 _locks: Dict[str, threading.Lock] = {}
 _locks_lock = threading.Lock()
@@ -15,6 +22,41 @@ def _get_lock(file_path: Path) -> threading.Lock:
             _locks[key] = threading.Lock()
         return _locks[key]
 
+@contextmanager
+def file_lock(file_path: Path) -> Iterator[None]:
+    """
+    Межпроцессная блокировка файла на время чтения-изменения-записи.
+
+    Блокируется файл-спутник "<имя>.lock" (write_json заменяет сам файл
+    новым, и блокировка на нем терялась бы), поэтому изменения не
+    затирают друг друга и между процессами сервера (--workers N).
+
+    Args:
+        file_path: Путь к защищаемому файлу
+    """
+    lock_path = file_path.with_name(file_path.name + ".lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with _get_lock(lock_path), open(lock_path, "a+b") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            while True:
+                try:
+                    # LK_LOCK ждет около 10 секунд, затем выбрасывает ошибку
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
 def read_json(file_path: Path, default: Any = None) -> Any:
     """
     Безопасное чтение JSON файла.
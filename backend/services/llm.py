@@ -1,15 +1,158 @@
-from typing import Optional, Tuple
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 import asyncio
+import httpx
 from openai import AsyncOpenAI
-from backend.services.llm_config import get_llm_config, get_current_llm_type
+from backend.services.llm_config import get_llm_config, get_current_llm_type, get_current_model_name, DEEPSEEK_MODEL
+from backend.services.token_counter import (
+    check_message_fits, count_tokens, count_message_tokens, get_input_budget, MAX_OUTPUT_TOKENS
+)
+from backend.services.chunking import split_text_into_chunks
 from backend.services.prompts import get_prompt
-from backend.services.tokens import track_tokens
+from backend.services.settings import get_settings
+from backend.services.tokens import track_tokens, track_cache_hit
+from backend.services.result_cache import result_cache, make_result_key
 from backend.services.logger import log_error
+from backend.services.executors import run_cpu, run_io
+
+# Температура генерации (входит в ключ кэша результатов)
+TEMPERATURE = 0.7
+
+# Инструкции, которые ставятся перед текстом в сообщении пользователя
+CONTRACT_INSTRUCTION = "Проанализируйте следующий договор:"
+MAP_INSTRUCTION = (
+    "Ниже приведена часть {index} из {total} большого договора. "
+    "Проанализируйте эту часть по тем же правилам. Укажите все существенные условия, "
+    "риски и ссылки на пункты, которые есть в этой части; не делайте выводов "
+    "о том, чего нет в этой части, - остальные части анализируются отдельно."
+)
+REDUCE_INSTRUCTION = (
+    "Ниже приведены результаты анализа последовательных частей одного договора. "
+    "Объедините их в единый итоговый анализ всего договора в требуемом формате: "
+    "устраните повторы, сведите одинаковые условия вместе и сохраните ссылки на пункты."
+)
+
+# ===== КЛИЕНТЫ LLM =====
+
+# Общий пул HTTP-соединений всех клиентов: keep-alive и TLS-сессии
+# переиспользуются между запросами
+_http_client: Optional[httpx.AsyncClient] = None
+
+# Клиенты по (бэкенд, base_url, ключ API)
+_llm_clients: Dict[Tuple[str, str, str], AsyncOpenAI] = {}
+
+def _get_http_client() -> httpx.AsyncClient:
+    """Получить общий HTTP-клиент (создается при первом запросе)."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60.0),
+            timeout=httpx.Timeout(180.0, connect=10.0),
+            follow_redirects=True
+        )
+    return _http_client
+
+def get_llm_client(backend: str, base_url: str, api_key: str) -> AsyncOpenAI:
+    """
+    Получить клиент OpenAI-совместимого API из реестра.
+
+    Клиенты создаются один раз на сочетание бэкенда, адреса и ключа и
+    используют общий пул соединений. Таймаут задается при каждом вызове.
+
+    Args:
+        backend: Тип LLM ("deepseek" или "lmstudio")
+        base_url: Адрес API
+        api_key: Ключ API
+
+    Returns:
+        Клиент AsyncOpenAI
+    """
+    key = (backend, base_url, api_key)
+    client = _llm_clients.get(key)
+    if client is None:
+        client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=_get_http_client())
+        _llm_clients[key] = client
+    return client
+
+def reset_llm_clients():
+    """
+    Сбросить реестр клиентов после изменения конфигурации LLM.
+
+    Общий пул соединений не закрывается: запросы, начатые со старыми
+    настройками, завершаются нормально.
+    """
+    _llm_clients.clear()
+
+async def close_llm_clients():
+    """Закрыть клиенты и пул соединений (при завершении сервера)."""
+    global _http_client
+    _llm_clients.clear()
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+# ===== КЭШ РЕЗУЛЬТАТОВ =====
+
+async def get_result_key(kind: str, text: str, prompt: str) -> str:
+    """
+    Ключ результата для текущей модели: одинаковый ключ - одинаковый
+    запрос к LLM (используется кэшем и объединением одинаковых запросов).
+
+    Args:
+        kind: Тип результата (тип анализа или "meeting_protocol")
+        text: Входной текст
+        prompt: Текст системного промпта
+
+    Returns:
+        Ключ результата
+    """
+    llm_type = await run_io(get_current_llm_type)
+    model = await run_io(get_current_model_name)
+    params = {"temperature": TEMPERATURE, "max_tokens": MAX_OUTPUT_TOKENS}
+    return await run_cpu(make_result_key, kind, text, prompt, f"{llm_type}:{model}", params)
+
+async def _result_cache_key(kind: str, text: str, prompt: str) -> Optional[str]:
+    """Ключ кэша результата (None, если кэш отключен)."""
+    settings = await run_io(get_settings)
+    if not settings.get("result_cache_enabled", True):
+        return None
+    return await get_result_key(kind, text, prompt)
+
+async def _get_cached_result(cache_key: Optional[str], username: str) -> Optional[str]:
+    """Взять результат из кэша и учесть попадание в статистике."""
+    if not cache_key:
+        return None
+    cached = await run_io(result_cache.get, cache_key)
+    if cached is not None:
+        await run_io(track_cache_hit, username)
+    return cached
+
+def check_context_budget(messages: list, model: str) -> Optional[str]:
+    """
+    Проверить, что запрос помещается в контекстное окно модели.
+
+    Args:
+        messages: Сообщения запроса (system + user)
+        model: Имя модели
+
+    Returns:
+        Текст ошибки или None, если запрос помещается
+    """
+    fits, tokens, budget = check_message_fits(messages[0]["content"], messages[1]["content"], model)
+    if not fits:
+        return f"Запрос не помещается в контекст модели {model}: {tokens} токенов при лимите {budget}."
+    return None
 
 async def analyze_contract(text: str, analysis_type: str, username: str) -> Tuple[Optional[str], Optional[str]]:
     """
     Анализировать договор через LLM.
 
+    Если договор не помещается в контекст модели, он анализируется по частям
+    (map-reduce): части обрабатываются параллельно, затем результаты
+    объединяются финальным запросом.
+
+    Результат кэшируется: повторный анализ того же текста с тем же
+    промптом и моделью не обращается к LLM.
+
     Args:
         text: Текст договора
         analysis_type: Тип анализа ("summary" или "legal_check")
@@ -19,21 +162,202 @@ async def analyze_contract(text: str, analysis_type: str, username: str) -> Tupl
         Кортеж (результат, ошибка)
     """
     # Получить промпт
-    prompt = get_prompt(analysis_type)
+    prompt = await run_io(get_prompt, analysis_type)
     if not prompt:
         return None, "Промпт не найден"
 
+    # Тот же договор с тем же промптом и моделью уже анализировался
+    cache_key = await _result_cache_key(analysis_type, text, prompt)
+    cached = await _get_cached_result(cache_key, username)
+    if cached is not None:
+        return cached, None
+
+    fits, _, _ = await run_cpu(check_message_fits, prompt, f"{CONTRACT_INSTRUCTION}\n\n{text}")
+    if fits:
+        result, error = await call_llm(prompt, text, username)
+    else:
+        settings = await run_io(get_settings)
+        if not settings.get("map_reduce_enabled", True):
+            return None, "Документ не помещается в контекст модели, а анализ по частям отключен."
+        result, error = await analyze_contract_map_reduce(prompt, text, username)
+
+    if result and cache_key:
+        await run_io(result_cache.set, cache_key, result)
+    return result, error
+
+async def analyze_contract_parts(text: str, parts: List[str], username: str) -> Tuple[Optional[Dict[str, str]], Optional[str]]:
+    """
+    Выполнить несколько типов анализа одного договора параллельно.
+
+    Время ответа - как у самого долгого анализа, а не их сумма.
+
+    Args:
+        text: Текст договора
+        parts: Типы анализа
+        username: Имя пользователя
+
+    Returns:
+        Кортеж (словарь {тип анализа: результат}, ошибка)
+    """
+    outcomes = await asyncio.gather(*(analyze_contract(text, part, username) for part in parts))
+
+    results = {}
+    for part, (result, error) in zip(parts, outcomes):
+        if error:
+            return None, error
+        results[part] = result
+    return results, None
+
+async def call_llm(prompt: str, text: str, username: str, instruction: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Вызвать текущую LLM (DeepSeek или LM Studio).
+
+    Args:
+        prompt: Системный промпт
+        text: Текст для анализа
+        username: Имя пользователя
+        instruction: Инструкция перед текстом (по умолчанию - анализ договора)
+
+    Returns:
+        Кортеж (результат, ошибка)
+    """
+    instruction = instruction or CONTRACT_INSTRUCTION
+
     # Определить тип LLM
-    llm_type = get_current_llm_type()
+    llm_type = await run_io(get_current_llm_type)
 
     if llm_type == "deepseek":
-        return await call_deepseek_api(prompt, text, username)
+        return await call_deepseek_api(prompt, text, username, instruction)
     elif llm_type == "lmstudio":
-        return await call_lmstudio_api(prompt, text, username)
+        return await call_lmstudio_api(prompt, text, username, instruction)
     else:
         return None, f"Неизвестный тип LLM: {llm_type}"
 
-async def call_deepseek_api(prompt: str, text: str, username: str) -> Tuple[Optional[str], Optional[str]]:
+# ===== АНАЛИЗ ПО ЧАСТЯМ (MAP-REDUCE) =====
+
+class ChunkCallLimiter:
+    """
+    Общий для всех запросов процесса лимит одновременных обращений к LLM
+    по частям большого договора (map_reduce_concurrency).
+
+    Лимит общий, а не на запрос: иначе каждый слот очереди анализа
+    запускал бы до map_reduce_concurrency обращений, и нагрузку на LLM
+    ограничивала бы не очередь, а их произведение. Лимит обновляется
+    при каждом запуске анализа по частям.
+    """
+
+    def __init__(self):
+        self.limit = 5
+        self._active = 0
+        self._condition: Optional[asyncio.Condition] = None
+
+    async def __aenter__(self):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._active < max(self.limit, 1))
+            self._active += 1
+
+    async def __aexit__(self, *exc_info):
+        async with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+# Лимит обращений по частям для всех запросов процесса
+chunk_call_limiter = ChunkCallLimiter()
+
+async def analyze_contract_map_reduce(prompt: str, text: str, username: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Анализировать большой договор по частям.
+
+    Args:
+        prompt: Системный промпт анализа
+        text: Текст договора
+        username: Имя пользователя
+
+    Returns:
+        Кортеж (результат, ошибка)
+    """
+    combined, error = await _map_partials(prompt, text, username)
+    if error:
+        return None, error
+    return await call_llm(prompt, combined, username, REDUCE_INSTRUCTION)
+
+async def _map_partials(prompt: str, text: str, username: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Проанализировать части большого договора и подготовить их результаты
+    к финальному объединению.
+
+    Текст делится по границам разделов/страниц, части анализируются
+    параллельно (не более map_reduce_concurrency обращений одновременно
+    на все запросы процесса, см. ChunkCallLimiter), затем частичные результаты объединяются. Если частичные результаты
+    сами не помещаются в контекст, объединение выполняется в несколько уровней.
+
+    Args:
+        prompt: Системный промпт анализа
+        text: Текст договора
+        username: Имя пользователя
+
+    Returns:
+        Кортеж (текст для финального объединения, ошибка)
+    """
+    settings = await run_io(get_settings)
+    chunk_call_limiter.limit = settings.get("map_reduce_concurrency", settings.get("max_concurrent_requests", 5))
+
+    chunk_budget = await run_cpu(_chunk_token_budget, prompt, MAP_INSTRUCTION)
+    chunks = await run_cpu(split_text_into_chunks, text, chunk_budget)
+    total = len(chunks)
+
+    async def analyze_chunk(index: int, chunk: str) -> Tuple[Optional[str], Optional[str]]:
+        async with chunk_call_limiter:
+            instruction = MAP_INSTRUCTION.format(index=index, total=total)
+            return await call_llm(prompt, chunk, username, instruction)
+
+    results = await asyncio.gather(*(analyze_chunk(i, chunk) for i, chunk in enumerate(chunks, start=1)))
+
+    partials = []
+    for index, (result, error) in enumerate(results, start=1):
+        if error:
+            return None, f"Ошибка при анализе части {index} из {total}: {error}"
+        partials.append(f"### Часть {index} из {total}\n\n{result}")
+
+    return await _combine_partials(prompt, partials, username)
+
+async def _combine_partials(prompt: str, partials: List[str], username: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Свести частичные результаты к тексту для финального объединения
+    (при необходимости - через промежуточные уровни).
+    """
+    reduce_budget = await run_cpu(_chunk_token_budget, prompt, REDUCE_INSTRUCTION)
+
+    while True:
+        combined = "\n\n".join(partials)
+        if await run_cpu(count_tokens, combined) <= reduce_budget or len(partials) == 1:
+            return combined, None
+
+        # Промежуточный уровень: объединить группы частичных результатов
+        groups = await run_cpu(split_text_into_chunks, combined, reduce_budget)
+        if len(groups) >= len(partials):
+            # Группировка не уменьшает объем - объединяем как есть
+            return combined, None
+
+        async def reduce_group(group: str) -> Tuple[Optional[str], Optional[str]]:
+            async with chunk_call_limiter:
+                return await call_llm(prompt, group, username, REDUCE_INSTRUCTION)
+
+        results = await asyncio.gather(*(reduce_group(group) for group in groups))
+        partials = []
+        for index, (result, error) in enumerate(results, start=1):
+            if error:
+                return None, f"Ошибка при объединении результатов: {error}"
+            partials.append(f"### Сводка {index} из {len(results)}\n\n{result}")
+
+def _chunk_token_budget(prompt: str, instruction: str) -> int:
+    """Бюджет токенов на текст одной части с учетом промпта, инструкции и запаса 10%."""
+    overhead = count_message_tokens(prompt, instruction)
+    return int((get_input_budget() - overhead) * 0.9)
+
+async def call_deepseek_api(prompt: str, text: str, username: str, instruction: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
     """
     Вызвать DeepSeek API.
 
@@ -41,38 +365,41 @@ async def call_deepseek_api(prompt: str, text: str, username: str) -> Tuple[Opti
         prompt: Системный промпт
         text: Текст договора
         username: Имя пользователя
+        instruction: Инструкция перед текстом (по умолчанию - анализ договора)
 
     Returns:
         Кортеж (результат, ошибка)
     """
     try:
         from backend.config import DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL
-        config = get_llm_config()
+        config = await run_io(get_llm_config)
         api_key = DEEPSEEK_API_KEY or config.get("deepseek_api_key", "")
         base_url = DEEPSEEK_BASE_URL or config.get("deepseek_base_url", "https://api.deepseek.com")
 
         if not api_key:
             return None, "API ключ DeepSeek не настроен"
 
-        # Создать асинхронный клиент OpenAI (совместимость с DeepSeek)
-        client = AsyncOpenAI(
-            api_key=api_key,
-            base_url=base_url,
-            timeout=60.0
-        )
+        # Клиент OpenAI из реестра (совместимость с DeepSeek)
+        client = get_llm_client("deepseek", base_url, api_key)
 
         # Формирование запроса
         messages = [
             {"role": "system", "content": prompt},
-            {"role": "user", "content": f"Проанализируйте следующий договор:\n\n{text}"}
+            {"role": "user", "content": f"{instruction or CONTRACT_INSTRUCTION}\n\n{text}"}
         ]
 
+        # Не отправлять запрос, который заведомо не поместится в контекст
+        budget_error = await run_cpu(check_context_budget, messages, DEEPSEEK_MODEL)
+        if budget_error:
+            return None, budget_error
+
         # Вызов API асинхронно
         response = await client.chat.completions.create(
-            model="deepseek-chat",
+            model=DEEPSEEK_MODEL,
             messages=messages,
-            temperature=0.7,
-            max_tokens=4000
+            temperature=TEMPERATURE,
+            max_tokens=MAX_OUTPUT_TOKENS,
+            timeout=60.0
         )
 
         # Извлечение результата
@@ -81,7 +408,7 @@ async def call_deepseek_api(prompt: str, text: str, username: str) -> Tuple[Opti
         # Учет токенов
         prompt_tokens = response.usage.prompt_tokens
         completion_tokens = response.usage.completion_tokens
-        track_tokens(username, prompt_tokens, completion_tokens)
+        await run_io(track_tokens, username, prompt_tokens, completion_tokens)
 
         return result, None
 
@@ -90,7 +417,7 @@ async def call_deepseek_api(prompt: str, text: str, username: str) -> Tuple[Opti
         log_error(username, "deepseek_api_call", error_msg)
         return None, error_msg
 
-async def call_lmstudio_api(prompt: str, text: str, username: str) -> Tuple[Optional[str], Optional[str]]:
+async def call_lmstudio_api(prompt: str, text: str, username: str, instruction: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
     """
     Вызвать LM Studio API.
 
@@ -98,34 +425,36 @@ async def call_lmstudio_api(prompt: str, text: str, username: str) -> Tuple[Opti
         prompt: Системный промпт
         text: Текст договора
         username: Имя пользователя (токены не учитываются для локальной LLM)
+        instruction: Инструкция перед текстом (по умолчанию - анализ договора)
 
     Returns:
         Кортеж (результат, ошибка)
     """
     try:
-        config = get_llm_config()
+        config = await run_io(get_llm_config)
         base_url = config.get("lmstudio_base_url", "http://localhost:1234/v1")
         model = config.get("lmstudio_model", "deepseek-coder")
 
-        # Создать асинхронный клиент OpenAI (совместимость с LM Studio)
-        client = AsyncOpenAI(
-            api_key="not-needed",  # LM Studio не требует ключ
-            base_url=base_url,
-            timeout=180.0  # Увеличенный таймаут для локальной обработки
-        )
+        # Клиент OpenAI из реестра (совместимость с LM Studio)
+        client = get_llm_client("lmstudio", base_url, "not-needed")  # LM Studio не требует ключ
 
         # Формирование запроса
         messages = [
             {"role": "system", "content": prompt},
-            {"role": "user", "content": f"Проанализируйте следующий договор:\n\n{text}"}
+            {"role": "user", "content": f"{instruction or CONTRACT_INSTRUCTION}\n\n{text}"}
         ]
 
+        budget_error = await run_cpu(check_context_budget, messages, model)
+        if budget_error:
+            return None, budget_error
+
         # Вызов API асинхронно
         response = await client.chat.completions.create(
             model=model,
             messages=messages,
-            temperature=0.7,
-            max_tokens=4000
+            temperature=TEMPERATURE,
+            max_tokens=MAX_OUTPUT_TOKENS,
+            timeout=180.0  # Увеличенный таймаут для локальной обработки
         )
 
         # Извлечение результата
@@ -157,54 +486,64 @@ async def generate_meeting_protocol(transcription: str, username: str) -> Tuple[
     Returns:
         Кортеж (протокол, ошибка)
     """
-    prompt = get_prompt("meeting_protocol")
+    prompt = await run_io(get_prompt, "meeting_protocol")
     if not prompt:
         return None, "Промпт для протокола не найден"
     
-    llm_type = get_current_llm_type()
+    cache_key = await _result_cache_key("meeting_protocol", transcription, prompt)
+    cached = await _get_cached_result(cache_key, username)
+    if cached is not None:
+        return cached, None
+    
+    llm_type = await run_io(get_current_llm_type)
     
     if llm_type == "deepseek":
-        return await call_deepseek_protocol(prompt, transcription, username)
+        result, error = await call_deepseek_protocol(prompt, transcription, username)
     elif llm_type == "lmstudio":
-        return await call_lmstudio_protocol(prompt, transcription, username)
+        result, error = await call_lmstudio_protocol(prompt, transcription, username)
     else:
         return None, f"Неизвестный тип LLM: {llm_type}"
+    
+    if result and cache_key:
+        await run_io(result_cache.set, cache_key, result)
+    return result, error
 
 
 async def call_deepseek_protocol(prompt: str, transcription: str, username: str) -> Tuple[Optional[str], Optional[str]]:
     """Вызов DeepSeek API для генерации протокола."""
     try:
         from backend.config import DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL
-        config = get_llm_config()
+        config = await run_io(get_llm_config)
         api_key = DEEPSEEK_API_KEY or config.get("deepseek_api_key", "")
         base_url = DEEPSEEK_BASE_URL or config.get("deepseek_base_url", "https://api.deepseek.com")
         
         if not api_key:
             return None, "API ключ DeepSeek не настроен"
         
-        client = AsyncOpenAI(
-            api_key=api_key,
-            base_url=base_url,
-            timeout=120.0
-        )
+        client = get_llm_client("deepseek", base_url, api_key)
         
         messages = [
             {"role": "system", "content": prompt},
             {"role": "user", "content": transcription}
         ]
         
+        budget_error = await run_cpu(check_context_budget, messages, DEEPSEEK_MODEL)
+        if budget_error:
+            return None, budget_error
+        
         response = await client.chat.completions.create(
-            model="deepseek-chat",
+            model=DEEPSEEK_MODEL,
             messages=messages,
-            temperature=0.7,
-            max_tokens=4000
+            temperature=TEMPERATURE,
+            max_tokens=MAX_OUTPUT_TOKENS,
+            timeout=120.0
         )
         
         result = response.choices[0].message.content
         
         prompt_tokens = response.usage.prompt_tokens
         completion_tokens = response.usage.completion_tokens
-        track_tokens(username, prompt_tokens, completion_tokens)
+        await run_io(track_tokens, username, prompt_tokens, completion_tokens)
         
         return result, None
         
@@ -217,26 +556,27 @@ async def call_deepseek_protocol(prompt: str, transcription: str, username: str)
 async def call_lmstudio_protocol(prompt: str, transcription: str, username: str) -> Tuple[Optional[str], Optional[str]]:
     """Вызов LM Studio API для генерации протокола."""
     try:
-        config = get_llm_config()
+        config = await run_io(get_llm_config)
         base_url = config.get("lmstudio_base_url", "http://localhost:1234/v1")
         model = config.get("lmstudio_model", "deepseek-coder")
         
-        client = AsyncOpenAI(
-            api_key="not-needed",
-            base_url=base_url,
-            timeout=180.0
-        )
+        client = get_llm_client("lmstudio", base_url, "not-needed")
         
         messages = [
             {"role": "system", "content": prompt},
             {"role": "user", "content": transcription}
         ]
         
+        budget_error = await run_cpu(check_context_budget, messages, model)
+        if budget_error:
+            return None, budget_error
+        
         response = await client.chat.completions.create(
             model=model,
             messages=messages,
-            temperature=0.7,
-            max_tokens=4000
+            temperature=TEMPERATURE,
+            max_tokens=MAX_OUTPUT_TOKENS,
+            timeout=180.0
         )
         
         result = response.choices[0].message.content
@@ -245,4 +585,228 @@ async def call_lmstudio_protocol(prompt: str, transcription: str, username: str)
     except Exception as e:
         error_msg = f"Ошибка при генерации протокола через LM Studio: {str(e)}"
         log_error(username, "lmstudio_protocol", error_msg)
-        return None, error_msg
\ No newline at end of file
+        return None, error_msg
+
+# ===== ПОТОКОВАЯ ГЕНЕРАЦИЯ =====
+
+class LLMStreamError(Exception):
+    """Ошибка потоковой генерации (текст - для пользователя)."""
+    pass
+
+async def stream_llm(prompt: str, user_content: str, username: str, operation: str) -> AsyncIterator[str]:
+    """
+    Вызвать текущую LLM в потоковом режиме.
+
+    Фрагменты ответа отдаются по мере генерации. Таймаут действует на
+    ожидание каждого фрагмента, а не на весь ответ, поэтому длинный ответ
+    не обрывается. Токены DeepSeek учитываются по usage из последнего
+    фрагмента потока.
+
+    Args:
+        prompt: Системный промпт
+        user_content: Сообщение пользователя (инструкция и текст)
+        username: Имя пользователя
+        operation: Имя операции для журнала ошибок
+
+    Yields:
+        Фрагменты ответа
+
+    Raises:
+        LLMStreamError: Ошибка конфигурации или обращения к LLM
+    """
+    config = await run_io(get_llm_config)
+    llm_type = config.get("llm_type", "deepseek")
+
+    if llm_type == "deepseek":
+        from backend.config import DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL
+        api_key = DEEPSEEK_API_KEY or config.get("deepseek_api_key", "")
+        base_url = DEEPSEEK_BASE_URL or config.get("deepseek_base_url", "https://api.deepseek.com")
+        if not api_key:
+            raise LLMStreamError("API ключ DeepSeek не настроен")
+        client = get_llm_client("deepseek", base_url, api_key)
+        model = DEEPSEEK_MODEL
+        timeout = 60.0
+        # Последний фрагмент потока содержит usage - для учета токенов
+        extra = {"stream_options": {"include_usage": True}}
+    elif llm_type == "lmstudio":
+        base_url = config.get("lmstudio_base_url", "http://localhost:1234/v1")
+        client = get_llm_client("lmstudio", base_url, "not-needed")
+        model = config.get("lmstudio_model", "deepseek-coder")
+        timeout = 180.0
+        # Примечание: токены НЕ учитываются для локальной LLM
+        extra = {}
+    else:
+        raise LLMStreamError(f"Неизвестный тип LLM: {llm_type}")
+
+    messages = [
+        {"role": "system", "content": prompt},
+        {"role": "user", "content": user_content}
+    ]
+
+    budget_error = await run_cpu(check_context_budget, messages, model)
+    if budget_error:
+        raise LLMStreamError(budget_error)
+
+    usage = None
+    stream = None
+    try:
+        stream = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=TEMPERATURE,
+            max_tokens=MAX_OUTPUT_TOKENS,
+            stream=True,
+            timeout=timeout,
+            **extra
+        )
+        async for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    except Exception as e:
+        error_msg = f"Ошибка при обращении к LLM: {str(e)}"
+        log_error(username, operation, error_msg)
+        if llm_type == "lmstudio" and ("Connection" in str(e) or "refused" in str(e)):
+            error_msg += "\n\nУбедитесь, что LM Studio запущен и сервер активен."
+        raise LLMStreamError(error_msg)
+    finally:
+        if stream is not None:
+            # При отмене (клиент отключился) закрыть соединение, чтобы
+            # сервер LLM прекратил генерацию
+            await stream.close()
+        if usage is not None and llm_type == "deepseek":
+            await run_io(track_tokens, username, usage.prompt_tokens, usage.completion_tokens)
+
+async def stream_analyze_contract(text: str, analysis_type: str, username: str) -> AsyncIterator[Tuple[str, str]]:
+    """
+    Анализировать договор с потоковой выдачей результата.
+
+    Большой договор сначала анализируется по частям (без потока), затем
+    в потоке выдается финальное объединение.
+
+    Args:
+        text: Текст договора
+        analysis_type: Тип анализа ("summary" или "legal_check")
+        username: Имя пользователя
+
+    Yields:
+        События ("status", сообщение) и ("delta", фрагмент результата)
+
+    Raises:
+        LLMStreamError: Ошибка анализа
+    """
+    prompt = await run_io(get_prompt, analysis_type)
+    if not prompt:
+        raise LLMStreamError("Промпт не найден")
+
+    cache_key = await _result_cache_key(analysis_type, text, prompt)
+    cached = await _get_cached_result(cache_key, username)
+    if cached is not None:
+        yield "delta", cached
+        return
+
+    user_content = f"{CONTRACT_INSTRUCTION}\n\n{text}"
+    fits, _, _ = await run_cpu(check_message_fits, prompt, user_content)
+    if not fits:
+        settings = await run_io(get_settings)
+        if not settings.get("map_reduce_enabled", True):
+            raise LLMStreamError("Документ не помещается в контекст модели, а анализ по частям отключен.")
+
+        yield "status", "Документ большой - анализируем по частям..."
+        combined, error = await _map_partials(prompt, text, username)
+        if error:
+            raise LLMStreamError(error)
+        yield "status", "Объединяем результаты частей..."
+        user_content = f"{REDUCE_INSTRUCTION}\n\n{combined}"
+
+    parts = []
+    async for delta in stream_llm(prompt, user_content, username, "llm_stream"):
+        parts.append(delta)
+        yield "delta", delta
+
+    # В кэш попадает только полностью полученный результат
+    if parts and cache_key:
+        await run_io(result_cache.set, cache_key, "".join(parts))
+
+async def stream_meeting_protocol(transcription: str, username: str) -> AsyncIterator[str]:
+    """
+    Генерировать протокол совещания с потоковой выдачей.
+
+    Args:
+        transcription: Текст транскрипции
+        username: Имя пользователя (для учета токенов)
+
+    Yields:
+        Фрагменты протокола
+
+    Raises:
+        LLMStreamError: Ошибка генерации
+    """
+    prompt = await run_io(get_prompt, "meeting_protocol")
+    if not prompt:
+        raise LLMStreamError("Промпт для протокола не найден")
+
+    cache_key = await _result_cache_key("meeting_protocol", transcription, prompt)
+    cached = await _get_cached_result(cache_key, username)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    async for delta in stream_llm(prompt, transcription, username, "protocol_stream"):
+        parts.append(delta)
+        yield delta
+
+    if parts and cache_key:
+        await run_io(result_cache.set, cache_key, "".join(parts))
+
+async def stream_analyze_parts(text: str, parts: List[str], username: str) -> AsyncIterator[Tuple[str, str, Optional[str]]]:
+    """
+    Выполнить несколько типов анализа параллельно с потоковой выдачей.
+
+    Фрагменты разных анализов приходят вперемешку, по мере генерации.
+
+    Args:
+        text: Текст договора
+        parts: Типы анализа
+        username: Имя пользователя
+
+    Yields:
+        События ("status", сообщение, None) и ("delta", фрагмент, тип анализа)
+
+    Raises:
+        LLMStreamError: Ошибка любого из анализов (остальные отменяются)
+    """
+    if len(parts) == 1:
+        async for kind, payload in stream_analyze_contract(text, parts[0], username):
+            yield kind, payload, parts[0] if kind == "delta" else None
+        return
+
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def pump(part: str):
+        try:
+            async for kind, payload in stream_analyze_contract(text, part, username):
+                # Статусы частей не показываем: общий статус один
+                if kind == "delta":
+                    await events.put(("delta", payload, part))
+            await events.put(("done", None, part))
+        except Exception as e:
+            await events.put(("error", e, part))
+
+    tasks = [asyncio.create_task(pump(part)) for part in parts]
+    try:
+        finished = 0
+        while finished < len(tasks):
+            kind, payload, part = await events.get()
+            if kind == "done":
+                finished += 1
+            elif kind == "error":
+                raise payload
+            else:
+                yield kind, payload, part
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -10,9 +10,13 @@ DEFAULT_CONFIG = {
     "deepseek_api_key": "",
     "deepseek_base_url": "https://api.deepseek.com",
     "lmstudio_base_url": "http://localhost:1234/v1",
-    "lmstudio_model": "deepseek-coder"
+    "lmstudio_model": "deepseek-coder",
+    "lmstudio_context_window": 32768
 }
 
+# Модель DeepSeek, используемая для анализа
+DEEPSEEK_MODEL = "deepseek-chat"
+
 def get_llm_config() -> Dict:
     """
     Получить текущую конфигурацию LLM.
@@ -43,3 +47,15 @@ def get_current_llm_type() -> str:
     """
     config = get_llm_config()
     return config.get("llm_type", "deepseek")
+
+def get_current_model_name() -> str:
+    """
+    Получить имя модели текущего типа LLM.
+
+    Returns:
+        "deepseek-chat" для DeepSeek или модель LM Studio из настроек
+    """
+    config = get_llm_config()
+    if config.get("llm_type", "deepseek") == "lmstudio":
+        return config.get("lmstudio_model", "deepseek-coder")
+    return DEEPSEEK_MODEL
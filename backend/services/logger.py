@@ -20,7 +20,8 @@ logger.add(
     format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {message}",
     rotation=LOG_ROTATION,
     retention="30 days",
-    encoding="utf-8"
+    encoding="utf-8",
+    enqueue=True  # запись в файл в фоновом потоке, не в обработчике запроса
 )
 
 # Добавить логирование ошибок
@@ -30,7 +31,8 @@ logger.add(
     format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
     rotation=LOG_ROTATION,
     retention="30 days",
-    encoding="utf-8"
+    encoding="utf-8",
+    enqueue=True
 )
 
 def log_user_action(username: str, action: str, details: str = ""):
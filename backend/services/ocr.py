@@ -0,0 +1,185 @@
+"""
+Распознавание текста сканированных PDF (OCR) через локальный Tesseract.
+
+Страницы без текстового слоя растеризуются через PDFium (pypdfium2) и
+распознаются pytesseract в пуле процессов - по странице на задачу.
+Результат кэшируется по SHA-256 растра страницы, поэтому повторная
+загрузка того же скана (или скана с теми же страницами) не распознается
+заново.
+
+Требования: пакет pytesseract и программа tesseract с языковыми пакетами
+(rus, eng). Путь к tesseract.exe на Windows задается переменной окружения
+TESSERACT_CMD.
+"""
+
+import hashlib
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from backend.services.cache import TieredCache
+from backend.services.sandbox import reset_process_limits
+from backend.services.settings import get_settings
+
+# Кэш распознанного текста страниц (ключ - параметры OCR и хэш растра)
+ocr_cache = TieredCache("ocr", "ocr_cache", default_memory_items=256)
+
+_ocr_pool: Optional[ProcessPoolExecutor] = None
+_ocr_pool_workers = 0
+_ocr_pool_lock = threading.Lock()
+
+
+def _configure_tesseract():
+    """Задать путь к tesseract из окружения (если указан)."""
+    import pytesseract
+
+    tesseract_cmd = os.getenv("TESSERACT_CMD")
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    return pytesseract
+
+
+@lru_cache(maxsize=1)
+def get_ocr_error() -> Optional[str]:
+    """
+    Проверить доступность OCR (один раз за время работы сервера).
+
+    Returns:
+        None если OCR доступен, иначе описание проблемы
+    """
+    try:
+        pytesseract = _configure_tesseract()
+    except ImportError:
+        return "Модуль pytesseract не установлен. Установите: pip install pytesseract"
+
+    try:
+        pytesseract.get_tesseract_version()
+    except Exception:
+        return "Программа Tesseract OCR не найдена на сервере. Установите ее или укажите путь в TESSERACT_CMD."
+    return None
+
+
+def _get_ocr_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Получить пул процессов OCR (пересоздается при смене размера).
+
+    Args:
+        workers: Количество процессов
+
+    Returns:
+        Пул процессов
+    """
+    global _ocr_pool, _ocr_pool_workers
+
+    with _ocr_pool_lock:
+        if _ocr_pool is None or _ocr_pool_workers != workers:
+            if _ocr_pool is not None:
+                _ocr_pool.shutdown(wait=False)
+            _ocr_pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_ocr_worker)
+            _ocr_pool_workers = workers
+        return _ocr_pool
+
+
+def shutdown_ocr_pool():
+    """Остановить пул процессов OCR (при завершении сервера)."""
+    global _ocr_pool
+
+    with _ocr_pool_lock:
+        if _ocr_pool is not None:
+            _ocr_pool.shutdown(wait=False, cancel_futures=True)
+            _ocr_pool = None
+
+
+def _init_ocr_worker():
+    """Инициализация процесса OCR: одна страница - одно ядро."""
+    reset_process_limits()
+    # Tesseract сам распараллеливает распознавание через OpenMP, что при
+    # нескольких процессах только мешает
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+def _ocr_page(file_path: str, page_index: int, dpi: int, languages: str) -> Tuple[int, str, str, bool]:
+    """
+    Растеризовать и распознать одну страницу (в отдельном процессе).
+
+    Args:
+        file_path: Путь к PDF
+        page_index: Индекс страницы (с 0)
+        dpi: Разрешение растеризации
+        languages: Языки Tesseract (например, "rus+eng")
+
+    Returns:
+        Кортеж (индекс страницы, ключ кэша, текст, взят ли текст из кэша)
+    """
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        page = pdf[page_index]
+        try:
+            image = page.render(scale=dpi / 72, grayscale=True).to_pil()
+        finally:
+            page.close()
+    finally:
+        pdf.close()
+
+    page_hash = hashlib.sha256(image.tobytes()).hexdigest()
+    cache_key = f"{dpi}:{languages}:{image.width}x{image.height}:{page_hash}"
+    cached_text = ocr_cache.get(cache_key)
+    if cached_text is not None:
+        return page_index, cache_key, cached_text, True
+
+    pytesseract = _configure_tesseract()
+    text = pytesseract.image_to_string(image, lang=languages)
+    return page_index, cache_key, text, False
+
+
+def recognize_pdf_pages(file_path: Path, page_indexes: List[int], on_page=None) -> Tuple[Optional[Dict[int, str]], Optional[str]]:
+    """
+    Распознать страницы PDF параллельно в пуле процессов.
+
+    Args:
+        file_path: Путь к PDF
+        page_indexes: Индексы страниц (с 0) для распознавания
+        on_page: Вызывается с текстом каждой распознанной страницы
+            (исключение из него отменяет оставшиеся страницы)
+
+    Returns:
+        Кортеж (словарь индекс страницы -> текст, ошибка)
+    """
+    ocr_error = get_ocr_error()
+    if ocr_error:
+        return None, ocr_error
+
+    settings = get_settings()
+    max_pages = settings.get("ocr_max_pages", 100)
+    if max_pages and len(page_indexes) > max_pages:
+        return None, f"Слишком много страниц для распознавания ({len(page_indexes)}, лимит: {max_pages})."
+
+    dpi = settings.get("ocr_dpi", 300)
+    languages = settings.get("ocr_languages", "rus+eng")
+    pool = _get_ocr_pool(max(settings.get("ocr_workers", 2), 1))
+
+    futures = [
+        pool.submit(_ocr_page, str(file_path), page_index, dpi, languages)
+        for page_index in page_indexes
+    ]
+
+    texts: Dict[int, str] = {}
+    try:
+        for future in as_completed(futures):
+            page_index, cache_key, text, from_cache = future.result()
+            if not from_cache:
+                ocr_cache.set(cache_key, text)
+            if on_page:
+                on_page(text)
+            texts[page_index] = text
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+
+    return texts, None
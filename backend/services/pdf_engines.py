@@ -0,0 +1,209 @@
+"""
+Движки извлечения текста из PDF.
+
+Все движки реализуют один интерфейс: open() возвращает документ с числом
+страниц и методом extract_page(). Движок выбирается настройкой pdf_engine:
+- "pypdf2" - PyPDF2 (чистый Python, самый медленный);
+- "pdfplumber" - pdfplumber/pdfminer (точная раскладка, медленный);
+- "pypdfium2" - PDFium (нативная библиотека, самый быстрый).
+
+Выбрать движок для своего корпуса договоров помогает
+scripts/benchmark_extraction.py (скорость страниц/сек и совпадение текста).
+"""
+
+import threading
+from pathlib import Path
+from typing import Dict
+
+DEFAULT_PDF_ENGINE = "pypdf2"
+
+
+class PdfEncryptedError(Exception):
+    """PDF защищен паролем."""
+    pass
+
+
+class PdfDocument:
+    """Открытый PDF-документ (базовый класс)."""
+
+    page_count = 0
+
+    def extract_page(self, index: int) -> str:
+        """
+        Извлечь текст страницы.
+
+        Args:
+            index: Индекс страницы (с 0)
+
+        Returns:
+            Текст страницы
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Освободить ресурсы документа."""
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class PdfEngine:
+    """Движок извлечения текста из PDF (базовый класс)."""
+
+    name = ""
+
+    def open(self, file_path: Path) -> PdfDocument:
+        """
+        Открыть PDF-документ.
+
+        Args:
+            file_path: Путь к файлу
+
+        Returns:
+            Открытый документ
+
+        Raises:
+            PdfEncryptedError: Если файл защищен паролем
+        """
+        raise NotImplementedError
+
+
+# ===== PyPDF2 =====
+
+class PyPDF2Document(PdfDocument):
+    def __init__(self, file_path: Path):
+        import PyPDF2
+
+        self._file = open(file_path, "rb")
+        try:
+            self._reader = PyPDF2.PdfReader(self._file)
+            if self._reader.is_encrypted:
+                raise PdfEncryptedError()
+            self.page_count = self._read_page_count()
+        except BaseException:
+            self._file.close()
+            raise
+
+    def _read_page_count(self) -> int:
+        """Количество страниц из метаданных (/Root/Pages/Count) без обхода дерева страниц."""
+        try:
+            return int(self._reader.trailer["/Root"]["/Pages"]["/Count"])
+        except Exception:
+            return len(self._reader.pages)
+
+    def extract_page(self, index: int) -> str:
+        return self._reader.pages[index].extract_text() or ""
+
+    def close(self):
+        self._file.close()
+
+
+class PyPDF2Engine(PdfEngine):
+    name = "pypdf2"
+
+    def open(self, file_path: Path) -> PdfDocument:
+        return PyPDF2Document(file_path)
+
+
+# ===== pdfplumber =====
+
+class PdfplumberDocument(PdfDocument):
+    def __init__(self, file_path: Path):
+        import pdfplumber
+        from pdfminer.pdfdocument import PDFPasswordIncorrect, PDFEncryptionError
+
+        password_errors = (PDFPasswordIncorrect, PDFEncryptionError)
+        try:
+            self._pdf = pdfplumber.open(str(file_path))
+        except Exception as e:
+            # pdfplumber >= 0.11 оборачивает ошибки pdfminer в PdfminerException
+            if isinstance(e, password_errors) or any(isinstance(arg, password_errors) for arg in e.args):
+                raise PdfEncryptedError()
+            raise
+        self.page_count = len(self._pdf.pages)
+
+    def extract_page(self, index: int) -> str:
+        page = self._pdf.pages[index]
+        try:
+            return page.extract_text() or ""
+        finally:
+            # Не держать в памяти разобранные объекты страниц
+            page.close()
+
+    def close(self):
+        self._pdf.close()
+
+
+class PdfplumberEngine(PdfEngine):
+    name = "pdfplumber"
+
+    def open(self, file_path: Path) -> PdfDocument:
+        return PdfplumberDocument(file_path)
+
+
+# ===== pypdfium2 =====
+
+# PDFium не потокобезопасен: в одном процессе с библиотекой работает один поток
+_pdfium_lock = threading.RLock()
+
+
+class PdfiumDocument(PdfDocument):
+    def __init__(self, file_path: Path):
+        import pypdfium2 as pdfium
+
+        with _pdfium_lock:
+            try:
+                self._pdf = pdfium.PdfDocument(str(file_path))
+            except pdfium.PdfiumError as e:
+                if "password" in str(e).lower():
+                    raise PdfEncryptedError()
+                raise
+            self.page_count = len(self._pdf)
+
+    def extract_page(self, index: int) -> str:
+        with _pdfium_lock:
+            page = self._pdf[index]
+            try:
+                text_page = page.get_textpage()
+                try:
+                    text = text_page.get_text_bounded()
+                finally:
+                    text_page.close()
+            finally:
+                page.close()
+        # PDFium разделяет строки через \r\n
+        return text.replace("\r\n", "\n").replace("\r", "\n")
+
+    def close(self):
+        with _pdfium_lock:
+            self._pdf.close()
+
+
+class PdfiumEngine(PdfEngine):
+    name = "pypdfium2"
+
+    def open(self, file_path: Path) -> PdfDocument:
+        return PdfiumDocument(file_path)
+
+
+PDF_ENGINES: Dict[str, PdfEngine] = {
+    engine.name: engine
+    for engine in (PyPDF2Engine(), PdfplumberEngine(), PdfiumEngine())
+}
+
+
+def get_pdf_engine(name: str) -> PdfEngine:
+    """
+    Получить движок по имени (неизвестное имя - движок по умолчанию).
+
+    Args:
+        name: Имя движка (pypdf2, pdfplumber, pypdfium2)
+
+    Returns:
+        Движок извлечения
+    """
+    return PDF_ENGINES.get(name, PDF_ENGINES[DEFAULT_PDF_ENGINE])
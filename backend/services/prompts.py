@@ -1,7 +1,45 @@
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from backend.config import PROMPTS_DIR, DEFAULTS_DIR
 
+# Комбинированный анализ: все типы анализа по одному загруженному файлу
+FULL_ANALYSIS_TYPE = "full"
+
+# Части комбинированного анализа и их заголовки
+ANALYSIS_TITLES = {
+    "summary": "Детальная выжимка договора",
+    "legal_check": "Проверка на соответствие законодательству РФ"
+}
+
+def get_analysis_parts(analysis_type: str) -> List[str]:
+    """
+    Получить типы анализа, из которых состоит запрошенный анализ.
+
+    Args:
+        analysis_type: Тип анализа ("summary", "legal_check" или "full")
+
+    Returns:
+        Список типов анализа (для "full" - все, иначе - сам тип)
+    """
+    if analysis_type == FULL_ANALYSIS_TYPE:
+        return list(ANALYSIS_TITLES)
+    return [analysis_type]
+
+def combine_analysis_results(results: Dict[str, str]) -> str:
+    """
+    Объединить результаты частей комбинированного анализа в один документ.
+
+    Args:
+        results: Словарь {тип анализа: результат}
+
+    Returns:
+        Markdown с разделом на каждую часть
+    """
+    return "\n\n".join(
+        f"# {ANALYSIS_TITLES.get(part, part)}\n\n{result}"
+        for part, result in results.items()
+    )
+
 def get_prompt(prompt_type: str) -> Optional[str]:
     """
     Получить текущий промпт.
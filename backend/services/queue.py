@@ -1,95 +1,517 @@
 import asyncio
-from typing import Optional, Dict, Any
-from datetime import datetime
-from backend.services.settings import get_settings
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Optional, Dict, Any, Deque, List, Set
+
+from backend.services.settings import DEFAULT_SETTINGS, get_settings, add_settings_listener
+from backend.services.executors import run_io
+from backend.services.shared_state import shared_state, LEASE_TTL_SECONDS
+
+# Классы приоритета (в порядке убывания): запросы администраторов,
+# обычные запросы из интерфейса и пакетные (фоновые задачи с bulk)
+PRIORITY_CLASSES = ("admin", "interactive", "bulk")
+DEFAULT_PRIORITY = "interactive"
+
+# Период повторной попытки занять слот, освобожденный другим процессом
+QUEUE_POLL_SECONDS = 0.5
+
+# Период перечитывания лимитов (изменение настроек в другом процессе)
+LIMITS_REFRESH_SECONDS = 5
+
+# Лимит очереди -> ключ настроек (значение по умолчанию - из
+# DEFAULT_SETTINGS); лимиты без ключа не используются (бюджет токенов и
+# shortest-job-first - только у анализа, где известна стоимость запроса)
+ANALYSIS_QUEUE_SETTINGS = {
+    "max_concurrent": "max_concurrent_requests",
+    "max_queue": "max_queue_size",
+    "max_concurrent_per_user": "max_concurrent_per_user",
+    "max_queued_per_user": "max_queued_per_user",
+    "priority_enabled": "queue_priority_enabled",
+    "token_budget": "queue_token_budget",
+    "shortest_job_first": "queue_shortest_job_first",
+    "sjf_max_wait": "queue_sjf_max_wait_seconds"
+}
+
+TRANSCRIPTION_QUEUE_SETTINGS = {
+    "max_concurrent": "transcription_max_concurrent",
+    "max_queue": "transcription_max_queue_size",
+    "max_concurrent_per_user": "transcription_max_concurrent_per_user",
+    "max_queued_per_user": "transcription_max_queued_per_user",
+    "priority_enabled": "queue_priority_enabled"
+}
+
+
+def get_priority(user: Dict, bulk: bool = False) -> str:
+    """
+    Определить класс приоритета запроса.
+
+    Args:
+        user: Пользователь (username, role)
+        bulk: Пакетный запрос (пропускает вперед интерактивные)
+
+    Returns:
+        Класс приоритета из PRIORITY_CLASSES
+    """
+    if bulk:
+        return "bulk"
+    if user.get("role") == "admin":
+        return "admin"
+    return DEFAULT_PRIORITY
+
+
+class QueueTicket:
+    """Запрос в очереди: ожидание слота и занятый им объем работы."""
+
+    def __init__(self, future: asyncio.Future, username: str, priority: str, cost: int):
+        self.id = uuid.uuid4().hex
+        self.future = future
+        self.username = username
+        self.priority = priority
+        self.cost = cost
+        self.created = time.time()
+
+    def as_lease(self) -> Dict:
+        """Запрос для общего состояния процессов."""
+        return {
+            "id": self.id,
+            "username": self.username,
+            "priority": PRIORITY_CLASSES.index(self.priority),
+            "cost": self.cost,
+            "created": self.created
+        }
+
 
 class RequestQueue:
     """
-    Менеджер очереди запросов на анализ договоров.
-  
+    Менеджер очереди запросов (анализ договоров, транскрибация).
+
     Ограничения:
     - Максимум одновременных обработок: настраивается (по умолчанию 5)
+    - Бюджет токенов одновременных обработок (queue_token_budget,
+      0 - без ограничения): сумма оценок стоимости выполняемых запросов
+      не превышает бюджет, поэтому вместе с одним договором на 150
+      страниц выполняется меньше запросов, чем с короткими. Запрос
+      дороже всего бюджета выполняется один.
     - Максимум в очереди ожидания: настраивается (по умолчанию 5)
+    - Максимум одновременных обработок одного пользователя
+      (max_concurrent_per_user, 0 - без ограничения)
+    - Максимум запросов одного пользователя в очереди
+      (max_queued_per_user, 0 - без ограничения)
+
+    Лимиты общие для всех процессов сервера (uvicorn --workers): занятые
+    слоты и ожидающие запросы хранятся в общей базе (shared_state), и
+    слот занимается в транзакции, проверяющей глобальные счетчики.
+
+    Освободившийся слот сразу передается ожидающему запросу этого
+    процесса; слот, освобожденный другим процессом, занимается при
+    следующей проверке (раз в QUEUE_POLL_SECONDS). Выбор ожидающего:
+    - сначала более высокий класс приоритета (admin, interactive, bulk;
+      при queue_priority_enabled = false все запросы в одном классе);
+    - внутри класса - по кругу между пользователями (round-robin), у
+      каждого пользователя - в порядке поступления, поэтому пакет из
+      десяти договоров одного пользователя не задерживает остальных
+      больше чем на один слот;
+    - в режиме queue_shortest_job_first - самый дешевый запрос класса,
+      но запрос, ждущий дольше queue_sjf_max_wait_seconds, идет первым
+      (большие договоры не ждут бесконечно);
+    - пользователь, занявший свой лимит слотов, пропускается.
+    Запросы других процессов упорядочиваются так же, но вместо круга
+    пользователей вперед идет пользователь с меньшим числом слотов.
+
+    Если выбранному запросу не хватает бюджета, остальные его не обгоняют.
+
+    Лимиты читаются из настроек (ключи - в settings_keys, у каждой
+    очереди свои) и обновляются при их сохранении (в других процессах -
+    в течение LIMITS_REFRESH_SECONDS).
     """
-  
-    def __init__(self):
-        self._active_count = 0
-        self._queue_count = 0
-        self._lock = asyncio.Lock()
-  
-    async def acquire(self) -> Dict[str, Any]:
+
+    def __init__(self, name: str = "analysis", settings_keys: Optional[Dict[str, str]] = None):
+        self.name = name
+        self._settings_keys = settings_keys or ANALYSIS_QUEUE_SETTINGS
+        # Класс приоритета -> пользователь -> его ожидающие запросы;
+        # порядок пользователей - очередь round-robin
+        self._waiters: Dict[str, "OrderedDict[str, Deque[QueueTicket]]"] = {
+            priority: OrderedDict() for priority in PRIORITY_CLASSES
+        }
+        # Слоты, занятые запросами этого процесса
+        self._active: Dict[str, QueueTicket] = {}
+        # Запросы, ожидающие в других процессах (для оценки позиции)
+        self._foreign_waiting: List[Dict] = []
+        self._max_concurrent: Optional[int] = None
+        self._max_queue: Optional[int] = None
+        self._max_concurrent_per_user = 0
+        self._max_queued_per_user = 0
+        self._priority_enabled = True
+        self._token_budget = 0
+        self._shortest_job_first = False
+        self._sjf_max_wait = 0
+        self._limits_loaded = 0.0
+        self._dispatch_lock = asyncio.Lock()
+        self._poller: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        add_settings_listener(self._on_settings_changed)
+
+    async def acquire(self, username: str = "", priority: str = DEFAULT_PRIORITY, cost: int = 0) -> Dict[str, Any]:
         """
         Попытаться получить слот для обработки.
-    
+
+        Args:
+            username: Пользователь (для справедливого распределения и лимитов)
+            priority: Класс приоритета (см. get_priority)
+            cost: Оценка стоимости запроса в токенах (0 - неизвестна)
+
         Returns:
             Словарь с результатом:
-            - {"allowed": True} - можно обрабатывать сразу
-            - {"allowed": True, "queued": True} - добавлено в очередь
+            - {"allowed": True, "waiter": ...} - можно обрабатывать сразу
+            - {"allowed": True, "queued": True, "waiter": ...} - добавлено
+              в очередь, слот ожидается через wait_for_slot(waiter)
             - {"allowed": False, "error": "..."} - отклонено
+            Слот освобождается через release(waiter).
         """
-        settings = get_settings()
-        max_concurrent = settings.get("max_concurrent_requests", 5)
-        max_queue = settings.get("max_queue_size", 5)
-    
-        async with self._lock:
-            # Проверить, можно ли обработать сразу
-            if self._active_count < max_concurrent:
-                self._active_count += 1
-                return {"allowed": True, "queued": False}
-        
-            # Проверить, можно ли добавить в очередь
-            if self._queue_count < max_queue:
-                self._queue_count += 1
-                return {"allowed": True, "queued": True, "message": "Идет обработка запросов других пользователей. Ваш запрос в очереди."}
-        
+        await self._refresh_limits()
+        self._loop = asyncio.get_running_loop()
+
+        if not self._priority_enabled or priority not in PRIORITY_CLASSES:
+            priority = DEFAULT_PRIORITY
+
+        # Запрос встает в очередь и сразу получает слот, если он свободен
+        # и запрос не обгоняет других (по правилам выбора ожидающего)
+        waiter = QueueTicket(self._loop.create_future(), username, priority, max(cost, 0))
+        self._waiters[priority].setdefault(username, deque()).append(waiter)
+        await self._dispatch()
+
+        if not waiter.future.done():
+            rejected = await run_io(
+                shared_state.queue_enqueue, self.name, waiter.as_lease(),
+                self._max_queue, self._max_queued_per_user
+            )
+        else:
+            rejected = None
+
+        if waiter.future.done():
+            return {"allowed": True, "queued": False, "waiter": waiter}
+
+        if rejected == "user":
+            self._remove_waiter(waiter)
+            return {
+                "allowed": False,
+                "error": f"У вас уже {self._max_queued_per_user} запросов в очереди. Дождитесь их обработки."
+            }
+
+        if rejected == "full":
             # Очередь переполнена
+            self._remove_waiter(waiter)
             return {
-                "allowed": False, 
+                "allowed": False,
                 "error": "Система перегружена. Попробуйте позже (через 1-2 минуты)."
             }
-  
-    async def wait_for_slot(self) -> bool:
+
+        self._start_poller()
+        return {
+            "allowed": True,
+            "queued": True,
+            "waiter": waiter,
+            "position": self.get_position(waiter),
+            "message": "Идет обработка запросов других пользователей. Ваш запрос в очереди."
+        }
+
+    async def wait_for_slot(self, waiter: QueueTicket) -> bool:
         """
         Ожидать освобождения слота (для запросов в очереди).
-    
+
+        Если ожидание отменено (клиент отключился), запрос убирается из
+        очереди, а уже переданный ему слот освобождается.
+
+        Args:
+            waiter: Ожидание из результата acquire()
+
         Returns:
-            True когда слот освободился
+            True когда слот получен
         """
-        settings = get_settings()
-        max_concurrent = settings.get("max_concurrent_requests", 5)
-    
-        # Ожидать с интервалом проверки
-        while True:
-            async with self._lock:
-                if self._active_count < max_concurrent:
-                    # Слот освободился, занимаем его
-                    self._queue_count -= 1
-                    self._active_count += 1
-                    return True
-        
-            # Ждем перед следующей проверкой
-            await asyncio.sleep(1)
-  
-    async def release(self):
+        try:
+            return await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Слот успели передать - вернуть его
+                self.release_nowait(waiter)
+            else:
+                waiter.future.cancel()
+                self._remove_waiter(waiter)
+                asyncio.ensure_future(self._forget(waiter))
+            raise
+
+    async def release(self, waiter: QueueTicket):
         """
         Освободить слот после завершения обработки.
+
+        Args:
+            waiter: Запрос из результата acquire()
         """
-        async with self._lock:
-            if self._active_count > 0:
-                self._active_count -= 1
-  
-    def get_status(self) -> Dict[str, int]:
+        if self._active.pop(waiter.id, None) is None:
+            return
+        await self._forget(waiter)
+
+    def release_nowait(self, waiter: QueueTicket):
         """
-        Получить текущий статус очереди.
-    
+        Освободить слот, не дожидаясь записи в общее состояние.
+
+        Для блоков обработки отмены, где ждать нельзя.
+
+        Args:
+            waiter: Запрос из результата acquire()
+        """
+        asyncio.ensure_future(self.release(waiter))
+
+    def get_position(self, waiter: QueueTicket) -> Optional[int]:
+        """
+        Оценить позицию запроса в очереди.
+
+        Впереди все запросы более высоких классов, а в своем классе - в
+        режиме shortest-job-first более дешевые запросы, иначе (круговая
+        очередь пользователей) не больше стольких запросов каждого
+        другого пользователя, сколько их у пользователя запроса до него
+        самого (плюс один). Запросы других процессов учитываются по
+        последней проверке очереди.
+
+        Args:
+            waiter: Ожидание из результата acquire()
+
+        Returns:
+            Позиция (с 1) или None, если запрос уже не в очереди
+        """
+        users = self._waiters.get(waiter.priority, {})
+        own = users.get(waiter.username)
+        if own is None or waiter not in own:
+            return None
+
+        rank = PRIORITY_CLASSES.index(waiter.priority)
+        position = 1 + sum(
+            1 for foreign in self._foreign_waiting
+            if foreign["priority"] < rank or (
+                foreign["priority"] == rank and (
+                    foreign["cost"] < waiter.cost if self._shortest_job_first
+                    else foreign["created"] < waiter.created
+                )
+            )
+        )
+        for cls in PRIORITY_CLASSES:
+            if cls == waiter.priority:
+                break
+            position += sum(len(queue) for queue in self._waiters[cls].values())
+
+        if self._shortest_job_first:
+            position += sum(
+                1 for queue in users.values() for queued in queue
+                if queued is not waiter and queued.cost < waiter.cost
+            )
+            return position
+
+        index = own.index(waiter)
+        position += index
+        for username, queue in users.items():
+            if username != waiter.username:
+                position += min(len(queue), index + 1)
+        return position
+
+    async def get_status(self, username: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Получить текущий статус очереди (по всем процессам сервера).
+
+        Args:
+            username: Пользователь, для которого добавить его счетчики
+
         Returns:
-            Словарь с количеством активных и ожидающих запросов
+            Словарь с количеством активных и ожидающих запросов, занятым
+            бюджетом токенов и лимитами (по классам приоритета и, если
+            указан пользователь, - его)
         """
+        await self._refresh_limits()
+        counts = await run_io(shared_state.queue_counts, self.name, username)
+        by_rank = counts.pop("queued_by_priority")
         return {
-            "active": self._active_count,
-            "queued": self._queue_count
+            **counts,
+            "queued_by_priority": {
+                cls: by_rank.get(rank, 0) for rank, cls in enumerate(PRIORITY_CLASSES)
+            },
+            "max_concurrent": self._max_concurrent,
+            "max_queue": self._max_queue,
+            "max_concurrent_per_user": self._max_concurrent_per_user,
+            "max_queued_per_user": self._max_queued_per_user,
+            "token_budget": self._token_budget,
+            "shortest_job_first": self._shortest_job_first
         }
 
-# Глобальный экземпляр очереди
-request_queue = RequestQueue()
+    def shutdown(self):
+        """Освободить слоты и места в очереди этого процесса (при завершении сервера)."""
+        if self._poller is not None:
+            self._poller.cancel()
+        try:
+            shared_state.queue_release_owner(self.name)
+        except Exception as e:
+            # Аренды истекут сами через LEASE_TTL_SECONDS
+            print(f"Ошибка освобождения очереди {self.name}: {e}")
+
+    # ===== ВЫБОР ОЖИДАЮЩЕГО =====
+
+    def _select_waiter(self, skipped_users: Set[str]) -> Optional[QueueTicket]:
+        """Выбрать следующий запрос (не извлекая его из очереди)."""
+        for cls in PRIORITY_CLASSES:
+            users = self._waiters[cls]
+            eligible = [
+                queue for username, queue in users.items()
+                if username not in skipped_users
+            ]
+            if not eligible:
+                continue
+            if not self._shortest_job_first:
+                # Круговая очередь: первый запрос первого пользователя
+                return eligible[0][0]
+
+            candidates = [queued for queue in eligible for queued in queue]
+            oldest = min(candidates, key=lambda queued: queued.created)
+            if self._sjf_max_wait and time.time() - oldest.created > self._sjf_max_wait:
+                return oldest
+            return min(candidates, key=lambda queued: (queued.cost, queued.created))
+        return None
+
+    async def _dispatch(self):
+        """Передать свободные слоты ожидающим запросам этого процесса."""
+        async with self._dispatch_lock:
+            limits = {
+                "max_concurrent": self._max_concurrent,
+                "max_concurrent_per_user": self._max_concurrent_per_user,
+                "token_budget": self._token_budget
+            }
+            # Пользователи, занявшие свой лимит слотов
+            skipped_users: Set[str] = set()
+            while True:
+                waiter = self._select_waiter(skipped_users)
+                if waiter is None:
+                    return
+                if waiter.future.done():
+                    # Ожидание отменено, но запрос еще не убран из очереди
+                    self._remove_waiter(waiter)
+                    continue
+
+                rejected = await run_io(
+                    shared_state.queue_try_grant, self.name, waiter.as_lease(),
+                    limits, self._shortest_job_first
+                )
+                if rejected == "user":
+                    skipped_users.add(waiter.username)
+                    continue
+                if rejected:
+                    return
+                self._grant(waiter)
+
+    def _grant(self, waiter: QueueTicket):
+        """Извлечь запрос из очереди и передать ему занятый слот."""
+        self._remove_waiter(waiter)
+        users = self._waiters[waiter.priority]
+        if waiter.username in users:
+            # Следующий запрос пользователя - после остальных пользователей
+            users.move_to_end(waiter.username)
+        self._active[waiter.id] = waiter
+        self._start_poller()
+        if waiter.future.done():
+            # Ожидание отменили, пока занимался слот - вернуть его
+            self.release_nowait(waiter)
+        else:
+            waiter.future.set_result(True)
+
+    def _remove_waiter(self, waiter: QueueTicket):
+        """Убрать запрос из очереди этого процесса."""
+        users = self._waiters[waiter.priority]
+        queue = users.get(waiter.username)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        if not queue:
+            del users[waiter.username]
+
+    def _has_waiters(self) -> bool:
+        """Есть ли ожидающие запросы в этом процессе."""
+        return any(self._waiters[cls] for cls in PRIORITY_CLASSES)
+
+    async def _forget(self, waiter: QueueTicket):
+        """Удалить запрос из общего состояния и передать освободившееся место."""
+        await run_io(shared_state.queue_remove, waiter.id)
+        await self._dispatch()
+
+    # ===== ФОНОВАЯ ПРОВЕРКА =====
+
+    def _start_poller(self):
+        """Запустить фоновую проверку, если она еще не идет."""
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.ensure_future(self._poll())
+
+    async def _poll(self):
+        """
+        Пока в процессе есть запросы: занимать слоты, освобожденные другими
+        процессами, и продлевать аренды.
+        """
+        last_refresh = time.monotonic()
+        while self._has_waiters() or self._active:
+            await asyncio.sleep(QUEUE_POLL_SECONDS)
+            try:
+                if time.monotonic() - last_refresh > LEASE_TTL_SECONDS / 4:
+                    lease_ids = list(self._active) + [
+                        queued.id
+                        for cls in PRIORITY_CLASSES
+                        for queue in self._waiters[cls].values()
+                        for queued in queue
+                    ]
+                    await run_io(shared_state.queue_refresh, lease_ids)
+                    last_refresh = time.monotonic()
+                if self._has_waiters():
+                    await self._refresh_limits()
+                    self._foreign_waiting = await run_io(shared_state.queue_foreign_waiting, self.name)
+                    await self._dispatch()
+            except Exception as e:
+                print(f"Ошибка проверки очереди {self.name}: {e}")
+        self._foreign_waiting = []
+
+    # ===== ЛИМИТЫ =====
+
+    async def _refresh_limits(self):
+        """Перечитать лимиты, если они не загружены или устарели."""
+        if self._max_concurrent is None or time.monotonic() - self._limits_loaded > LIMITS_REFRESH_SECONDS:
+            self._apply_limits(await run_io(get_settings))
+
+    def _limit(self, settings: Dict, name: str, unused: Any) -> Any:
+        """Значение лимита из настроек (unused - если у очереди его нет)."""
+        if name not in self._settings_keys:
+            return unused
+        key = self._settings_keys[name]
+        return settings.get(key, DEFAULT_SETTINGS[key])
+
+    def _apply_limits(self, settings: Dict):
+        """Применить лимиты из настроек."""
+        self._max_concurrent = max(self._limit(settings, "max_concurrent", 1), 1)
+        self._max_queue = max(self._limit(settings, "max_queue", 0), 0)
+        self._max_concurrent_per_user = max(self._limit(settings, "max_concurrent_per_user", 0), 0)
+        self._max_queued_per_user = max(self._limit(settings, "max_queued_per_user", 0), 0)
+        self._priority_enabled = self._limit(settings, "priority_enabled", True)
+        self._token_budget = max(self._limit(settings, "token_budget", 0), 0)
+        self._shortest_job_first = self._limit(settings, "shortest_job_first", False)
+        self._sjf_max_wait = max(self._limit(settings, "sjf_max_wait", 0), 0)
+        self._limits_loaded = time.monotonic()
+
+    def _on_limits_changed(self, settings: Dict):
+        """Применить новые лимиты и занять освободившиеся слоты (в event loop)."""
+        self._apply_limits(settings)
+        asyncio.ensure_future(self._dispatch())
+
+    def _on_settings_changed(self, settings: Dict):
+        """Обработчик сохранения настроек (вызывается из потока IO-пула)."""
+        if self._loop is None or self._loop.is_closed():
+            # Очередь еще не использовалась - лимиты прочитаются при первом запросе
+            self._max_concurrent = None
+            return
+        self._loop.call_soon_threadsafe(self._on_limits_changed, settings)
 
+# Глобальные экземпляры очередей: анализ и транскрибация ограничиваются
+# отдельно, тяжелые аудиофайлы не занимают слоты анализа договоров
+request_queue = RequestQueue("analysis", ANALYSIS_QUEUE_SETTINGS)
+transcription_queue = RequestQueue("transcription", TRANSCRIPTION_QUEUE_SETTINGS)
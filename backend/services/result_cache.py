@@ -0,0 +1,47 @@
+"""
+Кэш результатов LLM: анализов договоров и протоколов совещаний.
+
+Ключ записи строится из хэша входного текста (после нормализации), хэша
+текущего текста промпта, модели и параметров генерации. Поэтому
+изменение промпта в админ-панели, смена модели или параметров
+автоматически дают новый ключ - старые записи больше не используются и
+удаляются по сроку жизни или при вытеснении.
+
+Лимиты: result_cache_memory_items, result_cache_disk_mb,
+result_cache_ttl_hours (см. TieredCache).
+"""
+
+import hashlib
+import json
+from typing import Dict
+
+from backend.services.cache import TieredCache
+
+# Кэш результатов LLM (срок жизни по умолчанию - неделя)
+result_cache = TieredCache(
+    "results",
+    "result_cache",
+    default_memory_items=128,
+    default_disk_mb=200,
+    default_ttl_hours=168
+)
+
+
+def make_result_key(kind: str, text: str, prompt: str, model: str, params: Dict) -> str:
+    """
+    Построить ключ кэша результата.
+
+    Args:
+        kind: Тип результата (тип анализа или "meeting_protocol")
+        text: Входной текст
+        prompt: Текст системного промпта
+        model: Модель (вместе с типом LLM)
+        params: Параметры генерации (temperature, max_tokens)
+
+    Returns:
+        Ключ записи
+    """
+    text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    params_key = json.dumps(params, sort_keys=True)
+    return f"{kind}:{model}:{params_key}:{prompt_hash}:{text_hash}"
@@ -0,0 +1,418 @@
+"""
+Изолированные процессы-обработчики с ограничением времени и памяти.
+
+Разбор документов выполняется в постоянных процессах-обработчиках: они
+запускаются один раз и переиспользуются, поэтому запрос не платит за
+запуск процесса. Для каждой задачи:
+- ограничивается процессорное время (RLIMIT_CPU, только POSIX);
+- ограничивается объем памяти процесса (RLIMIT_AS, только POSIX);
+- родитель ждет результат не дольше таймаута, после чего убивает
+  обработчик вместе с его дочерними процессами и запускает новый.
+
+Зависший или упавший парсер не блокирует сервер и не занимает поток:
+вызывающий код получает SandboxTimeoutError или SandboxCrashError.
+
+Лимиты берутся из настроек с префиксом пула, например для
+extraction_sandbox: extraction_sandbox_workers, _timeout_seconds,
+_cpu_seconds, _memory_mb, _max_jobs.
+"""
+
+import importlib
+import multiprocessing
+import os
+import signal
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from backend.services.settings import get_settings
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class SandboxError(Exception):
+    """Ошибка выполнения задачи в изолированном процессе."""
+    pass
+
+
+class SandboxTimeoutError(SandboxError):
+    """Задача не уложилась в таймаут, обработчик убит."""
+
+    def __init__(self, timeout_seconds: int):
+        super().__init__(f"Задача превысила лимит времени ({timeout_seconds} с)")
+        self.timeout_seconds = timeout_seconds
+
+
+class SandboxCrashError(SandboxError):
+    """Обработчик аварийно завершился во время задачи."""
+
+    def __init__(self, exitcode: Optional[int]):
+        super().__init__(f"Обработчик завершился с кодом {exitcode}")
+        self.exitcode = exitcode
+
+    @property
+    def cpu_limit_exceeded(self) -> bool:
+        """Процесс убит за превышение лимита процессорного времени."""
+        sigxcpu = getattr(signal, "SIGXCPU", None)
+        return sigxcpu is not None and self.exitcode == -sigxcpu
+
+
+class SandboxJobError(SandboxError):
+    """Задача выбросила исключение внутри обработчика."""
+    pass
+
+
+# ===== ПРОЦЕСС-ОБРАБОТЧИК =====
+
+def reset_process_limits():
+    """
+    Снять лимит процессорного времени, унаследованный от обработчика.
+
+    Используется как initializer пулов процессов, которые создаются внутри
+    обработчика: их процессы живут дольше одной задачи, и накопленное
+    время иначе рано или поздно превысит унаследованный лимит.
+    """
+    if resource is None:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+
+
+def _apply_limits(cpu_seconds: int, memory_mb: int):
+    """Установить лимиты на следующую задачу (в процессе-обработчике)."""
+    if resource is None:
+        return
+
+    if cpu_seconds:
+        # RLIMIT_CPU считает время с запуска процесса, поэтому лимит задачи
+        # отсчитывается от уже израсходованного времени
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        used = int(usage.ru_utime + usage.ru_stime)
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        soft = used + cpu_seconds + 1
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    soft = memory_mb * 1024 * 1024 if memory_mb else hard
+    if hard != resource.RLIM_INFINITY and soft != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+
+def _worker_main(conn, preload: Tuple[str, ...]):
+    """
+    Цикл процесса-обработчика: получить задачу, выполнить, вернуть результат.
+
+    Args:
+        conn: Конец канала для связи с родителем
+        preload: Модули, которые импортируются заранее (прогрев)
+    """
+    # Своя группа процессов: родитель убивает обработчик вместе с потомками
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+
+    # Одна задача за раз - пулы потоков библиотек не нужны
+    os.environ.setdefault("RAYON_NUM_THREADS", "1")
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+    for module_name in preload:
+        importlib.import_module(module_name)
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+
+        func, args, cpu_seconds, memory_mb = job
+        try:
+            _apply_limits(cpu_seconds, memory_mb)
+            result = ("ok", func(*args))
+        except MemoryError:
+            result = ("error", "Превышен лимит памяти")
+        except BaseException as e:
+            result = ("error", f"{type(e).__name__}: {e}")
+
+        try:
+            conn.send(result)
+        except (OSError, ValueError):
+            break
+
+
+class _SandboxWorker:
+    """Процесс-обработчик и канал связи с ним."""
+
+    def __init__(self, context, name: str, preload: Tuple[str, ...]):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, preload),
+            name=name,
+            daemon=False  # обработчику нужны свои пулы процессов
+        )
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def kill(self):
+        """Убить обработчик вместе с его дочерними процессами."""
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(self.process.pid, signal.SIGKILL)
+            else:
+                self.process.kill()
+        except OSError:
+            # Группа еще не создана - убить только сам процесс
+            try:
+                self.process.kill()
+            except OSError:
+                pass
+        self.process.join(5)
+        self.conn.close()
+
+    def stop(self):
+        """Попросить обработчик завершиться (убить, если не завершился)."""
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+
+class SandboxPool:
+    """
+    Пул переиспользуемых изолированных процессов-обработчиков.
+
+    Лимиты читаются из настроек при каждой задаче:
+    - {prefix}_workers - количество процессов
+    - {prefix}_timeout_seconds - максимальное время задачи (по часам)
+    - {prefix}_cpu_seconds - лимит процессорного времени задачи (0 - без лимита)
+    - {prefix}_memory_mb - лимит адресного пространства процесса (0 - без лимита)
+    - {prefix}_max_jobs - после стольких задач процесс перезапускается
+    """
+
+    def __init__(self, name: str, settings_prefix: str, preload: Tuple[str, ...] = (), defaults: Optional[Dict] = None):
+        self.name = name
+        self._settings_prefix = settings_prefix
+        self._preload = preload
+        self._defaults = {
+            "workers": 2,
+            "timeout_seconds": 180,
+            "cpu_seconds": 120,
+            "memory_mb": 4096,
+            "max_jobs": 200,
+            **(defaults or {})
+        }
+        # spawn: обработчик не наследует потоки и блокировки сервера
+        self._context = multiprocessing.get_context("spawn")
+        self._idle: List[_SandboxWorker] = []
+        self._total = 0
+        self._busy = 0
+        # Лимит процессов по последнему чтению настроек (для статистики)
+        self._max_workers = self._defaults["workers"]
+        self._closed = False
+        self._condition = threading.Condition()
+        self._stats = {
+            "jobs": 0,
+            "timeouts": 0,
+            "crashes": 0,
+            "restarts": 0
+        }
+
+    # ===== ПУБЛИЧНЫЙ ИНТЕРФЕЙС =====
+
+    def run(self, func: Callable, *args):
+        """
+        Выполнить функцию в изолированном процессе (блокирующий вызов).
+
+        Функция и аргументы должны сериализоваться pickle (функция - на
+        уровне модуля).
+
+        Args:
+            func: Функция
+            *args: Аргументы функции
+
+        Returns:
+            Результат функции
+
+        Raises:
+            SandboxTimeoutError: Задача не уложилась в таймаут
+            SandboxCrashError: Обработчик аварийно завершился
+            SandboxJobError: Функция выбросила исключение
+        """
+        limits = self._limits()
+        job = (func, args, limits["cpu_seconds"], limits["memory_mb"])
+
+        # Повторить один раз, если обработчик умер, пока простаивал
+        for attempt in range(2):
+            worker = self._acquire(limits["workers"])
+            try:
+                worker.conn.send(job)
+                break
+            except OSError:
+                self._discard(worker)
+                if attempt:
+                    raise SandboxCrashError(worker.process.exitcode)
+
+        healthy = False
+        try:
+            if not worker.conn.poll(limits["timeout_seconds"]):
+                with self._condition:
+                    self._stats["timeouts"] += 1
+                raise SandboxTimeoutError(limits["timeout_seconds"])
+
+            try:
+                status, payload = worker.conn.recv()
+            except (EOFError, OSError):
+                worker.process.join(1)
+                with self._condition:
+                    self._stats["crashes"] += 1
+                raise SandboxCrashError(worker.process.exitcode)
+
+            worker.jobs += 1
+            healthy = True
+        finally:
+            if healthy:
+                self._release(worker, limits)
+            else:
+                self._discard(worker)
+
+        with self._condition:
+            self._stats["jobs"] += 1
+
+        if status == "error":
+            raise SandboxJobError(payload)
+        return payload
+
+    def start(self):
+        """Заранее запустить процессы (прогрев при старте сервера)."""
+        workers = self._limits()["workers"]
+        with self._condition:
+            missing = max(workers - self._total, 0)
+            self._total += missing
+        for _ in range(missing):
+            worker = self._spawn()
+            with self._condition:
+                if worker is None:
+                    self._total -= 1
+                else:
+                    self._idle.append(worker)
+                self._condition.notify()
+
+    def shutdown(self):
+        """Остановить все процессы пула (при завершении сервера)."""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+            self._condition.notify_all()
+        for worker in idle:
+            worker.stop()
+
+    def get_stats(self) -> Dict:
+        """
+        Получить статистику пула.
+
+        Читает только счетчики в памяти (без настроек и файлового
+        ввода-вывода), поэтому ее можно вызывать прямо из event loop.
+
+        Returns:
+            Словарь: процессы (всего/занято), задачи, таймауты, падения
+        """
+        with self._condition:
+            return {
+                **self._stats,
+                "workers": self._total,
+                "max_workers": self._max_workers,
+                "busy": self._busy
+            }
+
+    # ===== ВНУТРЕННИЕ МЕТОДЫ =====
+
+    def _limits(self) -> Dict:
+        """Получить лимиты пула из настроек."""
+        settings = get_settings()
+        limits = {
+            key: settings.get(f"{self._settings_prefix}_{key}", default)
+            for key, default in self._defaults.items()
+        }
+        self._max_workers = limits["workers"]
+        return limits
+
+    def _spawn(self) -> Optional[_SandboxWorker]:
+        """Запустить новый процесс-обработчик."""
+        try:
+            return _SandboxWorker(self._context, f"{self.name}-worker", self._preload)
+        except OSError as e:
+            print(f"Ошибка запуска обработчика {self.name}: {e}")
+            return None
+
+    def _acquire(self, max_workers: int) -> _SandboxWorker:
+        """Взять свободный процесс или запустить новый (ждет, если все заняты)."""
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise SandboxError("Пул обработчиков остановлен")
+                if self._idle:
+                    self._busy += 1
+                    return self._idle.pop()
+                if self._total < max(max_workers, 1):
+                    self._total += 1
+                    self._busy += 1
+                    break
+                self._condition.wait()
+
+        worker = self._spawn()
+        if worker is None:
+            with self._condition:
+                self._total -= 1
+                self._busy -= 1
+                self._condition.notify()
+            raise SandboxError("Не удалось запустить процесс-обработчик")
+        return worker
+
+    def _release(self, worker: _SandboxWorker, limits: Dict):
+        """Вернуть процесс в пул (или остановить лишний/отработавший свое)."""
+        with self._condition:
+            self._busy -= 1
+            keep = (
+                not self._closed
+                and self._total <= limits["workers"]
+                and worker.jobs < limits["max_jobs"]
+            )
+            if keep:
+                self._idle.append(worker)
+            else:
+                self._total -= 1
+                self._stats["restarts"] += 1
+            self._condition.notify()
+
+        if not keep:
+            worker.stop()
+
+    def _discard(self, worker: _SandboxWorker):
+        """Убить процесс после таймаута или падения."""
+        worker.kill()
+        with self._condition:
+            self._busy -= 1
+            self._total -= 1
+            self._stats["restarts"] += 1
+            self._condition.notify()
+
+
+# Изолированные процессы для разбора загруженных документов
+extraction_sandbox = SandboxPool(
+    "extraction",
+    "extraction_sandbox",
+    preload=("backend.services.document",)
+)
@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Dict
+from typing import Callable, Dict, List
 from backend.config import DATA_DIR
 from backend.services.json_utils import read_json, write_json, update_json
 
@@ -10,17 +10,76 @@ DEFAULT_SETTINGS = {
     "max_audio_file_size_mb": 100,
     "max_queue_size": 5,
     "max_concurrent_requests": 5,
-    "rate_limit_per_minute": 10
+    "max_concurrent_per_user": 3,
+    "max_queued_per_user": 0,
+    "queue_priority_enabled": True,
+    "queue_token_budget": 400000,
+    "queue_shortest_job_first": False,
+    "queue_sjf_max_wait_seconds": 120,
+    "transcription_max_concurrent": 2,
+    "transcription_max_queue_size": 5,
+    "transcription_max_concurrent_per_user": 1,
+    "transcription_max_queued_per_user": 2,
+    "rate_limit_per_minute": 10,
+    "jobs_retention_minutes": 60,
+    "extraction_cache_memory_items": 64,
+    "extraction_cache_disk_mb": 500,
+    "result_cache_enabled": True,
+    "result_cache_memory_items": 128,
+    "result_cache_disk_mb": 200,
+    "result_cache_ttl_hours": 168,
+    "pdf_engine": "pypdf2",
+    "pdf_extraction_workers": 0,
+    "pdf_parallel_min_pages": 20,
+    "max_pdf_pages": 1000,
+    "ocr_enabled": True,
+    "ocr_workers": 2,
+    "ocr_languages": "rus+eng",
+    "ocr_dpi": 300,
+    "ocr_max_pages": 100,
+    "extraction_sandbox_enabled": True,
+    "extraction_sandbox_workers": 2,
+    "extraction_sandbox_timeout_seconds": 180,
+    "extraction_sandbox_cpu_seconds": 120,
+    "extraction_sandbox_memory_mb": 4096,
+    "extraction_sandbox_max_jobs": 200,
+    "cpu_executor_workers": 0,
+    "io_executor_workers": 16,
+    "docx_engine": "stream",
+    "text_normalization_enabled": True,
+    "map_reduce_enabled": True,
+    "map_reduce_concurrency": 5,
+    "max_document_tokens": 750000
 }
 
+# Обработчики изменения настроек (вызываются после успешного сохранения)
+_settings_listeners: List[Callable[[Dict], None]] = []
+
+def add_settings_listener(listener: Callable[[Dict], None]):
+    """
+    Подписаться на изменение настроек.
+
+    Обработчик вызывается с новыми настройками в потоке, который их
+    сохранил, поэтому должен быть быстрым и потокобезопасным.
+
+    Args:
+        listener: Функция, принимающая словарь настроек
+    """
+    _settings_listeners.append(listener)
+
 def get_settings() -> Dict:
     """
     Получить текущие настройки системы.
 
+    Ключи, которых нет в файле (он мог быть создан до их появления,
+    например scripts/init_data.py), берутся из DEFAULT_SETTINGS.
+
     Returns:
         Словарь с настройками
     """
-    return read_json(SETTINGS_FILE, DEFAULT_SETTINGS.copy())
+    settings = DEFAULT_SETTINGS.copy()
+    settings.update(read_json(SETTINGS_FILE, {}) or {})
+    return settings
 
 def update_settings(updates: Dict) -> bool:
     """
@@ -32,7 +91,12 @@ def update_settings(updates: Dict) -> bool:
     Returns:
         True если обновление успешно
     """
-    return update_json(SETTINGS_FILE, updates, DEFAULT_SETTINGS.copy())
+    success = update_json(SETTINGS_FILE, updates, DEFAULT_SETTINGS.copy())
+    if success:
+        settings = get_settings()
+        for listener in _settings_listeners:
+            listener(settings)
+    return success
 
 def get_max_file_size_bytes() -> int:
     """
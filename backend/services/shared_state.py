@@ -0,0 +1,659 @@
+"""
+Общее состояние процессов сервера в SQLite (режим WAL).
+
+При запуске uvicorn с несколькими процессами (--workers N) у каждого
+процесса своя память: лимиты очереди и rate limit умножались бы на N, а
+задача, запущенная в одном процессе, не находилась бы запросом,
+попавшим в другой. Здесь хранится то, что должно быть общим:
+- аренды слотов очередей (queue_leases): выполняемые и ожидающие
+  запросы всех процессов, по ним проверяются глобальные лимиты;
+- счетчики rate limit (rate_limits) - хранилище для slowapi
+  (схема "sqlite://"), которое ведет счетчики в памяти процесса и
+  сверяет их с базой в фоновом потоке;
+- состояние фоновых задач (jobs).
+
+Внешние сервисы не нужны: база - файл data/shared_state.db, режим WAL
+позволяет читать параллельно с записью, а проверка лимита и занятие
+слота выполняются в одной транзакции BEGIN IMMEDIATE.
+
+Аренды и задачи продлеваются процессом-владельцем: аренды упавшего
+процесса истекают через LEASE_TTL_SECONDS и не занимают слоты навсегда,
+а его незавершенные задачи считаются завершенными с ошибкой.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from limits.storage import Storage
+from loguru import logger
+
+from backend.config import DATA_DIR
+
+SHARED_STATE_FILE = DATA_DIR / "shared_state.db"
+
+# Срок аренды слота без продления (процесс-владелец продлевает чаще)
+LEASE_TTL_SECONDS = 60
+
+# Идентификатор процесса (pid может быть переиспользован после перезапуска)
+PROCESS_ID = uuid.uuid4().hex
+
+# Ошибка задачи, процесс-владелец которой остановлен
+JOB_ABANDONED_ERROR = "Задача прервана: процесс сервера, выполнявший ее, остановлен"
+
+# Ожидание блокировки базы (все обращения идут вне event loop: операции
+# очередей и задач - в IO-пуле, сверка rate limit - в своем потоке)
+BUSY_TIMEOUT_SECONDS = 30
+
+# Период сверки счетчиков rate limit процесса с общей базой
+RATE_LIMIT_SYNC_SECONDS = 0.5
+
+# Период между сообщениями о недоступности базы для сверки rate limit
+RATE_LIMIT_WARNING_SECONDS = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue_leases (
+    id TEXT PRIMARY KEY,
+    queue TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    username TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    cost INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    created REAL NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS queue_leases_queue ON queue_leases (queue, state);
+
+CREATE TABLE IF NOT EXISTS rate_limits (
+    key TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rate_limits_expires ON rate_limits (expires);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    username TEXT NOT NULL,
+    data TEXT NOT NULL,
+    created REAL NOT NULL,
+    finished REAL,
+    heartbeat REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS jobs_username ON jobs (username);
+"""
+
+
+class SharedState:
+    """Подключение к общей базе (свое соединение на каждый поток)."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    # ===== СОЕДИНЕНИЕ =====
+
+    def _connection(self) -> sqlite3.Connection:
+        """Соединение текущего потока (создается при первом обращении)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(_SCHEMA)
+                    columns = [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]
+                    if "heartbeat" not in columns:
+                        # База, созданная до появления продления задач
+                        conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat REAL NOT NULL DEFAULT 0")
+                    self._initialized = True
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Транзакция с блокировкой записи (проверка и изменение атомарны)."""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    # ===== АРЕНДЫ СЛОТОВ ОЧЕРЕДИ =====
+
+    def queue_try_grant(self, queue: str, lease: Dict, limits: Dict, shortest_job_first: bool) -> Optional[str]:
+        """
+        Занять слот очереди, если это позволяют глобальные лимиты.
+
+        Слот не выдается, если в другом процессе ждет запрос, который
+        должен пройти раньше: более высокого класса, или того же класса
+        от пользователя с меньшим числом выполняемых запросов (в режиме
+        shortest-job-first - более дешевый), или при равенстве - более ранний.
+
+        Args:
+            queue: Имя очереди
+            lease: Запрос: id, username, priority (ранг, 0 - высший), cost, created
+            limits: max_concurrent, max_concurrent_per_user, token_budget
+
+        Returns:
+            None если слот занят, иначе причина отказа:
+            "user" - пользователь занял свой лимит, "busy" - нет места
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            self._purge_expired(conn, now)
+            active = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(cost), 0) FROM queue_leases WHERE queue = ? AND state = 'active'",
+                (queue,)
+            ).fetchone()
+            user_active = conn.execute(
+                "SELECT COUNT(*) FROM queue_leases WHERE queue = ? AND state = 'active' AND username = ?",
+                (queue, lease["username"])
+            ).fetchone()[0]
+
+            if limits["max_concurrent_per_user"] and user_active >= limits["max_concurrent_per_user"]:
+                return "user"
+            if active[0] >= limits["max_concurrent"]:
+                return "busy"
+            if limits["token_budget"] and active[0] and active[1] + lease["cost"] > limits["token_budget"]:
+                return "busy"
+            if self._has_foreign_predecessor(conn, queue, lease, user_active, limits, shortest_job_first):
+                return "busy"
+
+            conn.execute(
+                "INSERT OR REPLACE INTO queue_leases "
+                "(id, queue, owner, username, priority, cost, state, created, expires) "
+                "VALUES (?, ?, ?, ?, ?, ?, 'active', ?, ?)",
+                (lease["id"], queue, PROCESS_ID, lease["username"], lease["priority"],
+                 lease["cost"], lease["created"], now + LEASE_TTL_SECONDS)
+            )
+            return None
+
+    def _has_foreign_predecessor(self, conn: sqlite3.Connection, queue: str, lease: Dict,
+                                 user_active: int, limits: Dict, shortest_job_first: bool) -> bool:
+        """Ждет ли в другом процессе запрос, который должен пройти раньше."""
+        rows = conn.execute(
+            "SELECT l.username, l.priority, l.cost, l.created, "
+            "(SELECT COUNT(*) FROM queue_leases a WHERE a.queue = l.queue "
+            " AND a.state = 'active' AND a.username = l.username) "
+            "FROM queue_leases l WHERE l.queue = ? AND l.state = 'queued' AND l.owner != ?",
+            (queue, PROCESS_ID)
+        ).fetchall()
+        own_key = self._order_key(lease["priority"], user_active, lease["cost"], lease["created"], shortest_job_first)
+        for username, priority, cost, created, active in rows:
+            if limits["max_concurrent_per_user"] and active >= limits["max_concurrent_per_user"]:
+                continue
+            if self._order_key(priority, active, cost, created, shortest_job_first) < own_key:
+                return True
+        return False
+
+    @staticmethod
+    def _order_key(priority: int, user_active: int, cost: int, created: float, shortest_job_first: bool):
+        """Порядок запросов разных процессов."""
+        if shortest_job_first:
+            return (priority, cost, created)
+        return (priority, user_active, created)
+
+    def queue_enqueue(self, queue: str, lease: Dict, max_queue: int, max_queued_per_user: int) -> Optional[str]:
+        """
+        Записать ожидающий запрос, если позволяют глобальные лимиты очереди.
+
+        Args:
+            queue: Имя очереди
+            lease: Запрос: id, username, priority, cost, created
+            max_queue: Максимум ожидающих запросов
+            max_queued_per_user: Максимум ожидающих запросов пользователя (0 - без ограничения)
+
+        Returns:
+            None если запрос в очереди, иначе "user" (лимит пользователя)
+            или "full" (очередь переполнена)
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            self._purge_expired(conn, now)
+            queued = conn.execute(
+                "SELECT COUNT(*) FROM queue_leases WHERE queue = ? AND state = 'queued'",
+                (queue,)
+            ).fetchone()[0]
+            user_queued = conn.execute(
+                "SELECT COUNT(*) FROM queue_leases WHERE queue = ? AND state = 'queued' AND username = ?",
+                (queue, lease["username"])
+            ).fetchone()[0]
+            if max_queued_per_user and user_queued >= max_queued_per_user:
+                return "user"
+            if queued >= max_queue:
+                return "full"
+            # Запрос мог уже получить слот, пока проверялась очередь
+            conn.execute(
+                "INSERT OR IGNORE INTO queue_leases "
+                "(id, queue, owner, username, priority, cost, state, created, expires) "
+                "VALUES (?, ?, ?, ?, ?, ?, 'queued', ?, ?)",
+                (lease["id"], queue, PROCESS_ID, lease["username"], lease["priority"],
+                 lease["cost"], lease["created"], now + LEASE_TTL_SECONDS)
+            )
+            return None
+
+    def queue_remove(self, lease_id: str):
+        """
+        Удалить аренду (слот освобожден или запрос покинул очередь).
+
+        Args:
+            lease_id: Идентификатор запроса
+        """
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM queue_leases WHERE id = ?", (lease_id,))
+
+    def queue_refresh(self, lease_ids: List[str]):
+        """
+        Продлить аренды процесса.
+
+        Args:
+            lease_ids: Идентификаторы запросов этого процесса
+        """
+        if not lease_ids:
+            return
+        expires = time.time() + LEASE_TTL_SECONDS
+        with self._transaction() as conn:
+            conn.executemany(
+                "UPDATE queue_leases SET expires = ? WHERE id = ?",
+                [(expires, lease_id) for lease_id in lease_ids]
+            )
+
+    def queue_foreign_waiting(self, queue: str) -> List[Dict]:
+        """
+        Получить запросы, ожидающие в других процессах.
+
+        Args:
+            queue: Имя очереди
+
+        Returns:
+            Список словарей: username, priority, cost, created
+        """
+        rows = self._connection().execute(
+            "SELECT username, priority, cost, created FROM queue_leases "
+            "WHERE queue = ? AND state = 'queued' AND owner != ? AND expires > ?",
+            (queue, PROCESS_ID, time.time())
+        ).fetchall()
+        return [
+            {"username": username, "priority": priority, "cost": cost, "created": created}
+            for username, priority, cost, created in rows
+        ]
+
+    def queue_counts(self, queue: str, username: Optional[str] = None) -> Dict:
+        """
+        Получить глобальные счетчики очереди.
+
+        Args:
+            queue: Имя очереди
+            username: Пользователь, для которого добавить его счетчики
+
+        Returns:
+            Словарь: active, active_tokens, queued, queued_tokens,
+            queued_by_priority (ранг -> количество), users_active
+            и, если указан пользователь, user_active, user_queued
+        """
+        conn = self._connection()
+        now = time.time()
+        counts = {
+            "active": 0, "active_tokens": 0,
+            "queued": 0, "queued_tokens": 0
+        }
+        for state, count, cost in conn.execute(
+            "SELECT state, COUNT(*), COALESCE(SUM(cost), 0) FROM queue_leases "
+            "WHERE queue = ? AND expires > ? GROUP BY state",
+            (queue, now)
+        ):
+            counts[state] = count
+            counts[f"{state}_tokens"] = cost
+        counts["queued_by_priority"] = dict(conn.execute(
+            "SELECT priority, COUNT(*) FROM queue_leases "
+            "WHERE queue = ? AND state = 'queued' AND expires > ? GROUP BY priority",
+            (queue, now)
+        ).fetchall())
+        counts["users_active"] = conn.execute(
+            "SELECT COUNT(DISTINCT username) FROM queue_leases "
+            "WHERE queue = ? AND state = 'active' AND expires > ?",
+            (queue, now)
+        ).fetchone()[0]
+        if username is not None:
+            user_counts = dict(conn.execute(
+                "SELECT state, COUNT(*) FROM queue_leases "
+                "WHERE queue = ? AND username = ? AND expires > ? GROUP BY state",
+                (queue, username, now)
+            ).fetchall())
+            counts["user_active"] = user_counts.get("active", 0)
+            counts["user_queued"] = user_counts.get("queued", 0)
+        return counts
+
+    def queue_release_owner(self, queue: str):
+        """
+        Удалить все аренды этого процесса в очереди (при завершении сервера).
+
+        Args:
+            queue: Имя очереди
+        """
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM queue_leases WHERE queue = ? AND owner = ?", (queue, PROCESS_ID))
+
+    @staticmethod
+    def _purge_expired(conn: sqlite3.Connection, now: float):
+        """Удалить аренды, которые не продлевались (процесс упал)."""
+        conn.execute("DELETE FROM queue_leases WHERE expires <= ?", (now,))
+
+    # ===== RATE LIMIT =====
+
+    def rate_sync(self, hits: Dict[str, Tuple[int, float]]) -> Dict[str, Tuple[int, float]]:
+        """
+        Добавить к счетчикам запросы процесса и получить общие значения.
+
+        Args:
+            hits: {ключ: (новых запросов процесса, длительность окна)};
+                ключи без новых запросов только читаются
+
+        Returns:
+            {ключ: (значение счетчика, окончание окна)} для ключей с
+            действующим окном
+        """
+        now = time.time()
+        totals = {}
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM rate_limits WHERE expires <= ?", (now,))
+            for key, (amount, expiry) in hits.items():
+                row = conn.execute(
+                    "SELECT count, expires FROM rate_limits WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    if not amount:
+                        continue
+                    totals[key] = (amount, now + expiry)
+                    conn.execute(
+                        "INSERT INTO rate_limits (key, count, expires) VALUES (?, ?, ?)",
+                        (key, amount, now + expiry)
+                    )
+                else:
+                    totals[key] = (row[0] + amount, row[1])
+                    if amount:
+                        conn.execute("UPDATE rate_limits SET count = count + ? WHERE key = ?", (amount, key))
+        return totals
+
+    def rate_get(self, key: str) -> int:
+        """Значение счетчика (0, если окно истекло)."""
+        row = self._connection().execute(
+            "SELECT count FROM rate_limits WHERE key = ? AND expires > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def rate_clear(self, key: Optional[str] = None) -> int:
+        """Сбросить счетчик (или все счетчики, если ключ не указан)."""
+        with self._transaction() as conn:
+            if key is None:
+                return conn.execute("DELETE FROM rate_limits").rowcount
+            return conn.execute("DELETE FROM rate_limits WHERE key = ?", (key,)).rowcount
+
+    # ===== ФОНОВЫЕ ЗАДАЧИ =====
+
+    def job_save(self, job_id: str, username: str, data: Dict, created: float, finished: Optional[float]):
+        """
+        Сохранить состояние задачи (и продлить ее).
+
+        Args:
+            job_id: Идентификатор задачи
+            username: Владелец задачи
+            data: Состояние задачи (Job.to_dict)
+            created: Время создания
+            finished: Время завершения (None - выполняется)
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, owner, username, data, created, finished, heartbeat) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, PROCESS_ID, username, json.dumps(data, ensure_ascii=False), created, finished, time.time())
+            )
+
+    def job_heartbeat(self, job_ids: List[str]):
+        """
+        Продлить выполняющиеся задачи процесса.
+
+        Args:
+            job_ids: Идентификаторы задач этого процесса
+        """
+        if not job_ids:
+            return
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany(
+                "UPDATE jobs SET heartbeat = ? WHERE id = ? AND finished IS NULL",
+                [(now, job_id) for job_id in job_ids]
+            )
+
+    def job_get(self, job_id: str) -> Optional[Dict]:
+        """
+        Получить состояние задачи.
+
+        Незавершенная задача, которую владелец не продлевал дольше
+        LEASE_TTL_SECONDS (процесс упал), возвращается завершенной с ошибкой.
+
+        Args:
+            job_id: Идентификатор задачи
+
+        Returns:
+            Состояние задачи (Job.to_dict) или None
+        """
+        row = self._connection().execute(
+            "SELECT data, finished, heartbeat FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] is None and self._is_stale(row[2]):
+            self.job_expire_stale()
+            row = self._connection().execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+        return json.loads(row[0])
+
+    def job_list(self, username: str) -> List[Dict]:
+        """
+        Получить задачи пользователя (новые первыми).
+
+        Args:
+            username: Имя пользователя
+
+        Returns:
+            Список состояний задач
+        """
+        query = "SELECT data, finished, heartbeat FROM jobs WHERE username = ? ORDER BY created DESC"
+        rows = self._connection().execute(query, (username,)).fetchall()
+        if any(finished is None and self._is_stale(heartbeat) for _, finished, heartbeat in rows):
+            self.job_expire_stale()
+            rows = self._connection().execute(query, (username,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def job_expire_stale(self):
+        """Завершить с ошибкой задачи, которые владелец перестал продлевать."""
+        with self._transaction() as conn:
+            self._fail_jobs(conn, "heartbeat < ?", (time.time() - LEASE_TTL_SECONDS,))
+
+    def job_release_owner(self):
+        """Завершить с ошибкой незавершенные задачи этого процесса (при завершении сервера)."""
+        with self._transaction() as conn:
+            self._fail_jobs(conn, "owner = ?", (PROCESS_ID,))
+
+    def job_cleanup(self, finished_before: float):
+        """
+        Удалить задачи, завершенные раньше указанного времени.
+
+        Args:
+            finished_before: Граница времени завершения
+        """
+        with self._transaction() as conn:
+            self._fail_jobs(conn, "heartbeat < ?", (time.time() - LEASE_TTL_SECONDS,))
+            conn.execute("DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?", (finished_before,))
+
+    @staticmethod
+    def _is_stale(heartbeat: float) -> bool:
+        """Задачу давно не продлевали."""
+        return heartbeat < time.time() - LEASE_TTL_SECONDS
+
+    @staticmethod
+    def _fail_jobs(conn: sqlite3.Connection, condition: str, params: tuple):
+        """Завершить с ошибкой незавершенные задачи, подходящие под условие."""
+        now = time.time()
+        rows = conn.execute(
+            f"SELECT id, data FROM jobs WHERE finished IS NULL AND {condition}", params
+        ).fetchall()
+        for job_id, raw in rows:
+            data = json.loads(raw)
+            data.update({
+                "status": "error",
+                "stage": "Ошибка",
+                "queue_position": None,
+                "error": JOB_ABANDONED_ERROR,
+                "finished_at": now
+            })
+            conn.execute(
+                "UPDATE jobs SET data = ?, finished = ? WHERE id = ?",
+                (json.dumps(data, ensure_ascii=False), now, job_id)
+            )
+
+
+# Общее состояние процессов сервера
+shared_state = SharedState(SHARED_STATE_FILE)
+
+
+class SQLiteStorage(Storage):
+    """
+    Хранилище rate limit (slowapi/limits) в общей базе процессов.
+
+    Подключается строкой "sqlite://" (storage_uri лимитера); поддерживает
+    стратегию фиксированного окна (по умолчанию в slowapi).
+
+    slowapi обращается к хранилищу прямо в event loop, поэтому проверка
+    лимита не обращается к базе: счетчики окон ведутся в памяти процесса,
+    а фоновый поток раз в RATE_LIMIT_SYNC_SECONDS отправляет в базу
+    запросы процесса и получает общие значения счетчиков. Запросы других
+    процессов учитываются с задержкой до одного периода сверки; пока база
+    недоступна, лимит действует по запросам самого процесса и общим
+    значениям последней сверки.
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri: Optional[str] = None, wrap_exceptions: bool = False, **options):
+        self._state = shared_state
+        # Окна счетчиков: {ключ: {"count" - общее значение по последней
+        # сверке, "pending" - еще не отправленные запросы процесса,
+        # "expiry" - длительность окна, "expires" - окончание окна}}
+        self._windows: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        # Сверки не выполняются параллельно (иначе запросы отправились бы дважды)
+        self._sync_lock = threading.Lock()
+        self._sync_thread: Optional[threading.Thread] = None
+        self._warned_at = 0.0
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def incr(self, key: str, expiry: float, elastic_expiry: bool = False, amount: int = 1) -> int:
+        now = time.time()
+        with self._lock:
+            window = self._window(key, now)
+            if window is None:
+                window = {"count": 0, "pending": 0, "expiry": expiry, "expires": now + expiry}
+                self._windows[key] = window
+            window["pending"] += amount
+            if self._sync_thread is None:
+                self._sync_thread = threading.Thread(target=self._sync_loop, name="rate-limit-sync", daemon=True)
+                self._sync_thread.start()
+            return window["count"] + window["pending"]
+
+    def get(self, key: str) -> int:
+        with self._lock:
+            window = self._window(key, time.time())
+            return window["count"] + window["pending"] if window else 0
+
+    def get_expiry(self, key: str) -> float:
+        now = time.time()
+        with self._lock:
+            window = self._window(key, now)
+            return window["expires"] if window else now
+
+    def check(self) -> bool:
+        try:
+            self._state.rate_get("")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> Optional[int]:
+        with self._lock:
+            self._windows.clear()
+        return self._state.rate_clear()
+
+    def clear(self, key: str) -> None:
+        with self._lock:
+            self._windows.pop(key, None)
+        self._state.rate_clear(key)
+
+    def sync(self):
+        """Сверить счетчики процесса с общей базой (блокирующий вызов)."""
+        with self._sync_lock:
+            self._sync()
+
+    def _sync(self):
+        """Сверка счетчиков (вызывается под _sync_lock)."""
+        now = time.time()
+        with self._lock:
+            for key in [key for key, window in self._windows.items() if window["expires"] <= now]:
+                del self._windows[key]
+            sent = {key: (window, window["pending"]) for key, window in self._windows.items()}
+        if not sent:
+            return
+
+        totals = self._state.rate_sync({
+            key: (pending, window["expiry"]) for key, (window, pending) in sent.items()
+        })
+
+        with self._lock:
+            for key, (window, pending) in sent.items():
+                # Окно могло истечь и начаться заново, пока шла сверка
+                if self._windows.get(key) is not window:
+                    continue
+                window["pending"] -= pending
+                if key in totals:
+                    window["count"], window["expires"] = totals[key]
+
+    def _window(self, key: str, now: float) -> Optional[Dict]:
+        """Действующее окно счетчика (вызывается под блокировкой)."""
+        window = self._windows.get(key)
+        if window is not None and window["expires"] <= now:
+            del self._windows[key]
+            return None
+        return window
+
+    def _sync_loop(self):
+        """Сверять счетчики с общей базой, пока работает процесс."""
+        while True:
+            time.sleep(RATE_LIMIT_SYNC_SECONDS)
+            try:
+                self.sync()
+            except Exception as e:
+                # Не отправленные запросы остаются в pending до следующей сверки
+                now = time.time()
+                if now - self._warned_at > RATE_LIMIT_WARNING_SECONDS:
+                    self._warned_at = now
+                    logger.warning(f"Ошибка сверки rate limit с общей базой, лимит считается по счетчикам процесса: {e}")
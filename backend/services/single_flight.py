@@ -0,0 +1,145 @@
+"""
+Объединение одинаковых одновременных запросов (single-flight).
+
+Когда несколько пользователей почти одновременно загружают один и тот же
+договор, к LLM уходит один запрос: первый запрос («ведущий») запускает
+обработку, остальные подписываются на ее события и получают тот же
+результат. Слот очереди и токены расходуются один раз.
+
+Обработка выполняется в отдельной задаче и не зависит от того, кто из
+подписчиков ее запустил. События (статус, фрагменты результата)
+сохраняются, поэтому подписчик, пришедший позже, получает их с начала.
+
+Обработка в SingleFlight отменяется, когда от нее отписался последний
+подписчик (все клиенты отключились): отключение одного из нескольких
+клиентов общую обработку не прерывает.
+"""
+
+import asyncio
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+
+class Flight:
+    """Одна выполняющаяся обработка и ее события."""
+
+    def __init__(self, key: str, source: AsyncIterator[Tuple[str, str]], cancel_when_abandoned: bool = False):
+        self.key = key
+        self._events: List[Tuple[str, str]] = []
+        self._error: Optional[BaseException] = None
+        self._done = False
+        self._subscribers = 0
+        self._cancel_when_abandoned = cancel_when_abandoned
+        self.abandoned = False
+        self._changed = asyncio.Event()
+        self.task = asyncio.create_task(self._run(source))
+
+    @property
+    def done(self) -> bool:
+        """Обработка завершена (успешно или с ошибкой)."""
+        return self._done
+
+    async def _run(self, source: AsyncIterator[Tuple[str, str]]):
+        """Прочитать все события источника."""
+        try:
+            async for event in source:
+                self._events.append(event)
+                self._notify()
+        except BaseException as e:
+            self._error = e
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            self._done = True
+            self._notify()
+
+    def _notify(self):
+        """Разбудить подписчиков, ожидающих новых событий."""
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def events(self) -> AsyncIterator[Tuple[str, str]]:
+        """
+        Получить события обработки (с начала).
+
+        Yields:
+            События (тип, данные)
+
+        Raises:
+            Исключение источника, если обработка завершилась ошибкой
+        """
+        index = 0
+        self._subscribers += 1
+        try:
+            while True:
+                while index < len(self._events):
+                    yield self._events[index]
+                    index += 1
+                if self._done:
+                    if self._error is not None:
+                        raise self._error
+                    return
+                await self._changed.wait()
+        finally:
+            self._subscribers -= 1
+            if not self._subscribers and not self._done and self._cancel_when_abandoned:
+                # Все подписчики отключились - результат никому не нужен
+                self.abandoned = True
+                self.task.cancel()
+
+
+class SingleFlight:
+    """Реестр выполняющихся обработок по ключу."""
+
+    def __init__(self):
+        self._flights: Dict[str, Flight] = {}
+        self._stats = {
+            "started": 0,
+            "joined": 0,
+            "cancelled": 0
+        }
+
+    def join(self, key: str, factory: Callable[[], AsyncIterator[Tuple[str, str]]]) -> Tuple[Flight, bool]:
+        """
+        Присоединиться к обработке с таким ключом или запустить новую.
+
+        Args:
+            key: Ключ запроса
+            factory: Создает источник событий (вызывается только для новой обработки)
+
+        Returns:
+            Кортеж (обработка, запущена ли она этим вызовом)
+        """
+        flight = self._flights.get(key)
+        if flight is not None and not flight.done and not flight.abandoned:
+            self._stats["joined"] += 1
+            return flight, False
+
+        flight = Flight(key, factory(), cancel_when_abandoned=True)
+        self._flights[key] = flight
+        self._stats["started"] += 1
+        flight.task.add_done_callback(lambda _: self._forget(flight))
+        return flight, True
+
+    def _forget(self, flight: Flight):
+        """Убрать завершенную обработку из реестра."""
+        if flight.abandoned:
+            self._stats["cancelled"] += 1
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    def get_stats(self) -> Dict:
+        """
+        Получить статистику объединения запросов.
+
+        Returns:
+            Словарь: запущено обработок, присоединено запросов, отменено
+            (все клиенты отключились), выполняется сейчас
+        """
+        return {
+            **self._stats,
+            "in_flight": len(self._flights)
+        }
+
+
+# Одновременные анализы одного договора с одним промптом и моделью
+analysis_flights = SingleFlight()
@@ -0,0 +1,135 @@
+"""
+Нормализация извлеченного текста перед отправкой в LLM.
+
+PDF-договоры повторяют на каждой странице один и тот же колонтитул,
+номер страницы и блок подписей. Нормализация:
+- удаляет строки в начале и конце страниц, которые повторяются на
+  большинстве страниц (без учета регистра, пробелов и номера самой страницы);
+- удаляет строки с номерами страниц ("- 3 -", "Стр. 3 из 10", "3/10");
+- схлопывает повторяющиеся пробелы и пустые строки;
+- убирает маркеры страниц, на которых не осталось текста.
+
+Содержимое договора не меняется: повторы ищутся только в зоне колонтитулов.
+"""
+
+import re
+from typing import Dict, List, Tuple
+
+from backend.services.token_counter import count_tokens
+
+PAGE_MARKER_RE = re.compile(r"^=== Страница (\d+) ===$", re.MULTILINE)
+
+# Строка с номером страницы: "5", "- 5 -", "Стр. 5", "Страница 5 из 12", "5/12"
+PAGE_NUMBER_RE = re.compile(
+    r"^\s*(?:стр(?:аница)?\.?\s*)?[-–—]?\s*\d{1,4}\s*(?:(?:из|/)\s*\d{1,4})?\s*[-–—]?\s*$",
+    re.IGNORECASE
+)
+
+_SPACES_RE = re.compile(r"[ \t\u00a0]+")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+# Сколько непустых строк в начале и конце страницы считаются колонтитулом
+EDGE_LINES = 3
+
+# Повтор считается колонтитулом, если он есть хотя бы на стольких страницах
+# (и не меньше чем на половине страниц)
+MIN_REPEAT_PAGES = 3
+
+
+def _line_key(line: str, page_number: str) -> str:
+    """
+    Ключ строки для поиска повторов.
+
+    Номер страницы заменяется на "#" только как отдельное число
+    ("Стр. 5 из 12" -> "стр. # из 12"), номера пунктов вида "5.1" не трогаются.
+    """
+    line = re.sub(rf"(?<![\d.,]){page_number}(?!\d|[.,]\d)", "#", line)
+    return _SPACES_RE.sub(" ", line).strip().lower()
+
+
+def _split_pages(text: str) -> Tuple[str, List[Tuple[str, str, List[str]]]]:
+    """
+    Разбить текст на страницы по маркерам "=== Страница N ===".
+
+    Returns:
+        Кортеж (текст до первого маркера, [(маркер, номер страницы, строки страницы)])
+    """
+    markers = list(PAGE_MARKER_RE.finditer(text))
+    if not markers:
+        return text, []
+
+    preamble = text[:markers[0].start()]
+    pages = []
+    for index, marker in enumerate(markers):
+        end = markers[index + 1].start() if index + 1 < len(markers) else len(text)
+        body = text[marker.end():end]
+        pages.append((marker.group(0), marker.group(1), body.split("\n")))
+    return preamble, pages
+
+
+def _edge_indexes(lines: List[str]) -> List[int]:
+    """Индексы первых и последних EDGE_LINES непустых строк страницы."""
+    non_empty = [index for index, line in enumerate(lines) if line.strip()]
+    return sorted(set(non_empty[:EDGE_LINES] + non_empty[-EDGE_LINES:]))
+
+
+def _find_repeated_keys(pages: List[Tuple[str, str, List[str]]]) -> set:
+    """Найти ключи строк колонтитулов, повторяющихся на большинстве страниц."""
+    if len(pages) < MIN_REPEAT_PAGES:
+        return set()
+
+    counts: Dict[str, int] = {}
+    for _, page_number, lines in pages:
+        keys = {_line_key(lines[index], page_number) for index in _edge_indexes(lines)}
+        for key in keys:
+            counts[key] = counts.get(key, 0) + 1
+
+    threshold = max(MIN_REPEAT_PAGES, (len(pages) + 1) // 2)
+    return {key for key, count in counts.items() if key and count >= threshold}
+
+
+def _collapse_whitespace(text: str) -> str:
+    """Схлопнуть пробелы внутри строк и серии пустых строк."""
+    lines = [_SPACES_RE.sub(" ", line).strip() for line in text.split("\n")]
+    return _BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip()
+
+
+def normalize_text(text: str) -> Tuple[str, int]:
+    """
+    Очистить текст документа от колонтитулов, номеров страниц и лишних пробелов.
+
+    Args:
+        text: Извлеченный текст документа
+
+    Returns:
+        Кортеж (нормализованный текст, сэкономлено токенов). Экономия
+        считается по удаленным строкам и маркерам; схлопывание пробелов
+        в нее не входит.
+    """
+    preamble, pages = _split_pages(text)
+    if not pages:
+        return _collapse_whitespace(text), 0
+
+    repeated = _find_repeated_keys(pages)
+    removed: List[str] = []
+    parts = [_collapse_whitespace(preamble)] if preamble.strip() else []
+
+    for marker, page_number, lines in pages:
+        drop = set()
+        for index in _edge_indexes(lines):
+            line = lines[index]
+            if PAGE_NUMBER_RE.match(line) or _line_key(line, page_number) in repeated:
+                drop.add(index)
+
+        removed.extend(lines[index] for index in sorted(drop))
+        page_text = _collapse_whitespace("\n".join(
+            line for index, line in enumerate(lines) if index not in drop
+        ))
+
+        if page_text:
+            parts.append(f"{marker}\n{page_text}")
+        else:
+            removed.append(marker)
+
+    saved_tokens = count_tokens("\n".join(removed)) if removed else 0
+    return "\n\n".join(parts), saved_tokens
@@ -0,0 +1,242 @@
+"""
+Подсчет токенов с учетом модели.
+
+Токенизатор модели загружается один раз и кэшируется. Файлы токенизаторов
+(tokenizer.json в формате HuggingFace) лежат в data/tokenizers/<модель>.json;
+для моделей DeepSeek их скачивает scripts/init_data.py (адреса - в
+TOKENIZER_URLS). Если файла или пакета tokenizers нет, используется оценка
+по символам, откалиброванная для кириллицы (об этом один раз пишется в
+лог); файл, добавленный позже, подхватывается без перезапуска.
+"""
+
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from backend.config import DATA_DIR
+from backend.services.llm_config import get_llm_config, get_current_model_name
+from backend.services.settings import get_settings
+
+TOKENIZERS_DIR = DATA_DIR / "tokenizers"
+
+# Откуда скачать токенизаторы моделей (scripts/init_data.py)
+TOKENIZER_URLS = {
+    "deepseek-chat": "https://huggingface.co/deepseek-ai/DeepSeek-V3/resolve/main/tokenizer.json",
+    "deepseek-reasoner": "https://huggingface.co/deepseek-ai/DeepSeek-R1/resolve/main/tokenizer.json",
+}
+
+# Максимальная длина ответа модели (max_tokens в запросах к LLM)
+MAX_OUTPUT_TOKENS = 4000
+
+# Служебные токены на одно сообщение чата (роль, разделители)
+MESSAGE_OVERHEAD_TOKENS = 8
+
+# Контекстные окна известных моделей
+MODEL_CONTEXT_WINDOWS = {
+    "deepseek-chat": 128000,
+    "deepseek-reasoner": 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 32768
+
+# Размер части текста при пакетном подсчете
+COUNT_CHUNK_CHARS = 64 * 1024
+
+_CYRILLIC_RE = re.compile(r"[Ѐ-ӿ]")
+_WHITESPACE_RE = re.compile(r"\s")
+
+
+def _estimate_tokens(text: str) -> int:
+    """
+    Оценить количество токенов без токенизатора.
+
+    BPE-токенизаторы кодируют кириллицу заметно плотнее латиницы по байтам,
+    но дробнее по символам: ~2.5 символа кириллицы на токен против ~4 для
+    латиницы и цифр. Оценка намеренно немного завышена.
+    """
+    cyrillic = len(_CYRILLIC_RE.findall(text))
+    whitespace = len(_WHITESPACE_RE.findall(text))
+    other = len(text) - cyrillic - whitespace
+    return int(cyrillic / 2.5 + other / 4 + whitespace / 8) + 1
+
+
+def _split_for_counting(text: str) -> List[str]:
+    """Разбить текст на части по границам пробелов для пакетного подсчета."""
+    chunks = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(start + COUNT_CHUNK_CHARS, length)
+        if end < length:
+            space = text.rfind(" ", start, end)
+            if space > start:
+                end = space
+        chunks.append(text[start:end])
+        start = end
+    return chunks
+
+
+# Загруженные токенизаторы (промахи не кэшируются: файл могут добавить позже)
+_tokenizers: Dict[str, Callable[[List[str]], int]] = {}
+_tokenizers_lock = threading.Lock()
+
+# Модели, для которых уже записано сообщение о переходе на оценку
+_fallback_logged: Set[str] = set()
+
+
+def _log_fallback(model: str, reason: str):
+    """Сообщить (один раз на модель), что токены оцениваются по символам."""
+    if model in _fallback_logged:
+        return
+    _fallback_logged.add(model)
+    print(f"{reason}; для модели {model} используется оценка токенов по символам")
+
+
+def _load_tokenizer(model: str) -> Optional[Callable[[List[str]], int]]:
+    """
+    Загрузить токенизатор модели (один раз на модель).
+
+    Returns:
+        Функция подсчета токенов для списка частей текста или None
+    """
+    tokenizer = _tokenizers.get(model)
+    if tokenizer is not None:
+        return tokenizer
+
+    tokenizer_file = TOKENIZERS_DIR / f"{model.replace('/', '_')}.json"
+    if not tokenizer_file.exists():
+        _log_fallback(model, f"Файл токенизатора {tokenizer_file} не найден")
+        return None
+
+    try:
+        from tokenizers import Tokenizer
+    except ImportError:
+        _log_fallback(model, "Пакет tokenizers не установлен")
+        return None
+
+    with _tokenizers_lock:
+        if model in _tokenizers:
+            return _tokenizers[model]
+        try:
+            tokenizer = Tokenizer.from_file(str(tokenizer_file))
+        except Exception as e:
+            _log_fallback(model, f"Ошибка загрузки токенизатора {tokenizer_file}: {e}")
+            return None
+
+        def count(chunks: List[str]) -> int:
+            # encode_batch кодирует части параллельно (в потоках Rust)
+            encodings = tokenizer.encode_batch(chunks, add_special_tokens=False)
+            return sum(len(encoding.ids) for encoding in encodings)
+
+        _tokenizers[model] = count
+        _fallback_logged.discard(model)
+        return count
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    Посчитать количество токенов в тексте.
+
+    Args:
+        text: Текст
+        model: Имя модели (по умолчанию - текущая модель из настроек LLM)
+
+    Returns:
+        Количество токенов
+    """
+    if not text:
+        return 0
+
+    tokenizer = _load_tokenizer(model or get_current_model_name())
+    if tokenizer is None:
+        return _estimate_tokens(text)
+    return tokenizer(_split_for_counting(text))
+
+
+def count_message_tokens(system_prompt: str, user_content: str, model: Optional[str] = None) -> int:
+    """
+    Посчитать токены запроса к чату (системный промпт + сообщение пользователя).
+
+    Args:
+        system_prompt: Системный промпт
+        user_content: Сообщение пользователя
+        model: Имя модели
+
+    Returns:
+        Количество токенов запроса
+    """
+    return (
+        count_tokens(system_prompt, model)
+        + count_tokens(user_content, model)
+        + 2 * MESSAGE_OVERHEAD_TOKENS
+    )
+
+
+def get_context_window(model: Optional[str] = None) -> int:
+    """
+    Получить размер контекстного окна модели.
+
+    Для LM Studio размер берется из llm_config.json (lmstudio_context_window).
+
+    Args:
+        model: Имя модели (по умолчанию - текущая)
+
+    Returns:
+        Размер окна в токенах
+    """
+    model = model or get_current_model_name()
+    if model in MODEL_CONTEXT_WINDOWS:
+        return MODEL_CONTEXT_WINDOWS[model]
+
+    config = get_llm_config()
+    if model == config.get("lmstudio_model"):
+        return config.get("lmstudio_context_window", DEFAULT_CONTEXT_WINDOW)
+    return DEFAULT_CONTEXT_WINDOW
+
+
+def get_input_budget(model: Optional[str] = None) -> int:
+    """
+    Получить максимальный размер запроса (окно модели минус место под ответ).
+
+    Args:
+        model: Имя модели
+
+    Returns:
+        Бюджет запроса в токенах
+    """
+    return get_context_window(model) - MAX_OUTPUT_TOKENS
+
+
+def check_message_fits(system_prompt: str, user_content: str, model: Optional[str] = None) -> Tuple[bool, int, int]:
+    """
+    Проверить, помещается ли запрос в контекст модели.
+
+    Args:
+        system_prompt: Системный промпт
+        user_content: Сообщение пользователя
+        model: Имя модели
+
+    Returns:
+        Кортеж (помещается, токенов в запросе, бюджет)
+    """
+    tokens = count_message_tokens(system_prompt, user_content, model)
+    budget = get_input_budget(model)
+    return tokens <= budget, tokens, budget
+
+
+def get_document_token_limit(model: Optional[str] = None) -> int:
+    """
+    Получить максимальный размер документа для анализа.
+
+    При включенном анализе по частям (map_reduce_enabled) лимит задается
+    настройкой max_document_tokens, иначе - контекстом модели.
+
+    Args:
+        model: Имя модели
+
+    Returns:
+        Лимит в токенах
+    """
+    settings = get_settings()
+    if settings.get("map_reduce_enabled", True):
+        return settings.get("max_document_tokens", 750000)
+    return get_input_budget(model)
@@ -1,7 +1,8 @@
+import copy
 from datetime import datetime
-from typing import Dict
+from typing import Callable, Dict
 from backend.config import DATA_DIR
-from backend.services.json_utils import read_json, write_json
+from backend.services.json_utils import read_json, write_json, file_lock
 
 TOKENS_FILE = DATA_DIR / "tokens_usage.json"
 
@@ -13,10 +14,23 @@ DEFAULT_STATS = {
     "total_prompt_tokens": 0,
     "total_completion_tokens": 0,
     "total_cost_usd": 0.0,
+    "total_saved_tokens": 0,
+    "total_cache_hits": 0,
+    "total_coalesced": 0,
+    "total_cancelled": 0,
     "users": {},
     "last_updated": ""
 }
 
+def _new_user_stats() -> Dict:
+    """Пустая статистика пользователя."""
+    return {
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "requests_count": 0,
+        "cost_usd": 0.0
+    }
+
 def get_tokens_stats() -> Dict:
     """
     Получить статистику использования токенов.
@@ -24,7 +38,27 @@ def get_tokens_stats() -> Dict:
     Returns:
         Словарь со статистикой
     """
-    return read_json(TOKENS_FILE, DEFAULT_STATS.copy())
+    return read_json(TOKENS_FILE, copy.deepcopy(DEFAULT_STATS))
+
+def _update_stats(username: str, update: Callable[[Dict, Dict], None]):
+    """
+    Обновить статистику под блокировкой файла статистики.
+
+    Счетчики обновляются из потоков IO-пула всех процессов сервера:
+    без блокировки на все чтение-изменение-запись параллельные обновления
+    затирали бы друг друга.
+
+    Args:
+        username: Имя пользователя
+        update: Функция, изменяющая общую статистику и статистику пользователя
+    """
+    with file_lock(TOKENS_FILE):
+        stats = get_tokens_stats()
+        if username not in stats["users"]:
+            stats["users"][username] = _new_user_stats()
+        update(stats, stats["users"][username])
+        stats["last_updated"] = datetime.now().isoformat()
+        write_json(TOKENS_FILE, stats)
 
 def track_tokens(username: str, prompt_tokens: int, completion_tokens: int):
     """
@@ -35,34 +69,82 @@ def track_tokens(username: str, prompt_tokens: int, completion_tokens: int):
         prompt_tokens: Количество токенов в промпте
         completion_tokens: Количество токенов в ответе
     """
-    stats = get_tokens_stats()
-
     # Рассчитать стоимость
     cost = (prompt_tokens * PROMPT_TOKEN_COST) + (completion_tokens * COMPLETION_TOKEN_COST)
 
-    # Обновить общую статистику
-    stats["total_prompt_tokens"] += prompt_tokens
-    stats["total_completion_tokens"] += completion_tokens
-    stats["total_cost_usd"] += cost
-    stats["last_updated"] = datetime.now().isoformat()
-
-    # Обновить статистику пользователя
-    if username not in stats["users"]:
-        stats["users"][username] = {
-            "prompt_tokens": 0,
-            "completion_tokens": 0,
-            "requests_count": 0,
-            "cost_usd": 0.0
-        }
+    def update(stats: Dict, user_stats: Dict):
+        # Обновить общую статистику
+        stats["total_prompt_tokens"] += prompt_tokens
+        stats["total_completion_tokens"] += completion_tokens
+        stats["total_cost_usd"] += cost
+
+        # Обновить статистику пользователя
+        user_stats["prompt_tokens"] += prompt_tokens
+        user_stats["completion_tokens"] += completion_tokens
+        user_stats["requests_count"] += 1
+        user_stats["cost_usd"] += cost
+        user_stats["last_used"] = datetime.now().isoformat()
+
+    _update_stats(username, update)
+
+def track_saved_tokens(username: str, saved_tokens: int):
+    """
+    Учесть токены, сэкономленные нормализацией текста.
+
+    Args:
+        username: Имя пользователя
+        saved_tokens: Количество сэкономленных токенов промпта
+    """
+    if saved_tokens <= 0:
+        return
+
+    def update(stats: Dict, user_stats: Dict):
+        stats["total_saved_tokens"] = stats.get("total_saved_tokens", 0) + saved_tokens
+        user_stats["saved_tokens"] = user_stats.get("saved_tokens", 0) + saved_tokens
 
-    user_stats = stats["users"][username]
-    user_stats["prompt_tokens"] += prompt_tokens
-    user_stats["completion_tokens"] += completion_tokens
-    user_stats["requests_count"] += 1
-    user_stats["cost_usd"] += cost
-    user_stats["last_used"] = datetime.now().isoformat()
+    _update_stats(username, update)
+
+def track_cache_hit(username: str):
+    """
+    Учесть запрос, результат которого взят из кэша (без обращения к LLM).
+
+    Args:
+        username: Имя пользователя
+    """
+    def update(stats: Dict, user_stats: Dict):
+        stats["total_cache_hits"] = stats.get("total_cache_hits", 0) + 1
+        user_stats["cache_hits"] = user_stats.get("cache_hits", 0) + 1
+        user_stats["last_used"] = datetime.now().isoformat()
+
+    _update_stats(username, update)
+
+def track_coalesced(username: str):
+    """
+    Учесть запрос, присоединенный к такому же выполняющемуся анализу
+    (результат получен без отдельного обращения к LLM).
+
+    Args:
+        username: Имя пользователя
+    """
+    def update(stats: Dict, user_stats: Dict):
+        stats["total_coalesced"] = stats.get("total_coalesced", 0) + 1
+        user_stats["coalesced_requests"] = user_stats.get("coalesced_requests", 0) + 1
+        user_stats["last_used"] = datetime.now().isoformat()
+
+    _update_stats(username, update)
+
+def track_cancelled(username: str):
+    """
+    Учесть запрос, отмененный из-за отключения клиента.
+
+    Args:
+        username: Имя пользователя
+    """
+    def update(stats: Dict, user_stats: Dict):
+        stats["total_cancelled"] = stats.get("total_cancelled", 0) + 1
+        user_stats["cancelled"] = user_stats.get("cancelled", 0) + 1
 
-    write_json(TOKENS_FILE, stats)
+    _update_stats(username, update)
 
 def format_stats_for_display(stats: Dict) -> Dict:
     """
@@ -81,6 +163,10 @@ def format_stats_for_display(stats: Dict) -> Dict:
             "completion_tokens": user_stats["completion_tokens"],
             "requests_count": user_stats["requests_count"],
             "cost_usd": round(user_stats["cost_usd"], 4),
+            "saved_tokens": user_stats.get("saved_tokens", 0),
+            "cache_hits": user_stats.get("cache_hits", 0),
+            "coalesced_requests": user_stats.get("coalesced_requests", 0),
+            "cancelled": user_stats.get("cancelled", 0),
             "last_used": user_stats.get("last_used", "")
         }
 
@@ -88,6 +174,10 @@ def format_stats_for_display(stats: Dict) -> Dict:
         "total_prompt_tokens": stats.get("total_prompt_tokens", 0),
         "total_completion_tokens": stats.get("total_completion_tokens", 0),
         "total_cost_usd": round(stats.get("total_cost_usd", 0.0), 4),
+        "total_saved_tokens": stats.get("total_saved_tokens", 0),
+        "total_cache_hits": stats.get("total_cache_hits", 0),
+        "total_coalesced": stats.get("total_coalesced", 0),
+        "total_cancelled": stats.get("total_cancelled", 0),
         "users": formatted_users,
         "last_updated": stats.get("last_updated", "")
     }
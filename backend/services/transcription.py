@@ -11,9 +11,17 @@ import subprocess
 import tempfile
 import uuid
 from pathlib import Path
-from typing import Tuple, Optional, Dict, List
+from typing import Any, AsyncIterator, Tuple, Optional, Dict, List
 
-from backend.services.logger import log_error
+from fastapi import Request
+
+from backend.services.executors import run_io
+from backend.services.jobs import Job, JobEvent
+from backend.services.llm import stream_meeting_protocol, LLMStreamError
+from backend.services.logger import log_error, log_user_action
+from backend.services.queue import transcription_queue, DEFAULT_PRIORITY
+from backend.services.settings import get_max_audio_file_size_bytes
+from backend.services.uploads import ReceivedUpload, receive_upload
 
 
 # Константы
@@ -27,24 +35,41 @@ SUPPORTED_AUDIO_FORMATS = [
 ]
 
 
-def validate_audio_file(filename: str, file_size: int, max_size_mb: int) -> Tuple[bool, Optional[str]]:
+def validate_audio_format(filename: str) -> Tuple[bool, Optional[str]]:
     """
-    Валидация аудиофайла.
-    
+    Проверить формат аудиофайла по расширению.
+
+    Размер файла проверяется при приеме загрузки (см. receive_audio_upload).
+
     Returns:
         Кортеж (успех, ошибка)
     """
     ext = Path(filename).suffix.lower()
     if ext not in SUPPORTED_AUDIO_FORMATS:
         return False, f"Неподдерживаемый формат файла. Допустимы: {', '.join(SUPPORTED_AUDIO_FORMATS)}"
-    
-    max_size_bytes = max_size_mb * 1024 * 1024
-    if file_size > max_size_bytes:
-        return False, f"Размер файла превышает допустимый лимит ({max_size_mb} МБ)"
-    
+
     return True, None
 
 
+async def receive_audio_upload(request: Request) -> Tuple[Optional[ReceivedUpload], Optional[str]]:
+    """
+    Принять загружаемый аудиофайл (поле audio_file) во временный файл по частям.
+
+    Формат проверяется до приема содержимого, размер - до и во время приема.
+
+    Args:
+        request: FastAPI Request объект (тело еще не прочитано)
+
+    Returns:
+        Кортеж (загрузка, ошибка). Временный файл загрузки удаляет
+        вызывающая сторона.
+    """
+    max_size = await run_io(get_max_audio_file_size_bytes)
+    return await receive_upload(
+        request, "audio_file", lambda filename: validate_audio_format(filename)[1], max_size
+    )
+
+
 def format_transcription(segments: List[Dict]) -> str:
     """
     Форматирование сегментов транскрипции в читаемый текст.
@@ -96,15 +121,16 @@ async def transcribe_audio(file_path: Path) -> Tuple[Optional[str], Optional[str
             "--output", str(output_json)
         ]
         
-        # Используем синхронный subprocess.run в отдельном потоке (работает надёжно на Windows)
-        def run_subprocess():
-            return subprocess.run(
-                cmd,
-                capture_output=True,
-                text=False
-            )
-        
-        result = await asyncio.to_thread(run_subprocess)
+        # Ждем процесс в отдельном потоке (работает надёжно на Windows,
+        # где у event loop может не быть поддержки subprocess)
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            stdout, stderr = await asyncio.to_thread(process.communicate)
+        except asyncio.CancelledError:
+            # Клиент отключился - остановить транскрибацию
+            process.kill()
+            raise
+        result = subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
         
         # Проверка кода возврата процесса
         if result.returncode != 0:
@@ -142,3 +168,101 @@ async def transcribe_audio(file_path: Path) -> Tuple[Optional[str], Optional[str
             except OSError:
                 pass
 
+
+
+async def transcribe_in_queue(file_path: Path, username: str, priority: str = DEFAULT_PRIORITY) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Транскрибировать аудиофайл, заняв слот в очереди транскрибации.
+
+    У транскрибации своя очередь (transcription_queue) с отдельными
+    лимитами: процессы транскрибации не занимают слоты анализа договоров,
+    а их количество ограничено. Слот освобождается сразу после
+    транскрибации - протокол генерируется уже без него.
+
+    Args:
+        file_path: Путь к аудиофайлу
+        username: Имя пользователя
+        priority: Класс приоритета в очереди
+
+    Yields:
+        ("queued", ожидание слота в transcription_queue),
+        ("status", сообщение об этапе) и последним
+        ("result", (транскрипция, ошибка))
+    """
+    queue_result = await transcription_queue.acquire(username, priority)
+    if not queue_result["allowed"]:
+        yield "result", (None, queue_result.get("error", "Система перегружена. Попробуйте позже."))
+        return
+
+    waiter = queue_result["waiter"]
+    has_slot = not queue_result.get("queued")
+    try:
+        if not has_slot:
+            yield "queued", waiter
+            yield "status", f"{queue_result['message']} Позиция: {queue_result['position']}."
+            await transcription_queue.wait_for_slot(waiter)
+            has_slot = True
+
+        yield "status", "Транскрибация аудио..."
+        result = await transcribe_audio(file_path)
+    finally:
+        if has_slot:
+            await transcription_queue.release(waiter)
+    yield "result", result
+
+
+async def transcription_job_events(job: Job, tmp_path: Path, priority: str = DEFAULT_PRIORITY) -> AsyncIterator[JobEvent]:
+    """
+    Выполнить транскрибацию и генерацию протокола как фоновую задачу.
+
+    Args:
+        job: Задача (см. backend.services.jobs)
+        tmp_path: Временный аудиофайл (удаляется)
+        priority: Класс приоритета в очереди транскрибации
+
+    Yields:
+        События задачи: status, transcription {"text"}, delta {"text"}, done, error
+    """
+    try:
+        transcription, trans_error = None, None
+        async for kind, payload in transcribe_in_queue(tmp_path, job.username, priority):
+            if kind == "queued":
+                waiter = payload
+                job.queue_position = lambda: transcription_queue.get_position(waiter)
+            elif kind == "status":
+                waiting = job.queue_position is not None and job.queue_position() is not None
+                yield "status", {"status": "queued" if waiting else "running", "stage": payload}
+            else:
+                transcription, trans_error = payload
+        if trans_error:
+            log_error(job.username, "transcription", trans_error)
+            yield "error", {"error": trans_error}
+            return
+
+        yield "transcription", {"text": transcription}
+        yield "status", {"status": "running", "stage": "Формирование протокола"}
+
+        protocol = ""
+        proto_error = None
+        try:
+            async for delta in stream_meeting_protocol(transcription, job.username):
+                protocol += delta
+                yield "delta", {"text": delta}
+        except LLMStreamError as e:
+            log_error(job.username, "protocol_generation", str(e))
+            # Транскрипция остается результатом задачи
+            proto_error = f"Протокол не сгенерирован: {e}"
+
+        log_user_action(job.username, "transcribe", f"Файл: {job.filename} (задача {job.id})")
+        yield "done", {"result": {
+            "transcription": transcription,
+            "protocol": None if proto_error else protocol,
+            "error": proto_error
+        }}
+
+    finally:
+        if tmp_path.exists():
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
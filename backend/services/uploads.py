@@ -0,0 +1,243 @@
+"""
+Потоковый прием загружаемых файлов на диск.
+
+Тело multipart-запроса разбирается по мере поступления (request.stream()),
+а не формой Starlette, которая сначала принимает весь запрос в свой
+временный файл: содержимое загружаемого файла сразу пишется во временный
+файл, и именно он передается дальше (извлечению текста, транскрибации).
+
+Лимит размера проверяется до чтения тела - по заголовку Content-Length, -
+и затем по мере чтения: загрузка без Content-Length (или с неверным)
+прерывается, как только файл превысил лимит. Попутно считается SHA-256
+содержимого (ключ для кэшей).
+"""
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi import Request
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import ClientDisconnect
+
+from backend.services.executors import run_io
+
+# Размер части при записи загрузки на диск (1 МБ)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Запас размера запроса сверх лимита файла: заголовки частей и поля формы
+UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024
+
+# Максимальный размер текстового поля формы
+MAX_FORM_FIELD_BYTES = 64 * 1024
+
+
+class ReceivedUpload:
+    """Загруженный файл во временном файле на диске и поля формы."""
+
+    def __init__(self, filename: str, path: Path, sha256: str, fields: Dict[str, str]):
+        self.filename = filename
+        self.path = path
+        self.sha256 = sha256
+        self.fields = fields
+
+    def remove(self):
+        """Удалить временный файл."""
+        _remove_quietly(self.path)
+
+
+def check_upload_size(size: int, max_size: int) -> Optional[str]:
+    """
+    Проверить размер загружаемого файла.
+
+    Args:
+        size: Размер файла (или уже прочитанной части) в байтах
+        max_size: Максимальный размер файла в байтах
+
+    Returns:
+        Текст ошибки или None, если размер допустим
+    """
+    if size > max_size:
+        max_size_mb = max_size // (1024 * 1024)
+        return f"Размер файла превышает допустимый лимит ({max_size_mb} МБ)."
+    return None
+
+
+async def receive_upload(
+    request: Request,
+    file_field: str,
+    check_filename: Callable[[str], Optional[str]],
+    max_size: int
+) -> Tuple[Optional[ReceivedUpload], Optional[str]]:
+    """
+    Принять multipart-запрос с файлом, записывая файл во временный файл по частям.
+
+    Args:
+        request: FastAPI Request объект (тело еще не прочитано)
+        file_field: Имя поля формы с файлом
+        check_filename: Проверка имени файла (формата); возвращает текст
+            ошибки или None. Вызывается до приема содержимого файла
+        max_size: Максимальный размер файла в байтах
+
+    Returns:
+        Кортеж (загрузка, ошибка). Если успешно - (загрузка, None),
+        если ошибка - (None, текст_ошибки). Временный файл загрузки
+        (расширение - как у исходного файла) удаляет вызывающая сторона.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        return None, "Ожидается загрузка файла (multipart/form-data)."
+
+    # Заведомо большой запрос отклоняется, не читая тело
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > max_size + UPLOAD_FORM_OVERHEAD_BYTES:
+        return None, check_upload_size(int(content_length), max_size)
+
+    form = _FormReader(file_field)
+    parser = MultipartParser(boundary, form.callbacks())
+    digest = hashlib.sha256()
+    tmp_path: Optional[Path] = None
+    tmp_file = None
+    received = False
+
+    try:
+        async for chunk in request.stream():
+            try:
+                parser.write(chunk)
+            except MultipartParseError:
+                return None, "Некорректный запрос загрузки файла."
+            if form.error:
+                return None, form.error
+
+            if form.filename is not None and tmp_file is None:
+                if not form.filename:
+                    return None, "Файл не выбран."
+                format_error = check_filename(form.filename)
+                if format_error:
+                    return None, format_error
+                tmp_fd, tmp_name = tempfile.mkstemp(suffix=Path(form.filename).suffix.lower())
+                tmp_path = Path(tmp_name)
+                tmp_file = os.fdopen(tmp_fd, "wb")
+
+            size_error = check_upload_size(form.file_size, max_size)
+            if size_error:
+                return None, size_error
+
+            # Писать на диск частями не меньше UPLOAD_CHUNK_SIZE
+            if len(form.file_data) >= UPLOAD_CHUNK_SIZE or (form.complete and form.file_data):
+                data = bytes(form.file_data)
+                form.file_data.clear()
+                await run_io(tmp_file.write, data)
+                digest.update(data)
+
+        if not form.complete:
+            return None, "Загрузка файла прервана."
+        if tmp_file is None:
+            return None, "Файл не выбран."
+
+        await run_io(tmp_file.close)
+        received = True
+        return ReceivedUpload(form.filename, tmp_path, digest.hexdigest(), form.fields), None
+
+    except ClientDisconnect:
+        return None, "Загрузка файла прервана."
+
+    finally:
+        if not received:
+            if tmp_file is not None:
+                tmp_file.close()
+            if tmp_path is not None:
+                _remove_quietly(tmp_path)
+
+
+class _FormReader:
+    """Обработчики событий MultipartParser: поля формы и данные файла."""
+
+    def __init__(self, file_field: str):
+        self.file_field = file_field
+        self.fields: Dict[str, str] = {}
+        # Имя файла (None - часть с файлом еще не встретилась)
+        self.filename: Optional[str] = None
+        # Принятые и еще не записанные данные файла, размер всех принятых
+        self.file_data = bytearray()
+        self.file_size = 0
+        self.error: Optional[str] = None
+        self.complete = False
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        # Текущая часть: "file", "field" или None (пропускается)
+        self._part: Optional[str] = None
+        self._name = ""
+        self._value = bytearray()
+
+    def callbacks(self) -> Dict:
+        """Обработчики для MultipartParser."""
+        return {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_end": self._on_end,
+        }
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._part = None
+        self._value = bytearray()
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field.clear()
+        self._header_value.clear()
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._name = options.get(b"name", b"").decode("utf-8", "replace")
+        if b"filename" not in options:
+            self._part = "field"
+        elif self._name == self.file_field:
+            if self.filename is not None:
+                self.error = "Ожидается один файл."
+                return
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+            self._part = "file"
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._part == "file":
+            self.file_data += data[start:end]
+            self.file_size += end - start
+        elif self._part == "field":
+            self._value += data[start:end]
+            if len(self._value) > MAX_FORM_FIELD_BYTES:
+                self.error = "Слишком большое поле формы."
+                self._part = None
+
+    def _on_part_end(self):
+        if self._part == "field":
+            self.fields[self._name] = self._value.decode("utf-8", "replace")
+
+    def _on_end(self):
+        self.complete = True
+
+
+def _remove_quietly(path: Path):
+    """Удалить файл, игнорируя ошибки."""
+    try:
+        if path.exists():
+            path.unlink()
+    except OSError:
+        pass
@@ -63,6 +63,8 @@ function showTab(tabName) {
             break;
         case 'stats':
             loadTokenStats();
+            loadCacheStats();
+            loadExecutorStats();
             break;
         case 'logs':
             loadLogs();
@@ -392,6 +394,11 @@ function renderLLMConfig(config) {
                 <input type="text" id="lmstudio-model" value="${config.lmstudio_model || 'deepseek-coder'}">
             </div>
 
+            <div class="form-group">
+                <label>LM Studio: контекстное окно (токенов):</label>
+                <input type="number" id="lmstudio-context-window" value="${config.lmstudio_context_window || 32768}" min="1024">
+            </div>
+
             <button type="submit" class="btn btn-success">Сохранить настройки</button>
         </form>
     `;
@@ -413,7 +420,8 @@ async function saveLLMConfig() {
         llm_type: document.getElementById('llm-type').value,
         deepseek_api_key: document.getElementById('deepseek-api-key').value,
         lmstudio_base_url: document.getElementById('lmstudio-url').value,
-        lmstudio_model: document.getElementById('lmstudio-model').value
+        lmstudio_model: document.getElementById('lmstudio-model').value,
+        lmstudio_context_window: parseInt(document.getElementById('lmstudio-context-window').value)
     };
 
     try {
@@ -477,11 +485,107 @@ function renderSettings(settings) {
                 <input type="number" id="max-queue" value="${settings.max_queue_size || 5}" min="1" max="20">
             </div>
 
+            <div class="form-group">
+                <label>Макс. одновременных обработок одного пользователя (0 - без ограничения):</label>
+                <input type="number" id="max-concurrent-per-user" value="${settings.max_concurrent_per_user ?? 3}" min="0" max="20">
+            </div>
+
+            <div class="form-group">
+                <label>Макс. запросов одного пользователя в очереди (0 - без ограничения):</label>
+                <input type="number" id="max-queued-per-user" value="${settings.max_queued_per_user ?? 0}" min="0" max="20">
+            </div>
+
+            <div class="form-group">
+                <label>Приоритет очереди (администраторы и интерфейс впереди пакетных):</label>
+                <select id="queue-priority-enabled">
+                    <option value="true" ${settings.queue_priority_enabled !== false ? 'selected' : ''}>Включен</option>
+                    <option value="false" ${settings.queue_priority_enabled === false ? 'selected' : ''}>Выключен</option>
+                </select>
+            </div>
+
+            <div class="form-group">
+                <label>Бюджет токенов одновременных анализов (0 - без ограничения):</label>
+                <input type="number" id="queue-token-budget" value="${settings.queue_token_budget ?? 400000}" min="0" step="10000">
+            </div>
+
+            <div class="form-group">
+                <label>Порядок очереди:</label>
+                <select id="queue-sjf">
+                    <option value="false" ${!settings.queue_shortest_job_first ? 'selected' : ''}>По очереди пользователей</option>
+                    <option value="true" ${settings.queue_shortest_job_first ? 'selected' : ''}>Сначала короткие документы</option>
+                </select>
+            </div>
+
+            <div class="form-group">
+                <label>Макс. ожидание большого документа в режиме "сначала короткие" (сек, 0 - без ограничения):</label>
+                <input type="number" id="queue-sjf-max-wait" value="${settings.queue_sjf_max_wait_seconds ?? 120}" min="0" max="3600">
+            </div>
+
+            <div class="form-group">
+                <label>Макс. одновременных транскрибаций:</label>
+                <input type="number" id="transcription-max-concurrent" value="${settings.transcription_max_concurrent || 2}" min="1" max="20">
+            </div>
+
+            <div class="form-group">
+                <label>Макс. транскрибаций в очереди:</label>
+                <input type="number" id="transcription-max-queue" value="${settings.transcription_max_queue_size ?? 5}" min="0" max="50">
+            </div>
+
+            <div class="form-group">
+                <label>Макс. одновременных транскрибаций одного пользователя (0 - без ограничения):</label>
+                <input type="number" id="transcription-max-concurrent-per-user" value="${settings.transcription_max_concurrent_per_user ?? 1}" min="0" max="20">
+            </div>
+
+            <div class="form-group">
+                <label>Макс. транскрибаций одного пользователя в очереди (0 - без ограничения):</label>
+                <input type="number" id="transcription-max-queued-per-user" value="${settings.transcription_max_queued_per_user ?? 2}" min="0" max="50">
+            </div>
+
             <div class="form-group">
                 <label>Rate limit (запросов в минуту):</label>
                 <input type="number" id="rate-limit" value="${settings.rate_limit_per_minute || 10}" min="1" max="100">
             </div>
 
+            <div class="form-group">
+                <label>Движок разбора PDF:</label>
+                <select id="pdf-engine">
+                    <option value="pypdf2" ${(settings.pdf_engine || 'pypdf2') === 'pypdf2' ? 'selected' : ''}>PyPDF2</option>
+                    <option value="pdfplumber" ${settings.pdf_engine === 'pdfplumber' ? 'selected' : ''}>pdfplumber</option>
+                    <option value="pypdfium2" ${settings.pdf_engine === 'pypdfium2' ? 'selected' : ''}>PDFium (быстрый)</option>
+                </select>
+            </div>
+
+            <div class="form-group">
+                <label>Процессов для разбора PDF (0 - последовательно):</label>
+                <input type="number" id="pdf-workers" value="${settings.pdf_extraction_workers || 0}" min="0" max="32">
+            </div>
+
+            <div class="form-group">
+                <label>Макс. страниц PDF (0 - без ограничения):</label>
+                <input type="number" id="max-pdf-pages" value="${settings.max_pdf_pages ?? 1000}" min="0" max="100000">
+            </div>
+
+            <div class="form-group">
+                <label>Распознавание сканов PDF (OCR):</label>
+                <select id="ocr-enabled">
+                    <option value="true" ${settings.ocr_enabled !== false ? 'selected' : ''}>Включено</option>
+                    <option value="false" ${settings.ocr_enabled === false ? 'selected' : ''}>Выключено</option>
+                </select>
+            </div>
+
+            <div class="form-group">
+                <label>Процессов для OCR:</label>
+                <input type="number" id="ocr-workers" value="${settings.ocr_workers || 2}" min="1" max="32">
+            </div>
+
+            <div class="form-group">
+                <label>Движок разбора .docx:</label>
+                <select id="docx-engine">
+                    <option value="stream" ${(settings.docx_engine || 'stream') === 'stream' ? 'selected' : ''}>Потоковый (быстрый)</option>
+                    <option value="python-docx" ${settings.docx_engine === 'python-docx' ? 'selected' : ''}>python-docx</option>
+                </select>
+            </div>
+
             <button type="submit" class="btn btn-success">Сохранить настройки</button>
         </form>
     `;
@@ -498,7 +602,23 @@ async function saveSettings() {
         max_audio_file_size_mb: parseInt(document.getElementById('max-audio-file-size').value),
         max_concurrent_requests: parseInt(document.getElementById('max-concurrent').value),
         max_queue_size: parseInt(document.getElementById('max-queue').value),
-        rate_limit_per_minute: parseInt(document.getElementById('rate-limit').value)
+        max_concurrent_per_user: parseInt(document.getElementById('max-concurrent-per-user').value),
+        max_queued_per_user: parseInt(document.getElementById('max-queued-per-user').value),
+        queue_priority_enabled: document.getElementById('queue-priority-enabled').value === 'true',
+        queue_token_budget: parseInt(document.getElementById('queue-token-budget').value),
+        queue_shortest_job_first: document.getElementById('queue-sjf').value === 'true',
+        queue_sjf_max_wait_seconds: parseInt(document.getElementById('queue-sjf-max-wait').value),
+        transcription_max_concurrent: parseInt(document.getElementById('transcription-max-concurrent').value),
+        transcription_max_queue_size: parseInt(document.getElementById('transcription-max-queue').value),
+        transcription_max_concurrent_per_user: parseInt(document.getElementById('transcription-max-concurrent-per-user').value),
+        transcription_max_queued_per_user: parseInt(document.getElementById('transcription-max-queued-per-user').value),
+        rate_limit_per_minute: parseInt(document.getElementById('rate-limit').value),
+        pdf_engine: document.getElementById('pdf-engine').value,
+        pdf_extraction_workers: parseInt(document.getElementById('pdf-workers').value),
+        max_pdf_pages: parseInt(document.getElementById('max-pdf-pages').value),
+        ocr_enabled: document.getElementById('ocr-enabled').value === 'true',
+        ocr_workers: parseInt(document.getElementById('ocr-workers').value),
+        docx_engine: document.getElementById('docx-engine').value
     };
 
     try {
@@ -550,6 +670,18 @@ function renderTokenStats(stats) {
                 <h4>Затраты (USD)</h4>
                 <div class="stat-value">$${stats.total_cost_usd.toFixed(4)}</div>
             </div>
+            <div class="stat-card">
+                <h4>Сэкономлено нормализацией</h4>
+                <div class="stat-value">${(stats.total_saved_tokens || 0).toLocaleString()}</div>
+            </div>
+            <div class="stat-card">
+                <h4>Ответов из кэша</h4>
+                <div class="stat-value">${(stats.total_cache_hits || 0).toLocaleString()}</div>
+            </div>
+            <div class="stat-card">
+                <h4>Отменено (клиент отключился)</h4>
+                <div class="stat-value">${(stats.total_cancelled || 0).toLocaleString()}</div>
+            </div>
             <div class="stat-card">
                 <h4>Активных пользователей</h4>
                 <div class="stat-value">${Object.keys(stats.users).length}</div>
@@ -564,6 +696,9 @@ function renderTokenStats(stats) {
                         <th>Пользователь</th>
                         <th>Токены</th>
                         <th>Затраты</th>
+                        <th>Из кэша</th>
+                        <th>Присоединено</th>
+                        <th>Отменено</th>
                         <th>Последняя активность</th>
                     </tr>
                 </thead>
@@ -573,6 +708,9 @@ function renderTokenStats(stats) {
                             <td>${username}</td>
                             <td>${(userStats.prompt_tokens + userStats.completion_tokens).toLocaleString()}</td>
                             <td>$${userStats.cost_usd.toFixed(4)}</td>
+                            <td>${(userStats.cache_hits || 0).toLocaleString()}</td>
+                            <td>${(userStats.coalesced_requests || 0).toLocaleString()}</td>
+                            <td>${(userStats.cancelled || 0).toLocaleString()}</td>
                             <td>${userStats.last_used ? new Date(userStats.last_used).toLocaleString('ru-RU') : 'Неизвестно'}</td>
                         </tr>
                     `).join('')}
@@ -582,6 +720,150 @@ function renderTokenStats(stats) {
     `;
 }
 
+// ===== СТАТИСТИКА КЭША =====
+
+async function loadCacheStats() {
+    try {
+        const response = await fetch(`${API_BASE}/api/admin/cache-stats`);
+        const data = await response.json();
+
+        if (data.success) {
+            renderCacheStats(data.stats);
+        } else {
+            showNotification('Ошибка загрузки статистики кэша', 'error');
+        }
+    } catch (error) {
+        showNotification('Ошибка сети', 'error');
+    }
+}
+
+function renderCacheStats(stats) {
+    const container = document.getElementById('cache-stats-content');
+
+    container.innerHTML = `
+        <h4>Извлечение текста</h4>
+        ${renderCacheSummary(stats.extraction)}
+        <h4>Результаты LLM</h4>
+        ${renderCacheSummary(stats.results)}
+        <h4>Одинаковые одновременные анализы</h4>
+        <div class="stats-summary">
+            <div class="stat-card">
+                <h4>Запущено</h4>
+                <div class="stat-value">${stats.shared.started.toLocaleString()}</div>
+            </div>
+            <div class="stat-card">
+                <h4>Присоединено</h4>
+                <div class="stat-value">${stats.shared.joined.toLocaleString()}</div>
+            </div>
+            <div class="stat-card">
+                <h4>Присоединено за все время</h4>
+                <div class="stat-value">${(stats.shared.coalesced_total || 0).toLocaleString()}</div>
+            </div>
+            <div class="stat-card">
+                <h4>Отменено</h4>
+                <div class="stat-value">${stats.shared.cancelled.toLocaleString()}</div>
+            </div>
+            <div class="stat-card">
+                <h4>Выполняется</h4>
+                <div class="stat-value">${stats.shared.in_flight}</div>
+            </div>
+        </div>
+    `;
+}
+
+function renderCacheSummary(cache) {
+    return `
+        <div class="stats-summary">
+            <div class="stat-card">
+                <h4>Попадания</h4>
+                <div class="stat-value">${cache.hits.toLocaleString()}</div>
+            </div>
+            <div class="stat-card">
+                <h4>Промахи</h4>
+                <div class="stat-value">${cache.misses.toLocaleString()}</div>
+            </div>
+            <div class="stat-card">
+                <h4>Доля попаданий</h4>
+                <div class="stat-value">${(cache.hit_rate * 100).toFixed(1)}%</div>
+            </div>
+            <div class="stat-card">
+                <h4>На диске</h4>
+                <div class="stat-value">${cache.disk_items} (${cache.disk_size_mb} МБ)</div>
+            </div>
+        </div>
+    `;
+}
+
+// ===== ПУЛЫ ОБРАБОТКИ =====
+
+async function loadExecutorStats() {
+    try {
+        const response = await fetch(`${API_BASE}/api/admin/executor-stats`);
+        const data = await response.json();
+
+        if (data.success) {
+            renderExecutorStats(data.stats);
+        } else {
+            showNotification('Ошибка загрузки статистики пулов', 'error');
+        }
+    } catch (error) {
+        showNotification('Ошибка сети', 'error');
+    }
+}
+
+function renderExecutorStats(stats) {
+    const container = document.getElementById('executor-stats-content');
+    const pools = [
+        { name: 'CPU (разбор, экспорт, токены)', data: stats.cpu },
+        { name: 'IO (файлы, настройки, логи)', data: stats.io }
+    ];
+
+    const rows = pools.map(pool => `
+        <tr>
+            <td>${pool.name}</td>
+            <td>${pool.data.active} / ${pool.data.max_workers}${pool.data.saturated ? ' ⚠️' : ''}</td>
+            <td>${pool.data.queued} (пик: ${pool.data.peak_queued})</td>
+            <td>${pool.data.completed.toLocaleString()}</td>
+            <td>${pool.data.avg_wait_ms} / ${pool.data.max_wait_ms}</td>
+            <td>${pool.data.avg_run_ms}</td>
+        </tr>
+    `).join('');
+
+    const sandbox = stats.extraction_sandbox;
+
+    container.innerHTML = `
+        <table class="stats-table">
+            <thead>
+                <tr>
+                    <th>Пул</th>
+                    <th>Занято</th>
+                    <th>В очереди</th>
+                    <th>Выполнено</th>
+                    <th>Ожидание, мс (сред. / макс.)</th>
+                    <th>Выполнение, мс (сред.)</th>
+                </tr>
+            </thead>
+            <tbody>
+                ${rows}
+            </tbody>
+        </table>
+        <div class="stats-summary">
+            <div class="stat-card">
+                <h4>Процессы разбора</h4>
+                <div class="stat-value">${sandbox.busy} / ${sandbox.workers} (макс. ${sandbox.max_workers})</div>
+            </div>
+            <div class="stat-card">
+                <h4>Документов разобрано</h4>
+                <div class="stat-value">${sandbox.jobs.toLocaleString()}</div>
+            </div>
+            <div class="stat-card">
+                <h4>Таймауты / падения</h4>
+                <div class="stat-value">${sandbox.timeouts} / ${sandbox.crashes}</div>
+            </div>
+        </div>
+    `;
+}
+
 // ===== ЛОГИ =====
 
 async function loadLogs(type = 'app') {
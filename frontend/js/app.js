@@ -8,6 +8,12 @@ let currentFilename = null;
 let currentTranscription = null;
 let currentProtocol = null;
 
+// Части комбинированного анализа (analysis_type = "full") и их заголовки
+const ANALYSIS_TITLES = {
+    summary: 'Детальная выжимка договора',
+    legal_check: 'Проверка на соответствие законодательству РФ'
+};
+
 // ===== ПРОВЕРКА АВТОРИЗАЦИИ =====
 
 async function checkAuth() {
@@ -199,50 +205,40 @@ async function handleTranscribe(event) {
     const audioInput = document.getElementById('audio-file');
     const errorDiv = document.getElementById('transcribe-error');
     const spinnerDiv = document.getElementById('transcribe-spinner');
+    const statusText = document.getElementById('transcribe-status');
     const resultSection = document.getElementById('transcription-result-section');
+    const protocolContent = document.getElementById('protocol-content');
     
     // Скрыть ошибки и результаты
     errorDiv.style.display = 'none';
     resultSection.style.display = 'none';
+    currentTranscription = null;
+    currentProtocol = null;
     
     // Показать спиннер
+    statusText.textContent = 'Идет транскрибация... Это может занять несколько минут.';
     spinnerDiv.style.display = 'block';
     
     const formData = new FormData();
     formData.append('audio_file', audioInput.files[0]);
     
     try {
-        const response = await fetch(`${API_BASE}/api/transcribe`, {
+        const response = await fetch(`${API_BASE}/api/jobs/transcribe`, {
             method: 'POST',
             body: formData
         });
-        
         const data = await response.json();
         
-        // Скрыть спиннер
-        spinnerDiv.style.display = 'none';
-        
-        if (data.success) {
-            currentTranscription = data.transcription;
-            currentProtocol = data.protocol;
-            
-            // Отобразить транскрипцию
-            document.getElementById('transcription-content').textContent = data.transcription || '';
-            
-            // Отобразить протокол (может быть пустым)
-            const protocolContent = document.getElementById('protocol-content');
-            if (data.protocol) {
-                protocolContent.innerHTML = marked.parse(data.protocol);
-            } else {
-                protocolContent.textContent = data.error || 'Протокол не сгенерирован';
-            }
-            
-            resultSection.style.display = 'block';
-            resultSection.scrollIntoView({ behavior: 'smooth' });
-        } else {
+        if (!data.success) {
+            // Ошибка до начала обработки (формат, размер)
+            spinnerDiv.style.display = 'none';
             errorDiv.textContent = data.error || 'Ошибка транскрибации';
             errorDiv.style.display = 'block';
+            return;
         }
+        
+        saveActiveJob(TRANSCRIPTION_JOB_KEY, { id: data.job_id });
+        await followTranscriptionJob(data.job_id);
     } catch (error) {
         spinnerDiv.style.display = 'none';
         errorDiv.textContent = 'Ошибка сети при транскрибации';
@@ -250,6 +246,85 @@ async function handleTranscribe(event) {
     }
 }
 
+async function followTranscriptionJob(jobId) {
+    const errorDiv = document.getElementById('transcribe-error');
+    const spinnerDiv = document.getElementById('transcribe-spinner');
+    const statusText = document.getElementById('transcribe-status');
+    const resultSection = document.getElementById('transcription-result-section');
+    const protocolContent = document.getElementById('protocol-content');
+    
+    spinnerDiv.style.display = 'block';
+    
+    let protocol = '';
+    let transcribed = false;
+    let finished = false;
+    const renderProtocol = createMarkdownRenderer(protocolContent);
+    
+    try {
+        const response = await fetch(`${API_BASE}/api/jobs/${jobId}/events`);
+        
+        if (!isEventStream(response)) {
+            // Задача не найдена (удалена или сервер перезапущен)
+            clearActiveJob(TRANSCRIPTION_JOB_KEY);
+            spinnerDiv.style.display = 'none';
+            return;
+        }
+        
+        await readEventStream(response, (type, data) => {
+            if (type === 'status') {
+                statusText.textContent = formatJobStage(data);
+            } else if (type === 'transcription') {
+                currentTranscription = data.text;
+                transcribed = true;
+                
+                // Отобразить транскрипцию, протокол дописывается по мере генерации
+                document.getElementById('transcription-content').textContent = data.text || '';
+                protocolContent.textContent = '';
+                resultSection.style.display = 'block';
+                resultSection.scrollIntoView({ behavior: 'smooth' });
+            } else if (type === 'delta') {
+                spinnerDiv.style.display = 'none';
+                protocol += data.text;
+                renderProtocol(protocol);
+            } else if (type === 'done') {
+                finished = true;
+                clearActiveJob(TRANSCRIPTION_JOB_KEY);
+                if (!transcribed && data.result.transcription) {
+                    // Задача другого процесса сервера: результат приходит целиком
+                    currentTranscription = data.result.transcription;
+                    protocol = data.result.protocol || '';
+                    document.getElementById('transcription-content').textContent = currentTranscription;
+                    resultSection.style.display = 'block';
+                    resultSection.scrollIntoView({ behavior: 'smooth' });
+                }
+                if (data.result.error) {
+                    // Транскрипция получена, протокол - нет
+                    protocolContent.textContent = data.result.error;
+                } else {
+                    currentProtocol = protocol;
+                    renderProtocol(protocol, true);
+                }
+            } else if (type === 'error') {
+                finished = true;
+                clearActiveJob(TRANSCRIPTION_JOB_KEY);
+                errorDiv.textContent = data.error || 'Ошибка транскрибации';
+                errorDiv.style.display = 'block';
+            }
+        });
+        
+        if (!finished) {
+            // Поток закрыт сервером до завершения задачи - подключаемся заново
+            return followTranscriptionJob(jobId);
+        }
+        spinnerDiv.style.display = 'none';
+    } catch (error) {
+        // Задача продолжается на сервере - к ней можно вернуться после перезагрузки
+        spinnerDiv.style.display = 'none';
+        errorDiv.textContent = 'Соединение прервано. Транскрибация продолжается - обновите страницу, чтобы получить результат.';
+        errorDiv.style.display = 'block';
+    }
+}
+
 
 // ===== ЭКСПОРТ ТРАНСКРИПЦИИ =====
 
@@ -437,6 +512,8 @@ async function initApp() {
             }
         });
     }
+
+    resumeActiveJobs();
 }
 
 // ===== АНАЛИЗ ДОГОВОРА =====
@@ -448,52 +525,250 @@ async function handleAnalyze(event) {
     const analysisType = document.querySelector('input[name="analysis_type"]:checked').value;
     const errorDiv = document.getElementById('error-message');
     const progressSection = document.getElementById('progress-section');
+    const progressText = document.getElementById('progress-text');
     const resultSection = document.getElementById('result-section');
 
     // Скрыть ошибки и результаты
     errorDiv.style.display = 'none';
     resultSection.style.display = 'none';
+    currentAnalysisResult = null;
 
     // Показать прогресс
+    progressText.textContent = 'Загрузка и разбор документа...';
     progressSection.style.display = 'block';
 
     const formData = new FormData();
     formData.append('file', fileInput.files[0]);
     formData.append('analysis_type', analysisType);
 
+    // Фрагменты по частям: у комбинированного анализа части идут вперемешку
+    const parts = {};
+    let started = false;
+    let finished = false;
+    const renderResult = createMarkdownRenderer(resultContent);
+    const combineParts = () => {
+        if (analysisType !== 'full') {
+            return parts[analysisType] || '';
+        }
+        return Object.entries(ANALYSIS_TITLES)
+            .map(([part, title]) => `# ${title}\n\n${parts[part] || '_Формируется..._'}`)
+            .join('\n\n');
+    };
+
     try {
-        const response = await fetch(`${API_BASE}/api/analyze`, {
+        const response = await fetch(`${API_BASE}/api/jobs/analyze`, {
             method: 'POST',
             body: formData
         });
-
         const data = await response.json();
 
-        // Скрыть прогресс
+        if (!data.success) {
+            // Ошибка до начала анализа (формат, размер)
+            progressSection.style.display = 'none';
+            errorDiv.textContent = data.error || 'Ошибка при анализе документа';
+            errorDiv.style.display = 'block';
+            return;
+        }
+
+        saveActiveJob(ANALYSIS_JOB_KEY, { id: data.job_id, analysisType: analysisType });
+        await followAnalysisJob(data.job_id, analysisType);
+    } catch (error) {
         progressSection.style.display = 'none';
+        errorDiv.textContent = 'Ошибка при анализе документа';
+        errorDiv.style.display = 'block';
+    }
+}
 
-        if (data.success) {
-            currentAnalysisResult = data.result;
-            currentFilename = data.filename;
+async function followAnalysisJob(jobId, analysisType) {
+    const errorDiv = document.getElementById('error-message');
+    const progressSection = document.getElementById('progress-section');
+    const progressText = document.getElementById('progress-text');
+    const resultSection = document.getElementById('result-section');
+    const resultContent = document.getElementById('result-content');
 
-            // Отобразить результат
-            const resultContent = document.getElementById('result-content');
-            resultContent.innerHTML = marked.parse(data.result);
-            resultSection.style.display = 'block';
+    progressSection.style.display = 'block';
 
-            // Прокрутить к результатам
-            resultSection.scrollIntoView({ behavior: 'smooth' });
-        } else {
-            errorDiv.textContent = data.error;
-            errorDiv.style.display = 'block';
+    // Фрагменты по частям: у комбинированного анализа части идут вперемешку
+    const parts = {};
+    let started = false;
+    let finished = false;
+    const renderResult = createMarkdownRenderer(resultContent);
+    const combineParts = () => {
+        if (analysisType !== 'full') {
+            return parts[analysisType] || '';
+        }
+        return Object.entries(ANALYSIS_TITLES)
+            .map(([part, title]) => `# ${title}\n\n${parts[part] || '_Формируется..._'}`)
+            .join('\n\n');
+    };
+
+    try {
+        const response = await fetch(`${API_BASE}/api/jobs/${jobId}/events`);
+
+        if (!isEventStream(response)) {
+            // Задача не найдена (удалена или сервер перезапущен)
+            clearActiveJob(ANALYSIS_JOB_KEY);
+            progressSection.style.display = 'none';
+            return;
+        }
+
+        await readEventStream(response, (type, data) => {
+            if (type === 'status') {
+                progressText.textContent = formatJobStage(data);
+            } else if (type === 'delta') {
+                if (!started) {
+                    // Первый фрагмент - показываем результат, дальше он дописывается
+                    started = true;
+                    progressSection.style.display = 'none';
+                    resultContent.innerHTML = '';
+                    resultSection.style.display = 'block';
+                    resultSection.scrollIntoView({ behavior: 'smooth' });
+                }
+                const part = data.part || analysisType;
+                parts[part] = (parts[part] || '') + data.text;
+                renderResult(combineParts());
+            } else if (type === 'done') {
+                finished = true;
+                clearActiveJob(ANALYSIS_JOB_KEY);
+                if (!started) {
+                    // Задача другого процесса сервера: фрагментов не было,
+                    // результат приходит целиком
+                    progressSection.style.display = 'none';
+                    resultSection.style.display = 'block';
+                    resultSection.scrollIntoView({ behavior: 'smooth' });
+                }
+                currentAnalysisResult = started ? combineParts() : (data.result.result || '');
+                currentFilename = data.result.filename;
+                renderResult(currentAnalysisResult, true);
+            } else if (type === 'error') {
+                finished = true;
+                clearActiveJob(ANALYSIS_JOB_KEY);
+                errorDiv.textContent = data.error;
+                errorDiv.style.display = 'block';
+            }
+        });
+
+        if (!finished) {
+            // Поток закрыт сервером до завершения задачи - подключаемся заново
+            return followAnalysisJob(jobId, analysisType);
         }
+        progressSection.style.display = 'none';
     } catch (error) {
+        // Соединение прервано - задача продолжается на сервере,
+        // к ней можно вернуться, перезагрузив страницу
         progressSection.style.display = 'none';
-        errorDiv.textContent = 'Ошибка при анализе документа';
+        errorDiv.textContent = 'Соединение прервано. Анализ продолжается - обновите страницу, чтобы получить результат.';
         errorDiv.style.display = 'block';
     }
 }
 
+// ===== ФОНОВЫЕ ЗАДАЧИ =====
+
+// Ключи localStorage с задачами, к которым страница подключается после перезагрузки
+const ANALYSIS_JOB_KEY = 'activeAnalysisJob';
+const TRANSCRIPTION_JOB_KEY = 'activeTranscriptionJob';
+
+function saveActiveJob(key, job) {
+    localStorage.setItem(key, JSON.stringify(job));
+}
+
+function loadActiveJob(key) {
+    try {
+        return JSON.parse(localStorage.getItem(key));
+    } catch (error) {
+        return null;
+    }
+}
+
+function clearActiveJob(key) {
+    localStorage.removeItem(key);
+}
+
+function formatJobStage(data) {
+    if (data.status === 'queued' && data.queue_position) {
+        return `Запрос в очереди. Позиция: ${data.queue_position}.`;
+    }
+    return data.stage;
+}
+
+async function resumeActiveJobs() {
+    // Подключиться к задачам, запущенным до перезагрузки страницы
+    const analysisJob = loadActiveJob(ANALYSIS_JOB_KEY);
+    if (analysisJob) {
+        followAnalysisJob(analysisJob.id, analysisJob.analysisType);
+    }
+
+    const transcriptionJob = loadActiveJob(TRANSCRIPTION_JOB_KEY);
+    if (transcriptionJob) {
+        followTranscriptionJob(transcriptionJob.id);
+    }
+}
+
+// ===== ПОТОКОВЫЕ ОТВЕТЫ (SSE) =====
+
+function isEventStream(response) {
+    const contentType = response.headers.get('Content-Type') || '';
+    return contentType.includes('text/event-stream');
+}
+
+async function readEventStream(response, onEvent) {
+    // EventSource не умеет POST с файлом, поэтому поток читается через fetch
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+
+        // События разделены пустой строкой
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let type = 'message';
+            let data = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    type = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    data += line.slice(5).trim();
+                }
+            });
+
+            if (data) {
+                onEvent(type, JSON.parse(data));
+            }
+        }
+    }
+}
+
+function createMarkdownRenderer(container) {
+    // Markdown перерисовывается не чаще раза за кадр, а не на каждый фрагмент
+    let pending = null;
+    let scheduled = false;
+
+    return function render(text, immediate = false) {
+        pending = text;
+        if (immediate) {
+            container.innerHTML = marked.parse(pending);
+            return;
+        }
+        if (scheduled) {
+            return;
+        }
+        scheduled = true;
+        requestAnimationFrame(() => {
+            scheduled = false;
+            container.innerHTML = marked.parse(pending);
+        });
+    };
+}
+
 // ===== ЭКСПОРТ В WORD =====
 
 async function exportToWord() {
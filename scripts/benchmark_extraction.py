@@ -0,0 +1,172 @@
+"""
+Бенчмарк движков извлечения текста из документов.
+
+Сравнивает скорость движков на наборе файлов и показывает, совпадает ли
+извлеченный текст. Для PDF выводится скорость в страницах в секунду и
+совпадение кириллических слов с первым движком (PyPDF2) - движок, который
+теряет или искажает кириллицу, сразу виден по низкому проценту.
+
+Использование:
+    python scripts/benchmark_extraction.py файл.docx договор.pdf папка_с_договорами/ ...
+    python scripts/benchmark_extraction.py --generate-docx 2000
+
+--generate-docx N создает синтетическое приложение-спецификацию с таблицей
+на N строк (с объединенными ячейками) и замеряет движки на нем.
+"""
+
+import argparse
+import re
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+# Добавить корневую директорию в путь
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backend.services.document import extract_from_docx_stream, extract_from_docx_python_docx
+from backend.services.pdf_engines import PDF_ENGINES, get_pdf_engine
+
+CYRILLIC_WORD_RE = re.compile(r"[А-Яа-яЁё]+")
+
+
+def pdf_extractor(engine_name: str):
+    """Функция извлечения всех страниц PDF заданным движком (без пула процессов)."""
+    def extract(file_path: Path):
+        with get_pdf_engine(engine_name).open(file_path) as document:
+            pages = [document.extract_page(index) for index in range(document.page_count)]
+        return "\n\n".join(pages), None
+    return extract
+
+
+# Движки по расширению файла: имя -> функция извлечения
+ENGINES = {
+    ".docx": {
+        "python-docx": extract_from_docx_python_docx,
+        "stream": extract_from_docx_stream,
+    },
+    ".pdf": {name: pdf_extractor(name) for name in PDF_ENGINES},
+}
+
+
+def count_pages(file_path: Path) -> int:
+    """Количество страниц PDF (для остальных форматов - 0)."""
+    if file_path.suffix.lower() != ".pdf":
+        return 0
+    with get_pdf_engine("pypdfium2").open(file_path) as document:
+        return document.page_count
+
+
+def cyrillic_parity(text: str, baseline_text: str) -> float:
+    """Доля совпадающих кириллических слов (с учетом повторов) относительно эталона."""
+    words = Counter(word.lower() for word in CYRILLIC_WORD_RE.findall(text))
+    baseline = Counter(word.lower() for word in CYRILLIC_WORD_RE.findall(baseline_text))
+    union = sum((words | baseline).values())
+    if not union:
+        return 1.0
+    return sum((words & baseline).values()) / union
+
+
+def generate_specification_docx(rows: int, target: Path):
+    """Создать .docx со спецификацией на rows строк."""
+    from docx import Document
+
+    doc = Document()
+    doc.add_heading("Приложение №1 к договору поставки", level=1)
+    doc.add_paragraph("Спецификация поставляемого оборудования и материалов.")
+
+    table = doc.add_table(rows=rows + 1, cols=6)
+    header = ["№", "Наименование", "Ед. изм.", "Кол-во", "Цена, руб.", "Сумма, руб."]
+    for col, title in enumerate(header):
+        table.rows[0].cells[col].text = title
+
+    for row_index in range(1, rows + 1):
+        cells = table.rows[row_index].cells
+        cells[0].text = str(row_index)
+        cells[1].text = f"Кабель силовой ВВГнг-LS 3x{row_index % 50 + 1} мм², партия {row_index}"
+        cells[2].text = "м"
+        cells[3].text = str(row_index * 10)
+        cells[4].text = f"{row_index * 12.5:.2f}"
+        cells[5].text = f"{row_index * 125:.2f}"
+        # Каждая десятая строка - раздел с объединением по всей ширине
+        if row_index % 10 == 0:
+            merged = cells[0].merge(cells[5])
+            merged.text = f"Раздел {row_index // 10}: итого по разделу"
+
+    doc.add_paragraph("Подписи сторон: Поставщик ____________ Покупатель ____________")
+    doc.save(str(target))
+
+
+def collect_files(paths):
+    """Собрать файлы поддерживаемых форматов из путей (файлов и папок)."""
+    files = []
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            files.extend(sorted(p for p in path.rglob("*") if p.suffix.lower() in ENGINES))
+        elif path.suffix.lower() in ENGINES:
+            files.append(path)
+    return files
+
+
+def benchmark_file(file_path: Path, repeat: int):
+    """Замерить все движки для одного файла."""
+    engines = ENGINES[file_path.suffix.lower()]
+    results = {}
+
+    for name, extract in engines.items():
+        best = None
+        text = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            text, error = extract(file_path)
+            elapsed = time.perf_counter() - start
+            if error:
+                text = f"ОШИБКА: {error}"
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = (best, text or "")
+
+    pages = count_pages(file_path)
+    pages_info = f", {pages} стр." if pages else ""
+    print(f"\n{file_path.name} ({file_path.stat().st_size / 1024:.0f} КБ{pages_info})")
+    baseline_name = next(iter(results))
+    baseline_time, baseline_text = results[baseline_name]
+    for name, (elapsed, text) in results.items():
+        speedup = baseline_time / elapsed if elapsed else 0.0
+        same = "совпадает" if text == baseline_text else f"отличается ({len(text)} vs {len(baseline_text)} символов)"
+        line = f"  {name:<12} {elapsed * 1000:9.1f} мс  x{speedup:5.1f}"
+        if pages:
+            pages_per_second = pages / elapsed if elapsed else 0.0
+            line += f"  {pages_per_second:7.1f} стр/с  кириллица: {cyrillic_parity(text, baseline_text) * 100:5.1f}%"
+        print(f"{line}  текст: {same}")
+
+
+def main():
+    """Точка входа."""
+    parser = argparse.ArgumentParser(description="Бенчмарк движков извлечения текста")
+    parser.add_argument("paths", nargs="*", help="Файлы или папки с документами")
+    parser.add_argument("--generate-docx", type=int, default=0, metavar="N",
+                        help="Сгенерировать .docx со спецификацией на N строк")
+    parser.add_argument("--repeat", type=int, default=3, help="Количество повторов (берется лучший)")
+    args = parser.parse_args()
+
+    files = collect_files(args.paths)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.generate_docx:
+            generated = Path(tmp_dir) / f"specification_{args.generate_docx}.docx"
+            print(f"Генерация спецификации на {args.generate_docx} строк...")
+            generate_specification_docx(args.generate_docx, generated)
+            files.append(generated)
+
+        if not files:
+            parser.error("Не заданы файлы для бенчмарка")
+
+        for file_path in files:
+            benchmark_file(file_path, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -66,7 +66,8 @@ def init_llm_config():
         "deepseek_api_key": "",
         "deepseek_base_url": "https://api.deepseek.com",
         "lmstudio_base_url": "http://localhost:1234/v1",
-        "lmstudio_model": "deepseek-coder"
+        "lmstudio_model": "deepseek-coder",
+        "lmstudio_context_window": 32768
     }
     write_json(config_file, data)
     print("OK: Конфигурация создана")
@@ -106,6 +107,30 @@ def init_tokens_stats():
     write_json(tokens_file, data)
     print("OK: Файл создан")
 
+def init_tokenizers():
+    """Скачать токенизаторы моделей для точного подсчета токенов."""
+    import urllib.request
+    from backend.services.token_counter import TOKENIZERS_DIR, TOKENIZER_URLS
+
+    TOKENIZERS_DIR.mkdir(parents=True, exist_ok=True)
+    for model, url in TOKENIZER_URLS.items():
+        tokenizer_file = TOKENIZERS_DIR / f"{model}.json"
+        if tokenizer_file.exists():
+            print(f"SKIP: Токенизатор {model} уже загружен, пропускаем")
+            continue
+
+        print(f"Загрузка токенизатора {model}...")
+        temp_file = tokenizer_file.with_suffix(".tmp")
+        try:
+            with urllib.request.urlopen(url, timeout=60) as response, open(temp_file, "wb") as f:
+                f.write(response.read())
+            temp_file.replace(tokenizer_file)
+            print(f"OK: Токенизатор сохранен в {tokenizer_file}")
+        except Exception as e:
+            temp_file.unlink(missing_ok=True)
+            print(f"WARN: Не удалось загрузить токенизатор {model} ({e}). "
+                  f"Скачайте {url} в {tokenizer_file} вручную; до этого токены оцениваются по символам")
+
 def main():
     """Основная функция инициализации."""
     print("=" * 50)
@@ -118,6 +143,7 @@ def main():
     init_llm_config()
     init_settings()
     init_tokens_stats()
+    init_tokenizers()
 
     print("\n" + "=" * 50)
     print("ИНИЦИАЛИЗАЦИЯ ЗАВЕРШЕНА")
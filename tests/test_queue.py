@@ -0,0 +1,35 @@
+import asyncio
+
+from backend.services import queue, settings
+from backend.services.json_utils import write_json
+from backend.services.shared_state import SharedState
+
+
+def test_token_budget_applies_when_setting_is_missing(tmp_path, monkeypatch):
+    # settings.json в том виде, как его создает scripts/init_data.py
+    settings_file = tmp_path / "settings.json"
+    write_json(settings_file, {
+        "max_file_size_mb": 50,
+        "max_queue_size": 5,
+        "max_concurrent_requests": 5,
+        "rate_limit_per_minute": 10
+    })
+    monkeypatch.setattr(settings, "SETTINGS_FILE", settings_file)
+    monkeypatch.setattr(queue, "shared_state", SharedState(tmp_path / "shared_state.db"))
+
+    async def admit_two_large_requests():
+        request_queue = queue.RequestQueue("test")
+        first = await request_queue.acquire("a", cost=300000)
+        second = await request_queue.acquire("b", cost=300000)
+        budget = request_queue._token_budget
+        await request_queue.release(first["waiter"])
+        await request_queue.wait_for_slot(second["waiter"])
+        await request_queue.release(second["waiter"])
+        return budget, first, second
+
+    budget, first, second = asyncio.run(admit_two_large_requests())
+
+    assert budget == settings.DEFAULT_SETTINGS["queue_token_budget"] == 400000
+    assert not first["queued"]
+    # Вместе запросы превышают бюджет - второй ждет освобождения первого
+    assert second["queued"]
@@ -0,0 +1,49 @@
+import sqlite3
+import time
+
+from backend.services import shared_state
+from backend.services.shared_state import SharedState, SQLiteStorage
+
+
+def make_storages(tmp_path, monkeypatch, count):
+    monkeypatch.setattr(shared_state, "shared_state", SharedState(tmp_path / "shared_state.db"))
+    return [SQLiteStorage("sqlite://") for _ in range(count)]
+
+
+def test_counters_are_shared_between_processes(tmp_path, monkeypatch):
+    # Два хранилища - как в двух процессах сервера с общей базой
+    first, second = make_storages(tmp_path, monkeypatch, 2)
+
+    assert first.incr("ip", 60) == 1
+    assert first.incr("ip", 60) == 2
+    assert second.incr("ip", 60) == 1
+
+    first.sync()
+    second.sync()
+    first.sync()
+
+    assert first.get("ip") == 3
+    assert second.get("ip") == 3
+    assert second.incr("ip", 60) == 4
+
+
+def test_incr_does_not_wait_for_locked_database(tmp_path, monkeypatch):
+    (storage,) = make_storages(tmp_path, monkeypatch, 1)
+    storage.incr("ip", 60)
+    storage.sync()
+
+    # Другой процесс держит блокировку записи
+    conn = sqlite3.connect(str(tmp_path / "shared_state.db"), isolation_level=None)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        started = time.monotonic()
+        counts = [storage.incr("ip", 60) for _ in range(10)]
+        assert time.monotonic() - started < 0.1
+        # Лимит по-прежнему считается по запросам процесса
+        assert counts[-1] == 11
+    finally:
+        conn.execute("ROLLBACK")
+        conn.close()
+
+    storage.sync()
+    assert storage.get("ip") == 11
@@ -0,0 +1,46 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from backend.services import tokens
+from backend.services.executors import run_io
+
+
+def test_concurrent_tracking_keeps_every_update(tmp_path, monkeypatch):
+    monkeypatch.setattr(tokens, "TOKENS_FILE", tmp_path / "tokens_usage.json")
+
+    async def track_many():
+        await asyncio.gather(
+            *(run_io(tokens.track_tokens, "u", 100, 10) for _ in range(200)),
+            *(run_io(tokens.track_cache_hit, "u") for _ in range(50)),
+            *(run_io(tokens.track_cancelled, "v") for _ in range(50))
+        )
+
+    asyncio.run(track_many())
+
+    stats = tokens.get_tokens_stats()
+    assert stats["users"]["u"]["requests_count"] == 200
+    assert stats["users"]["u"]["prompt_tokens"] == 200 * 100
+    assert stats["users"]["u"]["cache_hits"] == 50
+    assert stats["users"]["v"]["cancelled"] == 50
+    assert stats["total_completion_tokens"] == 200 * 10
+    assert stats["total_cache_hits"] == 50
+
+
+def _track_in_process(tokens_file, count):
+    tokens.TOKENS_FILE = tokens_file
+    for _ in range(count):
+        tokens.track_tokens("u", 100, 10)
+
+
+def test_tracking_from_several_processes_keeps_every_update(tmp_path, monkeypatch):
+    tokens_file = tmp_path / "tokens_usage.json"
+    monkeypatch.setattr(tokens, "TOKENS_FILE", tokens_file)
+
+    # Как процессы uvicorn --workers N: у каждого своя память
+    with ProcessPoolExecutor(4, mp_context=multiprocessing.get_context("spawn")) as pool:
+        list(pool.map(_track_in_process, [tokens_file] * 4, [50] * 4))
+
+    stats = tokens.get_tokens_stats()
+    assert stats["users"]["u"]["requests_count"] == 4 * 50
+    assert stats["total_prompt_tokens"] == 4 * 50 * 100
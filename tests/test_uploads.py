@@ -0,0 +1,83 @@
+import hashlib
+from pathlib import Path
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from backend.services.uploads import receive_upload
+
+MAX_SIZE = 1024 * 1024
+
+
+def make_client() -> TestClient:
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        def check_filename(filename):
+            return None if filename.endswith(".pdf") else "Неподдерживаемый формат файла."
+
+        upload, error = await receive_upload(request, "file", check_filename, MAX_SIZE)
+        if error:
+            return {"error": error}
+        data = upload.path.read_bytes()
+        upload.remove()
+        return {
+            "filename": upload.filename,
+            "path": str(upload.path),
+            "sha256": upload.sha256,
+            "fields": upload.fields,
+            "content": data.decode()
+        }
+
+    return TestClient(app)
+
+
+def test_file_and_fields_are_received_to_disk():
+    content = b"%PDF-1.4 " * 1000
+    response = make_client().post(
+        "/upload", data={"analysis_type": "summary"}, files={"file": ("dogovor.pdf", content)}
+    ).json()
+
+    assert response["filename"] == "dogovor.pdf"
+    assert response["fields"] == {"analysis_type": "summary"}
+    assert response["content"] == content.decode()
+    assert response["sha256"] == hashlib.sha256(content).hexdigest()
+    assert response["path"].endswith(".pdf")
+    assert not Path(response["path"]).exists()
+
+
+def test_oversized_content_length_is_rejected_before_reading_body():
+    response = make_client().post(
+        "/upload", content=b"",
+        headers={
+            "Content-Type": "multipart/form-data; boundary=x",
+            "Content-Length": str(10 * MAX_SIZE)
+        }
+    ).json()
+
+    assert "превышает допустимый лимит" in response["error"]
+
+
+def test_oversized_chunked_upload_is_aborted(tmp_path, monkeypatch):
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+
+    def body():
+        yield b'--x\r\nContent-Disposition: form-data; name="file"; filename="big.pdf"\r\n\r\n'
+        for _ in range(100):
+            yield b"0" * (64 * 1024)
+        yield b"\r\n--x--\r\n"
+
+    # Тело без Content-Length (chunked): лимит проверяется по мере чтения
+    response = make_client().post(
+        "/upload", content=body(), headers={"Content-Type": "multipart/form-data; boundary=x"}
+    ).json()
+
+    assert "превышает допустимый лимит" in response["error"]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_unsupported_format_is_rejected():
+    response = make_client().post("/upload", files={"file": ("song.exe", b"MZ")}).json()
+
+    assert response["error"] == "Неподдерживаемый формат файла."